@@ -0,0 +1,282 @@
+
+'''Measures the overhead of the Process primitives and of some plugins.
+
+A dummy tracee (a Python process sleeping in a loop) is started, then each
+benchmark is run and its latencies are saved into a JSON file. Two files
+can be compared with --compare.
+'''
+
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+import deedee.proc         as proc
+import deedee.proc.plugins as plugins
+
+from deedee.proc.maps import parse_maps
+
+
+#############
+# Constants #
+#############
+
+# the tracee prints the address of a buffer then sleeps forever
+TRACEE = '''
+import ctypes, sys, time
+buf = bytearray(b'A' * %d)
+print(hex(ctypes.addressof((ctypes.c_char * len(buf)).from_buffer(buf))), flush=True)
+while True:
+    time.sleep(0.01)
+'''
+
+VERSION_FILE = Path(__file__).resolve().parents[1].joinpath('version')
+
+READ_SIZES = [8, 64, 512, 4096, 65536, 1024 * 1024]
+
+MAPS_SIZES = [100, 1000, 10000, 100000]
+
+# each statement is run by a new interpreter
+IMPORTS = {
+    'interpreter':    'pass',
+    'import':         'import deedee.proc',
+    'import_plugins': 'import deedee.proc; deedee.proc.plugins.syscall.Syscalls',
+    'first_ptrace':   'import deedee.proc; deedee.proc.libc.ptrace.libc.ptrace'
+}
+
+
+###########
+# Helpers #
+###########
+
+def measure(fct, repeat, warmup=3):
+    '''Calls fct and returns the latencies (in ns) of each call.'''
+    for _ in range(warmup):
+        fct()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        fct()
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def summarize(name, latencies, size=None, **params):
+    '''Builds the JSON record of a benchmark.'''
+    latencies = sorted(latencies)
+    median    = statistics.median(latencies)
+    result    = {
+        'name':       name,
+        'params':     dict(params, **({} if size is None else {'size': size})),
+        'n':          len(latencies),
+        'min_ns':     latencies[0],
+        'median_ns':  median,
+        'mean_ns':    statistics.fmean(latencies),
+        'p99_ns':     latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+        'ops_per_s':  1e9 / median if median else None
+    }
+    if size is not None:
+        result['bytes_per_s'] = size * 1e9 / median if median else None
+    return result
+
+
+def key(result):
+    return (result['name'], json.dumps(result['params'], sort_keys=True))
+
+
+def find_libc():
+    '''Returns the path of the libc mapped into the current process.'''
+    for m in proc.maps.get_maps(os.getpid()):
+        if re.match(r'libc(\.so|-)', os.path.basename(m.pathname)):
+            return m.pathname
+    raise RuntimeError('libc not found')
+
+
+def synthetic_maps(n):
+    '''Builds the content of a maps file with n lines.'''
+    lines = []
+    addr  = 0x555555554000
+    for i in range(n):
+        end  = addr + 0x1000 * (1 + i % 16)
+        path = f'/usr/lib/x86_64-linux-gnu/lib{i % 500}.so' if i % 3 else ''
+        lines.append(
+            f'{addr:x}-{end:x} {"r-xp" if i % 2 else "rw-p"} {i * 0x1000:08x} '
+            f'fe:00 {i if path else 0} {" " * 20 if path else ""}{path}'
+        )
+        addr = end + 0x1000
+    return '\n'.join(lines) + '\n'
+
+
+##############
+# Benchmarks #
+##############
+
+def bench_import(args):
+    # the interpreters must import the same package as this one
+    env = dict(os.environ, PYTHONPATH=str(Path(proc.__file__).resolve().parents[2]))
+    for name, statement in IMPORTS.items():
+        run = lambda: subprocess.run([sys.executable, '-c', statement], env=env, check=True)
+        yield summarize(name, measure(run, max(3, args.repeat // 5), warmup=1))
+
+
+def bench_attach(pid, args):
+    process = proc.Process(pid)
+    def attach_detach():
+        process.attach()
+        process.detach()
+    yield summarize('attach_detach', measure(attach_detach, args.repeat))
+
+
+def bench_regs(process, args):
+    regs = process.get_regs()
+    yield summarize('get_regs', measure(lambda: process.get_regs(regs), args.repeat))
+    yield summarize('set_regs', measure(lambda: process.set_regs(regs), args.repeat))
+
+
+def bench_read(process, args):
+    procmem = plugins.readmem.ProcMemRead()
+    methods = {
+        'read_mem_words': lambda size: process.read_mem_words(args.buf, size // 8),
+        'read_mem_array': lambda size: process.read_mem_array(args.buf, size),
+        'ProcMemRead':    lambda size: procmem(process, args.buf, size),
+        'read':           lambda size: process.read(args.buf, size)
+    }
+    for size in READ_SIZES:
+        for name, fct in methods.items():
+            # reading big spaces word by word is slow
+            repeat = args.repeat if size <= 65536 or name != 'read_mem_words' else 3
+            yield summarize(name, measure(lambda: fct(size), repeat), size=size)
+
+
+def bench_syscall(process, args):
+    syscall = plugins.syscall.SyscallByInstrReplacement()
+    getpid  = plugins.syscall.Syscalls.getpid
+    yield summarize(
+        'SyscallByInstrReplacement',
+        measure(lambda: syscall(process, getpid), args.repeat)
+    )
+
+
+def bench_call(process, args):
+    call   = plugins.call.CallInt3()
+    getsym = plugins.getsym.ByLibLoading()
+    addr   = getsym(process, args.libc, 'getpid')
+    yield summarize('CallInt3', measure(lambda: call(process, addr), args.repeat))
+
+
+def bench_getsym(process, args):
+    getsym = plugins.getsym.ByLibLoading()
+    yield summarize(
+        'ByLibLoading',
+        measure(lambda: getsym(process, args.libc, 'getpid'), args.repeat)
+    )
+
+
+def bench_maps(process, args):
+    yield summarize('get_maps', measure(process.get_maps, args.repeat))
+    for n in MAPS_SIZES:
+        text   = synthetic_maps(n)
+        repeat = max(3, args.repeat * 100 // n)
+        yield summarize('parse_maps', measure(lambda: parse_maps(text), repeat), lines=n)
+
+
+BENCHMARKS = [
+    bench_regs,
+    bench_read,
+    bench_syscall,
+    bench_call,
+    bench_getsym,
+    bench_maps
+]
+
+
+########
+# Main #
+########
+
+def run(args):
+    size   = max(READ_SIZES)
+    tracee = subprocess.Popen(
+        [sys.executable, '-c', TRACEE % size],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    results = []
+    selected = lambda bench: args.only is None or re.search(args.only, bench.__name__[6:])
+    def save(result):
+        print(
+            f'{result["name"]:<28}{json.dumps(result["params"]):<24}'
+            f'{result["median_ns"] / 1000:>12.2f} us'
+        )
+        results.append(result)
+    try:
+        if selected(bench_import):
+            for result in bench_import(args):
+                save(result)
+        args.buf  = int(tracee.stdout.readline(), 16)
+        args.libc = find_libc()
+        if selected(bench_attach):
+            for result in bench_attach(tracee.pid, args):
+                save(result)
+        process = proc.Process(tracee.pid)
+        process.attach()
+        try:
+            for bench in filter(selected, BENCHMARKS):
+                for result in bench(process, args):
+                    save(result)
+        finally:
+            process.detach()
+    finally:
+        tracee.kill()
+        tracee.wait()
+    meta = {
+        'version':   VERSION_FILE.read_text().strip(),
+        'python':    platform.python_version(),
+        'kernel':    platform.release(),
+        'machine':   platform.machine(),
+        'cpus':      os.cpu_count(),
+        'timestamp': time.time(),
+        'repeat':    args.repeat
+    }
+    with open(args.output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print(f'Results saved into {args.output}.')
+
+
+def compare(args):
+    with open(args.compare[0]) as f:
+        old = {key(r): r for r in json.load(f)['results']}
+    with open(args.compare[1]) as f:
+        new = json.load(f)['results']
+    for result in new:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        ratio = result['median_ns'] / before['median_ns']
+        print(
+            f'{result["name"]:<28}{json.dumps(result["params"]):<24}'
+            f'{before["median_ns"] / 1000:>12.2f} us'
+            f'{result["median_ns"] / 1000:>12.2f} us'
+            f'{ratio:>8.2f}x'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='deedee.proc benchmarks')
+    parser.add_argument('-o', '--output', default='bench.json', help='JSON output file')
+    parser.add_argument('-r', '--repeat', type=int, default=100, help='calls per benchmark')
+    parser.add_argument('--only', help='regex selecting the benchmarks (import, attach, regs, read, syscall, call, getsym, maps)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two JSON files')
+    args = parser.parse_args()
+    if args.compare is not None:
+        compare(args)
+    else:
+        run(args)
@@ -0,0 +1,87 @@
+
+'''Checks the detach of a process traced by `SeccompTracer`.
+
+A multi-threaded target doing syscalls in a loop is spawned and traced for a
+while. A plain detach must be refused (the filter would make the traced
+syscalls fail); a forced one must leave none of its threads stopped. The
+target is a throwaway process killed at the end.
+'''
+
+
+import argparse
+import subprocess
+import sys
+import time
+
+import deedee.proc         as proc
+import deedee.proc.plugins as plugins
+
+from deedee.proc.plugins.syscall import Syscalls
+
+
+TARGET = '''
+import os, threading, time
+def loop():
+    while True:
+        os.getppid()
+        time.sleep(0.0001)
+for _ in range({threads} - 1):
+    threading.Thread(target=loop, daemon=True).start()
+loop()
+'''
+
+
+def thread_states(pid):
+    states = {}
+    for tid in proc.Process(pid).get_threads():
+        with open(f'/proc/{pid}/task/{tid}/status') as f:
+            for line in f:
+                if line.startswith('State:'):
+                    states[tid] = line.split()[1]
+    return states
+
+
+def check(args):
+    target = subprocess.Popen([sys.executable, '-c', TARGET.format(threads=args.threads)])
+    try:
+        time.sleep(0.5)
+        victim = proc.Process(target.pid)
+        tracer = plugins.systrace.SeccompTracer(
+            plugins.syscall.SyscallByInstrReplacement(),
+            [Syscalls.getppid]
+        )
+        victim.attach()
+        tracer.install(victim)
+        for _ in range(args.rounds):
+            tracer(victim, count=args.count)
+        try:
+            victim.detach()
+        except RuntimeError:
+            pass
+        else:
+            print('FAILED: the process has been detached with the filter')
+            return 1
+        victim.detach(force=True)
+        time.sleep(0.2)
+        states  = thread_states(target.pid)
+        stopped = {tid: s for tid, s in states.items() if s in ('T', 't')}
+        events  = tracer.ring.drain()
+        done    = sum(event.done for event in events)
+        print(f'{len(events)} events ({done} with their exit), threads: {states}')
+        if len(stopped) != 0:
+            print(f'FAILED: threads left stopped: {stopped}')
+            return 1
+        print('OK')
+        return 0
+    finally:
+        target.kill()
+        target.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SeccompTracer Detach Check')
+    parser.add_argument('--threads', type=int, default=4, help='threads of the target')
+    parser.add_argument('--rounds', type=int, default=20, help='tracing rounds')
+    parser.add_argument('--count', type=int, default=50, help='syscalls per round')
+    args = parser.parse_args()
+    sys.exit(check(args))
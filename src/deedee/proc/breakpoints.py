@@ -0,0 +1,240 @@
+
+'''Persistent software breakpoints (int3).'''
+
+import os
+import signal
+import time
+
+from .libc import ptrace
+
+
+#############
+# Constants #
+#############
+
+INT3 = 0xcc
+
+
+###########
+# Classes #
+###########
+
+class Breakpoint:
+    '''Stores the state of one breakpoint.
+
+    Attributes
+    ----------
+    addr : int
+        The address of the patched instruction.
+    condition : callable
+        Called with the registers of the process when the breakpoint is
+        reached. The hit is ignored if it returns False.
+    callback : callable
+        Called with the breakpoint and the registers of the process for each
+        hit.
+    hits : int
+        The number of hits (only those whose condition held).
+    last_hit : int
+        The `time.perf_counter_ns` value of the last hit.
+    '''
+
+    def __init__(self, addr, condition=None, callback=None):
+        self.addr      = addr
+        self.condition = condition
+        self.callback  = callback
+        self.hits      = 0
+        self.last_hit  = None
+        # the word at addr without and with the int3
+        self._orig_word    = None
+        self._patched_word = None
+        self._orig_byte    = None
+
+    def __repr__(self):
+        return f'Breakpoint(addr={hex(self.addr)}, hits={self.hits})'
+
+
+class BreakpointManager:
+    '''Manages the int3 patches of a process.
+
+    When a breakpoint is hit, rip is moved back onto the patched instruction.
+    The original instruction is only executed on the next `cont` call: the
+    original word is restored, the process singlesteps and the int3 is
+    written again before the process continues.
+
+    The words written into the process memory are computed once (when a
+    breakpoint is added or removed) and the registers are fetched into a
+    preallocated structure, so a hit costs: waitpid, getregs, setregs and,
+    on the next continue, pokedata, singlestep, waitpid, pokedata and cont.
+
+    Warnings
+    --------
+    Only the main thread of the process is traced: a breakpoint hit by
+    another thread kills the process.
+
+    Examples
+    --------
+    >>> process.attach()
+    >>> bp = process.breakpoints.add(malloc_addr, condition=lambda r: r.rdi > 4096)
+    >>> process.breakpoints.run(until=lambda: bp.hits == 100)
+    >>> process.detach()
+    '''
+
+    def __init__(self, process):
+        self._process     = process
+        self._breakpoints = {}
+        self._regs        = ptrace.UserRegsStruct()
+        # breakpoint on which the process is stopped (must be stepped over)
+        self._current     = None
+        # signal to deliver on the next continue
+        self._pending_sig = 0
+
+    def __iter__(self):
+        return iter(self._breakpoints.values())
+
+    def __len__(self):
+        return len(self._breakpoints)
+
+    def __getitem__(self, addr):
+        return self._breakpoints[addr]
+
+    @property
+    def regs(self):
+        '''The registers cached at the last stop.'''
+        return self._regs
+
+    def _peek(self, addr):
+        return self._process._call_ptrace(ptrace.peekdata, addr)
+
+    def _poke(self, addr, word):
+        self._process._call_ptrace(ptrace.pokedata, addr, word)
+
+    def _refresh_words(self, addr):
+        '''Recomputes the words of the breakpoints sharing bytes with addr.'''
+        for bp in self._breakpoints.values():
+            if abs(bp.addr - addr) < 8:
+                word             = self._peek(bp.addr) & ~0xff
+                bp._orig_word    = word | bp._orig_byte
+                bp._patched_word = word | INT3
+
+    def add(self, addr, condition=None, callback=None):
+        '''Inserts a breakpoint.
+
+        Parameters
+        ----------
+        addr : int
+            The address of the instruction to patch.
+        condition : callable, optional
+            See `Breakpoint`.
+        callback : callable, optional
+            See `Breakpoint`.
+
+        Returns
+        -------
+        Breakpoint
+            The new breakpoint (or the existing one at this address).
+        '''
+        if addr in self._breakpoints:
+            return self._breakpoints[addr]
+        bp            = Breakpoint(addr, condition, callback)
+        word          = self._peek(addr)
+        bp._orig_byte = word & 0xff
+        self._poke(addr, (word & ~0xff) | INT3)
+        self._breakpoints[addr] = bp
+        self._refresh_words(addr)
+        return bp
+
+    def remove(self, addr):
+        '''Removes a breakpoint and restores the original instruction.'''
+        bp = self._breakpoints.pop(addr)
+        self._poke(addr, bp._orig_word)
+        if self._current is bp:
+            self._current = None
+        self._refresh_words(addr)
+
+    def clear(self):
+        '''Removes all the breakpoints.'''
+        for addr in list(self._breakpoints):
+            self.remove(addr)
+
+    def _step_over(self):
+        '''Executes the original instruction of the current breakpoint.'''
+        bp            = self._current
+        self._current = None
+        self._poke(bp.addr, bp._orig_word)
+        while True:
+            self._process._call_ptrace(ptrace.singlestep, self._pending_sig)
+            self._pending_sig = 0
+            status = self._process._wait(signal.SIGTRAP)
+            if not os.WIFSTOPPED(status):
+                return status
+            sig = os.WSTOPSIG(status)
+            if sig == signal.SIGTRAP:
+                break
+            # interrupted before the step: deliver the signal and step again
+            self._pending_sig = sig
+        self._poke(bp.addr, bp._patched_word)
+        return status
+
+    def cont(self):
+        '''Continues the process until a breakpoint is hit.
+
+        Breakpoints whose condition does not hold are transparently stepped
+        over. Other signals are delivered to the process on the next call.
+
+        Returns
+        -------
+        Breakpoint or None
+            The hit breakpoint or None if the process stopped for another
+            reason (signal, exit).
+        '''
+        process = self._process
+        while True:
+            if self._current is not None:
+                status = self._step_over()
+                if not os.WIFSTOPPED(status):
+                    return None
+            process._call_ptrace(ptrace.cont, self._pending_sig)
+            self._pending_sig = 0
+            status = process._wait(signal.SIGTRAP)
+            if not os.WIFSTOPPED(status):
+                return None
+            sig = os.WSTOPSIG(status)
+            if sig != signal.SIGTRAP:
+                self._pending_sig = sig
+                return None
+            now  = time.perf_counter_ns()
+            regs = process.get_regs(self._regs)
+            bp   = self._breakpoints.get(regs.rip - 1)
+            if bp is None:
+                return None
+            regs.rip -= 1
+            process.set_regs(regs)
+            self._current = bp
+            if bp.condition is not None and not bp.condition(regs):
+                continue
+            bp.hits    += 1
+            bp.last_hit = now
+            if bp.callback is not None:
+                bp.callback(bp, regs)
+            return bp
+
+    def run(self, until=None):
+        '''Continues the process while calling the breakpoint callbacks.
+
+        Parameters
+        ----------
+        until : callable, optional
+            Called after each hit, the loop stops when it returns True.
+            By default, the loop stops when the process is stopped by
+            something else than a breakpoint.
+
+        Returns
+        -------
+        Breakpoint or None
+            The last hit breakpoint or None if the process stopped for
+            another reason.
+        '''
+        while True:
+            bp = self.cont()
+            if bp is None or (until is not None and until()):
+                return bp
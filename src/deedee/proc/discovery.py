@@ -0,0 +1,407 @@
+
+'''Finds the processes matching some criteria (executable, command line, uid,
+cgroup, mapped library).
+
+The pids are listed with `os.scandir('/proc')` and the `/proc/<pid>` files
+are read with raw reads (`os.open`/`os.read`), only when a selector needs
+them: a selector on the executable only does a `readlink` per process.
+
+The information read for a process is cached with its start time (the field
+22 of `/proc/<pid>/stat`, read at each scan): a pid reused by a new process
+is detected and the information of a process still alive is not read again
+(call `scan` with refresh=True to see an exec or a dlopen).
+
+The processes are checked by several threads when there are many of them
+(the reads release the GIL).
+'''
+
+import abc
+import fnmatch
+import os
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+#############
+# Constants #
+#############
+
+# size of the raw reads
+READ_SIZE = 4096
+
+# number of pids checked by each task of a parallel scan
+BATCH_SIZE = 256
+
+# number of pids from which the scan is parallel
+PARALLEL_MIN = 1024
+
+# index of the start time into the fields of /proc/<pid>/stat after the
+# command name (the field 22, the command name being the field 2)
+_STARTTIME = 22 - 3
+_PPID      = 4 - 3
+
+# pathnames of the mappings of a maps file
+_RE_PATHS = re.compile(rb'^[^/\n]*(/[^\n]*)$', flags=re.MULTILINE)
+
+
+###########
+# Helpers #
+###########
+
+def _read(path, once=False):
+    '''Reads a file with raw reads (only one if once is True).'''
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, READ_SIZE)
+            chunks.append(chunk)
+            if once or len(chunk) == 0:
+                break
+        return b''.join(chunks)
+    finally:
+        os.close(fd)
+
+
+def _read_stat(pid):
+    '''Returns the command name, the ppid and the start time of a process.'''
+    data = _read(f'/proc/{pid}/stat', once=True)
+    end  = data.rindex(b')')
+    comm = data[data.index(b'(') + 1:end]
+    rest = data[end + 2:].split()
+    return os.fsdecode(comm), int(rest[_PPID]), int(rest[_STARTTIME])
+
+
+def _match_path(pattern, path):
+    '''Matches a path against a pattern on the full path if the pattern has a
+    '/', else on the basename.'''
+    if path is None:
+        return False
+    if '/' not in pattern:
+        path = os.path.basename(path)
+    return fnmatch.fnmatchcase(path, pattern)
+
+
+###########
+# Classes #
+###########
+
+class ProcessInfo:
+    '''The information of a process, read on first access.
+
+    The attributes are None if they can not be read (e.g. the executable of
+    a process of another user).
+
+    Attributes
+    ----------
+    pid : int
+        The pid of the process.
+    comm : str
+        The command name.
+    ppid : int
+        The pid of the parent.
+    starttime : int
+        The start time (in clock ticks after the boot).
+    '''
+
+    def __init__(self, pid, comm, ppid, starttime):
+        self.pid       = pid
+        self.comm      = comm
+        self.ppid      = ppid
+        self.starttime = starttime
+        self._fields   = {}
+
+    def __repr__(self):
+        return f'ProcessInfo(pid={self.pid}, comm={self.comm!r})'
+
+    def _get(self, name, reader):
+        if name not in self._fields:
+            try:
+                self._fields[name] = reader()
+            except (OSError, ValueError, IndexError):
+                self._fields[name] = None
+        return self._fields[name]
+
+    def clear(self):
+        '''Drops the read information.'''
+        self._fields = {}
+
+    @property
+    def exe(self):
+        '''The path of the executable.'''
+        return self._get('exe', lambda: os.readlink(f'/proc/{self.pid}/exe'))
+
+    @property
+    def cmdline(self):
+        '''The arguments (list of str).'''
+        def read():
+            data = _read(f'/proc/{self.pid}/cmdline')
+            return [os.fsdecode(arg) for arg in data.split(b'\x00')[:-1]]
+        return self._get('cmdline', read)
+
+    @property
+    def uids(self):
+        '''The real, effective, saved and filesystem uids.'''
+        def read():
+            data  = _read(f'/proc/{self.pid}/status')
+            start = data.index(b'\nUid:') + 5
+            return tuple(int(uid) for uid in data[start:data.index(b'\n', start)].split())
+        return self._get('uids', read)
+
+    @property
+    def uid(self):
+        '''The real uid.'''
+        uids = self.uids
+        return None if uids is None else uids[0]
+
+    @property
+    def cgroups(self):
+        '''The paths of the cgroups of the process (one per hierarchy, only
+        one with cgroup v2).'''
+        def read():
+            data = _read(f'/proc/{self.pid}/cgroup')
+            return [
+                os.fsdecode(line.split(b':', 2)[2])
+                for line in data.splitlines() if line.count(b':') >= 2
+            ]
+        return self._get('cgroups', read)
+
+    @property
+    def files(self):
+        '''The paths of the mapped files (a set).'''
+        def read():
+            data = _read(f'/proc/{self.pid}/maps')
+            return {os.fsdecode(path) for path in _RE_PATHS.findall(data)}
+        return self._get('files', read)
+
+
+class Selector(abc.ABC):
+    '''The base class of the selectors.
+
+    A selector is called with a ProcessInfo and returns True if the process
+    is selected. The selectors can be combined with &, | and ~ (the
+    combinations are lazy: put the cheap selectors first).
+    '''
+
+    @abc.abstractmethod
+    def __call__(self, info):
+        '''Returns True if the process described by info is selected.'''
+
+    def __and__(self, other):
+        return All(self, other)
+
+    def __or__(self, other):
+        return Any(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class All(Selector):
+    '''Selects the processes selected by all the given selectors.'''
+
+    def __init__(self, *selectors):
+        self._selectors = selectors
+
+    def __call__(self, info):
+        return all(selector(info) for selector in self._selectors)
+
+
+class Any(Selector):
+    '''Selects the processes selected by one of the given selectors.'''
+
+    def __init__(self, *selectors):
+        self._selectors = selectors
+
+    def __call__(self, info):
+        return any(selector(info) for selector in self._selectors)
+
+
+class Not(Selector):
+    '''Selects the processes not selected by a selector.'''
+
+    def __init__(self, selector):
+        self._selector = selector
+
+    def __call__(self, info):
+        return not self._selector(info)
+
+
+class Exe(Selector):
+    '''Selects the processes by executable.
+
+    The pattern (fnmatch) is matched against the full path if it has a '/',
+    else against the basename: `Exe('python3*')`, `Exe('/usr/bin/*')`.
+    '''
+
+    def __init__(self, pattern):
+        self._pattern = pattern
+
+    def __call__(self, info):
+        return _match_path(self._pattern, info.exe)
+
+
+class Cmdline(Selector):
+    '''Selects the processes whose command line (the arguments joined by
+    spaces) contains a string or matches a compiled regex (`re.search`).'''
+
+    def __init__(self, pattern):
+        self._pattern = pattern
+
+    def __call__(self, info):
+        args = info.cmdline
+        if args is None:
+            return False
+        cmdline = ' '.join(args)
+        if isinstance(self._pattern, re.Pattern):
+            return self._pattern.search(cmdline) is not None
+        return self._pattern in cmdline
+
+
+class Uid(Selector):
+    '''Selects the processes by real uid (or effective uid).'''
+
+    def __init__(self, uid, effective=False):
+        self._uid   = uid
+        self._index = 1 if effective else 0
+
+    def __call__(self, info):
+        uids = info.uids
+        return uids is not None and uids[self._index] == self._uid
+
+
+class Cgroup(Selector):
+    '''Selects the processes whose cgroup path contains a string.'''
+
+    def __init__(self, pattern):
+        self._pattern = pattern
+
+    def __call__(self, info):
+        cgroups = info.cgroups
+        return cgroups is not None and any(self._pattern in path for path in cgroups)
+
+
+class Library(Selector):
+    '''Selects the processes mapping a file (e.g. a library).
+
+    The pattern is matched like the one of `Exe`: `Library('libssl.so*')`.
+    '''
+
+    def __init__(self, pattern):
+        self._pattern = pattern
+
+    def __call__(self, info):
+        files = info.files
+        if files is None:
+            return False
+        if '/' in self._pattern and not any(c in self._pattern for c in '*?['):
+            return self._pattern in files
+        return any(_match_path(self._pattern, path) for path in files)
+
+
+class Discovery:
+    '''Scans the processes and caches their information.
+
+    Examples
+    --------
+    >>> discovery = Discovery()
+    >>> discovery.find(Exe('python3*') & Library('libssl.so*'))
+    [1234, 5678]
+    >>> # the second scan only reads the stat files and the new processes
+    >>> discovery.find(Uid(1000) & Cmdline('--serve'))
+    '''
+
+    def __init__(self, workers=None):
+        '''
+        Parameters
+        ----------
+        workers : int, optional
+            The number of threads of the parallel scans (see
+            `concurrent.futures.ThreadPoolExecutor`). 1 disables them.
+        '''
+        self._workers = workers
+        # pid -> ProcessInfo
+        self._cache   = {}
+
+    def info(self, pid):
+        '''Returns the information of a process.
+
+        Raises
+        ------
+        OSError
+            If the process does not exist.
+        '''
+        comm, ppid, starttime = _read_stat(pid)
+        info = self._cache.get(pid)
+        if info is None or info.starttime != starttime:
+            info = self._cache[pid] = ProcessInfo(pid, comm, ppid, starttime)
+        return info
+
+    def _check(self, pids, selector, refresh):
+        selected = []
+        for pid in pids:
+            try:
+                info = self.info(pid)
+            except (OSError, ValueError, IndexError):
+                # the process is gone
+                continue
+            if refresh:
+                info.clear()
+            if selector is None or selector(info):
+                selected.append(info)
+        return selected
+
+    def scan(self, selector=None, refresh=False):
+        '''Returns the information of the processes selected by a selector.
+
+        Parameters
+        ----------
+        selector : callable, optional
+            Called with a ProcessInfo, returns True to select the process
+            (all the processes are selected if not given).
+        refresh : bool, optional
+            If True, the cached information is read again.
+
+        Returns
+        -------
+        list of ProcessInfo
+            The selected processes, sorted by pid.
+        '''
+        pids = [int(entry.name) for entry in os.scandir('/proc') if entry.name.isdigit()]
+        # the processes which are gone are dropped from the cache
+        alive = set(pids)
+        for pid in [pid for pid in self._cache if pid not in alive]:
+            del self._cache[pid]
+        if self._workers == 1 or len(pids) < PARALLEL_MIN:
+            selected = self._check(pids, selector, refresh)
+        else:
+            batches = [pids[i:i + BATCH_SIZE] for i in range(0, len(pids), BATCH_SIZE)]
+            with ThreadPoolExecutor(self._workers) as executor:
+                results = executor.map(lambda batch: self._check(batch, selector, refresh), batches)
+                selected = [info for result in results for info in result]
+        return sorted(selected, key=lambda info: info.pid)
+
+    def find(self, selector=None, refresh=False):
+        '''Returns the pids of the processes selected by a selector (see
+        `scan`).'''
+        return [info.pid for info in self.scan(selector, refresh)]
+
+
+#############
+# Functions #
+#############
+
+_discovery = Discovery()
+
+def find(selector=None, refresh=False):
+    '''Returns the pids of the processes selected by a selector, with a
+    shared cache (see `Discovery.find`).
+
+    Examples
+    --------
+    >>> from deedee.proc.discovery import find, Exe, Library
+    >>> for pid in find(Exe('nginx') & Library('libssl.so*')):
+    >>>     process = Process(pid)
+    '''
+    return _discovery.find(selector, refresh)
@@ -0,0 +1,211 @@
+
+'''Minimal ELF64 (little endian) parser.
+
+It only knows what the other modules of this package need: the program
+headers, the symbol tables and the build-id note.
+'''
+
+import mmap
+import struct
+
+from dataclasses import dataclass
+
+
+#############
+# Constants #
+#############
+
+ELF_MAGIC = b'\x7fELF'
+
+# e_ident
+ELFCLASS64  = 2
+ELFDATA2LSB = 1
+
+# p_type
+PT_LOAD = 1
+PT_NOTE = 4
+
+# sh_type
+SHT_SYMTAB = 2
+SHT_NOTE   = 7
+SHT_DYNSYM = 11
+
+# note types
+NT_GNU_BUILD_ID = 3
+
+_EHDR = struct.Struct('<16sHHIQQQIHHHHHH')
+_PHDR = struct.Struct('<IIQQQQQQ')
+_SHDR = struct.Struct('<IIQQQQIIQQ')
+_SYM  = struct.Struct('<IBBHQQ')
+_NHDR = struct.Struct('<III')
+
+
+##############
+# Exceptions #
+##############
+
+class ElfException(Exception):
+    '''Raised when a file is not a supported ELF file.'''
+    pass
+
+
+###########
+# Classes #
+###########
+
+@dataclass
+class Segment:
+    '''Stores a program header.'''
+    type_  : int
+    flags  : int
+    offset : int
+    vaddr  : int
+    filesz : int
+    memsz  : int
+
+
+@dataclass
+class Section:
+    '''Stores a section header.'''
+    name    : str
+    type_   : int
+    addr    : int
+    offset  : int
+    size    : int
+    link    : int
+    entsize : int
+
+
+class ElfFile:
+    '''Gives access to some parts of an ELF file.
+
+    The file is mmapped and the symbol tables are only parsed on the first
+    symbol lookup.
+
+    Examples
+    --------
+    >>> elf = ElfFile('/usr/lib64/libc.so.6')
+    >>> hex(elf.get_symbol('printf'))
+    '0x5c4e0'
+    '''
+
+    def __init__(self, path):
+        self._path = path
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        ehdr  = _EHDR.unpack_from(self._data, 0)
+        ident = ehdr[0]
+        if ident[:4] != ELF_MAGIC:
+            raise ElfException(f'{path} is not an ELF file')
+        if ident[4] != ELFCLASS64 or ident[5] != ELFDATA2LSB:
+            raise ElfException(f'{path} is not a little endian ELF64 file')
+        self._phoff    = ehdr[5]
+        self._shoff    = ehdr[6]
+        self._phnum    = ehdr[10]
+        self._shnum    = ehdr[12]
+        self._shstrndx = ehdr[13]
+        self._segments = None
+        self._sections = None
+        self._symbols  = None
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def segments(self):
+        '''The program headers of the file.'''
+        if self._segments is None:
+            self._segments = []
+            for i in range(self._phnum):
+                p = _PHDR.unpack_from(self._data, self._phoff + i * _PHDR.size)
+                self._segments.append(Segment(p[0], p[1], p[2], p[3], p[5], p[6]))
+        return self._segments
+
+    @property
+    def sections(self):
+        '''The section headers of the file (empty if they are stripped).'''
+        if self._sections is None:
+            headers = [
+                _SHDR.unpack_from(self._data, self._shoff + i * _SHDR.size)
+                for i in range(self._shnum)
+            ]
+            if headers and self._shstrndx < len(headers):
+                strtab = headers[self._shstrndx][4]
+            else:
+                strtab = None
+            self._sections = []
+            for h in headers:
+                name = '' if strtab is None else self._read_str(strtab + h[0])
+                self._sections.append(Section(name, h[1], h[3], h[4], h[5], h[6], h[9]))
+        return self._sections
+
+    @property
+    def min_vaddr(self):
+        '''The page aligned virtual address of the first PT_LOAD segment.'''
+        loads = [s.vaddr for s in self.segments if s.type_ == PT_LOAD]
+        if len(loads) == 0:
+            raise ElfException(f'{self._path} has no PT_LOAD segment')
+        return min(loads) & ~0xfff
+
+    def _read_str(self, offset):
+        end = self._data.find(b'\x00', offset)
+        return self._data[offset:end].decode(errors='replace')
+
+    def _load_symbols(self):
+        self._symbols = {}
+        sections = self.sections
+        # .dynsym first so that .symtab (more complete) wins
+        for type_ in (SHT_DYNSYM, SHT_SYMTAB):
+            for s in sections:
+                if s.type_ != type_ or s.entsize == 0:
+                    continue
+                strtab = sections[s.link].offset
+                for off in range(s.offset, s.offset + s.size, s.entsize):
+                    name, _, _, shndx, value, _ = _SYM.unpack_from(self._data, off)
+                    if name == 0 or shndx == 0:
+                        continue
+                    self._symbols[self._read_str(strtab + name)] = value
+
+    def get_symbol(self, name):
+        '''Returns the value (the link-time address) of a symbol.
+
+        Parameters
+        ----------
+        name : str
+            The symbol name.
+
+        Returns
+        -------
+        int or None
+            The symbol value or None if the symbol is not defined.
+        '''
+        if self._symbols is None:
+            self._load_symbols()
+        return self._symbols.get(name)
+
+    def build_id(self):
+        '''Returns the GNU build-id of the file as an hexadecimal string.
+
+        Returns
+        -------
+        str or None
+            The build-id or None if the file has no build-id note.
+        '''
+        notes = [(s.offset, s.filesz) for s in self.segments if s.type_ == PT_NOTE]
+        if len(notes) == 0:
+            notes = [(s.offset, s.size) for s in self.sections if s.type_ == SHT_NOTE]
+        for offset, size in notes:
+            end = offset + size
+            while offset + _NHDR.size <= end:
+                namesz, descsz, type_ = _NHDR.unpack_from(self._data, offset)
+                name_off = offset + _NHDR.size
+                desc_off = name_off + ((namesz + 3) & ~3)
+                offset   = desc_off + ((descsz + 3) & ~3)
+                name     = self._data[name_off:name_off + namesz]
+                if type_ == NT_GNU_BUILD_ID and name == b'GNU\x00':
+                    return self._data[desc_off:desc_off + descsz].hex()
+        return None
+
+    def close(self):
+        self._data.close()
@@ -0,0 +1,624 @@
+
+'''Walks the heap of a process allocating with the glibc (ptmalloc).
+
+The arenas are found from `main_arena`:
+
+    - its address is the value of the `main_arena` symbol of the libc (or of
+      its debug file, found by build-id). If the libc is stripped, the
+      writable data of the libc is scanned for a `malloc_state` (the empty
+      bins of an arena point to themselves);
+    - the other arenas are linked to it by their `next` field.
+
+Each arena structure is read once, then each heap segment (the `[heap]` for
+the main arena, the 64 MiB aligned heaps of the other arenas) is read with one
+bulk read: the chunk headers, the bins, the fast bins and the tcache are then
+parsed locally. The process does not need to be stopped (nothing is read
+between two chunks): the pointers found into the segments are checked since
+the heap may change between two reads.
+
+The chunks allocated with mmap (the big allocations) are not owned by an
+arena and are not reported.
+'''
+
+import bisect
+import ctypes
+import mmap
+import re
+import struct
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .elf  import ElfFile, ElfException
+from .libc import uio
+
+
+#############
+# Constants #
+#############
+
+SIZE_SZ          = 8
+MALLOC_ALIGNMENT = 16
+MINSIZE          = 32
+
+# flags stored into the low bits of the chunk sizes
+PREV_INUSE     = 1
+IS_MMAPPED     = 2
+NON_MAIN_ARENA = 4
+SIZE_BITS      = PREV_INUSE | IS_MMAPPED | NON_MAIN_ARENA
+
+# the heaps of the non main arenas are aligned on their max size
+HEAP_MAX_SIZE = 64 * 1024 * 1024
+
+NBINS           = 128
+NSMALLBINS      = 64
+NFASTBINS       = 10
+TCACHE_MAX_BINS = 64
+
+# max number of arenas and of chunks into a bin (against the cycles)
+MAX_ARENAS = 1024
+MAX_CHAIN  = 1 << 20
+
+# where the debug files are installed, by build-id
+DEBUG_DIR = '/usr/lib/debug/.build-id'
+
+# version used if the libc version can not be read
+DEFAULT_VERSION = (2, 35)
+
+_VERSION = re.compile(rb'GNU C Library [^\n]*?version (\d+)\.(\d+)')
+_LIBC    = re.compile(r'libc[.-]')
+
+
+###########
+# Helpers #
+###########
+
+@dataclass(frozen=True)
+class _Layout:
+    '''The offsets of the fields of a `malloc_state` and the features of a
+    glibc version.'''
+    fastbins     : int
+    top          : int
+    bins         : int
+    next         : int
+    system_mem   : int
+    size         : int
+    tcache       : bool
+    # the tcache counts are 16 bits since 2.30 (8 bits before)
+    count_size   : int
+    # the single linked lists are mangled since 2.32 (safe-linking)
+    safe_linking : bool
+
+
+def _layout(version):
+    # have_fastchunks (an int) was added by 2.27
+    shift      = 0 if version >= (2, 27) else -8
+    count_size = 2 if version >= (2, 30) else 1
+    return _Layout(
+        fastbins     = 16 + shift,
+        top          = 96 + shift,
+        bins         = 112 + shift,
+        next         = 2160 + shift,
+        system_mem   = 2184 + shift,
+        size         = 2200 + shift,
+        tcache       = version >= (2, 26),
+        count_size   = count_size,
+        safe_linking = version >= (2, 32)
+    )
+
+
+def _glibc_version(path):
+    '''Reads the version of a libc from its banner.'''
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            match = _VERSION.search(data)
+            if match is not None:
+                return int(match[1]), int(match[2])
+    except (OSError, ValueError):
+        pass
+    return DEFAULT_VERSION
+
+
+def _libc(process):
+    for refresh in (False, True):
+        for module in process.modules(refresh=refresh):
+            if _LIBC.match(module.name):
+                return module
+    raise RuntimeError('the glibc is not loaded into the process')
+
+
+def _symbol(path, module, name):
+    '''Returns the address of a symbol of a loaded module, looked up into
+    the file or into its debug file.'''
+    candidates = [path]
+    if module.build_id is not None:
+        candidates.append(f'{DEBUG_DIR}/{module.build_id[:2]}/{module.build_id[2:]}.debug')
+    min_vaddr = None
+    for candidate in candidates:
+        try:
+            elf = ElfFile(candidate)
+        except (OSError, ValueError, struct.error, ElfException):
+            continue
+        try:
+            if min_vaddr is None:
+                min_vaddr = elf.min_vaddr
+            value = elf.get_symbol(name)
+        except (ValueError, struct.error, ElfException):
+            value = None
+        finally:
+            elf.close()
+        if value is not None:
+            return module.base - min_vaddr + value
+    return None
+
+
+def _is_arena(words, i, addr, layout):
+    '''Checks whether the words at index i are a `malloc_state`.'''
+    top   = words[i + layout.top // 8]
+    next_ = words[i + layout.next // 8]
+    if top == 0 or next_ == 0 or top % 8 != 0 or next_ % 8 != 0:
+        return False
+    first = i + layout.bins // 8
+    empty = 0
+    for b in range(NBINS - 1):
+        fd   = words[first + 2 * b]
+        bk   = words[first + 2 * b + 1]
+        bin_ = addr + layout.bins + 16 * b - 16
+        if fd == bin_ and bk == bin_:
+            empty += 1
+        elif fd == bin_ or bk == bin_ or fd == 0 or bk == 0 or fd % 8 != 0 or bk % 8 != 0:
+            return False
+    return empty != 0
+
+
+def _scan(process, module, layout):
+    '''Finds `main_arena` into the writable data of the libc.'''
+    ranges = list(module.data)
+    # the end of the .bss is into the anonymous mapping after the libc
+    for mapping in process.get_maps():
+        if mapping.start_address == module.end and mapping.inode == '0' and 'w' in mapping.perms:
+            ranges.append((mapping.start_address, mapping.end_address))
+    # the adjacent ranges are merged: the arena may cross two mappings
+    merged = []
+    for start, end in sorted(ranges):
+        if len(merged) != 0 and merged[-1][1] == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    datas = process.read_mem_scatter((start, end - start) for start, end in merged)
+    for (start, _), data in zip(merged, datas):
+        words = memoryview(data[:len(data) & ~7]).cast('Q')
+        for i in range(len(words) - layout.size // 8):
+            if _is_arena(words, i, start + 8 * i, layout):
+                return start + 8 * i
+    return None
+
+
+def _read_segment(process, addr, size):
+    '''Reads a segment with one `process_vm_readv` into a new buffer (or
+    with `Process.read` if it fails).'''
+    buf    = bytearray(size)
+    local  = (uio.IOVec * 1)()
+    remote = (uio.IOVec * 1)()
+    local[0].iov_base  = ctypes.addressof((ctypes.c_char * size).from_buffer(buf))
+    local[0].iov_len   = size
+    remote[0].iov_base = addr
+    remote[0].iov_len  = size
+    if uio.readv(process.pid, local, remote) != size:
+        return process.read(addr, size)
+    return buf
+
+
+class _Memory:
+    '''The segments read from the process, addressed by 64 bits words.'''
+
+    def __init__(self):
+        self._starts   = []
+        self._segments = []
+
+    def add(self, start, data, owner=None):
+        if len(data) % 8 != 0:
+            data = data[:len(data) & ~7]
+        words = memoryview(data).cast('Q')
+        i     = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._segments.insert(i, (start, words, owner))
+        return words
+
+    def find(self, addr):
+        '''Returns the (start, words, owner) of the segment of an address.'''
+        i = bisect.bisect_right(self._starts, addr) - 1
+        if i >= 0:
+            segment = self._segments[i]
+            if addr < segment[0] + 8 * len(segment[1]):
+                return segment
+        return None
+
+    def word(self, addr):
+        segment = self.find(addr)
+        if segment is None or addr % 8 != 0:
+            return None
+        return segment[1][(addr - segment[0]) // 8]
+
+
+def _log2(size):
+    return 1 << (size - 1).bit_length()
+
+
+###########
+# Classes #
+###########
+
+@dataclass
+class HeapStats:
+    '''The histograms of the chunks by size.
+
+    The sizes are the chunk sizes (the requested size, rounded up, plus the
+    size field).
+
+    Attributes
+    ----------
+    allocated : collections.Counter
+        The number of allocated chunks of each size.
+    free : collections.Counter
+        The number of free chunks of each size (including the cached ones).
+    cached : collections.Counter
+        The number of free chunks of each size kept by the fast bins and the
+        tcache (these chunks look allocated to the other chunks).
+    top : int
+        The size of the top chunks.
+    '''
+    allocated : Counter = field(default_factory=Counter)
+    free      : Counter = field(default_factory=Counter)
+    cached    : Counter = field(default_factory=Counter)
+    top       : int     = 0
+
+    def __iadd__(self, other):
+        self.allocated.update(other.allocated)
+        self.free.update(other.free)
+        self.cached.update(other.cached)
+        self.top += other.top
+        return self
+
+    @property
+    def allocated_bytes(self):
+        return sum(size * count for size, count in self.allocated.items())
+
+    @property
+    def free_bytes(self):
+        return sum(size * count for size, count in self.free.items())
+
+    def histogram(self, free=False, log2=False):
+        '''Returns the histogram of the allocated (or free) chunks.
+
+        Parameters
+        ----------
+        free : bool, optional
+            If True, the free chunks are counted instead of the allocated
+            ones.
+        log2 : bool, optional
+            If True, the sizes are grouped by power of 2 (each size is
+            rounded up).
+
+        Returns
+        -------
+        list of (int, int, int)
+            The (size, number of chunks, bytes) sorted by size.
+        '''
+        counts = Counter()
+        bytes_ = Counter()
+        for size, count in (self.free if free else self.allocated).items():
+            key          = _log2(size) if log2 else size
+            counts[key] += count
+            bytes_[key] += size * count
+        return [(size, counts[size], bytes_[size]) for size in sorted(counts)]
+
+
+@dataclass
+class Arena:
+    '''The state of an arena.
+
+    Attributes
+    ----------
+    addr : int
+        The address of its `malloc_state`.
+    main : bool
+        True for `main_arena`.
+    heaps : list of (int, int)
+        The (start, end) of its heap segments.
+    top : int
+        The address of its top chunk.
+    system_mem : int
+        The memory obtained from the system by the arena.
+    stats : HeapStats
+        The histograms of its chunks.
+    bins : collections.Counter
+        The number of chunks found into its 'unsorted', 'small', 'large',
+        'fast' and 'tcache' bins.
+    chunks : list of (int, int, str)
+        The (address, size, state) of its chunks, the state being 'used',
+        'free' or 'cached' (only filled on demand).
+    '''
+    addr       : int
+    main       : bool
+    heaps      : list      = field(default_factory=list)
+    top        : int       = 0
+    system_mem : int       = 0
+    stats      : HeapStats = field(default_factory=HeapStats)
+    bins       : Counter   = field(default_factory=Counter)
+    chunks     : list      = None
+
+
+class HeapWalker:
+    '''Walks the arenas of a process.
+
+    Examples
+    --------
+    >>> walker = HeapWalker(process)
+    >>> arenas = walker.walk()
+    >>> stats  = summarize(arenas)
+    >>> for size, count, bytes_ in stats.histogram(log2=True):
+    >>>     print(size, count, bytes_)
+    >>> print(stats.free_bytes, stats.top)
+    '''
+
+    def __init__(self, process, main_arena=None):
+        '''
+        Parameters
+        ----------
+        process : Process
+            The process.
+        main_arena : int, optional
+            The address of `main_arena` (looked up if not given).
+
+        Raises
+        ------
+        RuntimeError
+            If the libc is not loaded or if `main_arena` is not found.
+        '''
+        self._process = process
+        module        = _libc(process)
+        path          = f'/proc/{process.pid}/root{module.path}'
+        self.version  = _glibc_version(path)
+        self._layout  = _layout(self.version)
+        if main_arena is None:
+            main_arena = _symbol(path, module, 'main_arena')
+        if main_arena is None:
+            main_arena = _scan(process, module, self._layout)
+        if main_arena is None:
+            raise RuntimeError(f'main_arena not found into {module.path}')
+        self.main_arena = main_arena
+
+    def _reveal(self, pos, ptr):
+        '''Demangles a pointer stored at pos (safe-linking).'''
+        return ptr ^ (pos >> 12) if self._layout.safe_linking else ptr
+
+    def _read_arena(self, addr):
+        layout = self._layout
+        data   = self._process.read(addr, layout.size)
+        if len(data) != layout.size:
+            raise RuntimeError(f'the arena at {addr:#x} can not be read')
+        return memoryview(bytes(data)).cast('Q')
+
+    def _segments(self, arena, state, maps_):
+        '''Yields the (start, first chunk, size to read) of the heap segments
+        of an arena, from the current one to the first one (the `prev` field
+        of each read heap_info must be sent back).'''
+        top = state[self._layout.top // 8]
+        if arena.main:
+            heaps = [m for m in maps_ if m.pathname == '[heap]']
+            # the main arena may not use the [heap] (e.g. if brk failed)
+            if len(heaps) == 0 or not heaps[0].start_address <= top < heaps[-1].end_address:
+                return
+            start = heaps[0].start_address
+            yield start, (start + MALLOC_ALIGNMENT - 1) & ~(MALLOC_ALIGNMENT - 1), \
+                  heaps[-1].end_address - start
+            return
+        first_heap = arena.addr & ~(HEAP_MAX_SIZE - 1)
+        info_size  = arena.addr - first_heap
+        ends       = {m.start_address: m.end_address for m in maps_}
+        heap       = top & ~(HEAP_MAX_SIZE - 1)
+        for _ in range(MAX_ARENAS):
+            if heap == 0 or heap not in ends:
+                return
+            if heap == first_heap:
+                first = arena.addr + self._layout.size
+                first = (first + MALLOC_ALIGNMENT - 1) & ~(MALLOC_ALIGNMENT - 1)
+            else:
+                first = heap + info_size
+            # heap_info: ar_ptr, prev, size, mprotect_size
+            prev = yield heap, first, min(ends[heap], heap + HEAP_MAX_SIZE) - heap
+            if heap == first_heap:
+                return
+            heap = prev
+
+    def _walk_segment(self, arena, start, first, words):
+        '''Walks the chunks of a segment and returns the tcache
+        candidates.'''
+        layout    = self._layout
+        stats     = arena.stats
+        top       = arena.top
+        limit     = len(words)
+        i         = (first - start) // 8
+        # tcache_perthread_struct: counts then entries
+        tcache    = 16 + TCACHE_MAX_BINS * (layout.count_size + 8)
+        tcaches   = []
+        while i + 1 < limit:
+            addr = start + 8 * i
+            size = words[i + 1] & ~SIZE_BITS
+            if addr == top:
+                stats.top += size
+                break
+            # fenceposts at the end of the old heaps, or a heap changing
+            if size < MINSIZE or size % MALLOC_ALIGNMENT != 0 or i + size // 8 > limit:
+                break
+            j    = i + size // 8
+            used = j + 1 >= limit or words[j + 1] & PREV_INUSE
+            if used:
+                stats.allocated[size] += 1
+                if layout.tcache and size == tcache:
+                    tcaches.append(addr)
+            else:
+                stats.free[size] += 1
+            if arena.chunks is not None:
+                arena.chunks.append((addr, size, 'used' if used else 'free'))
+            i = j
+        return tcaches
+
+    def _walk_bins(self, arena, state, memory):
+        '''Counts the chunks of the doubly linked bins of an arena.'''
+        first = self._layout.bins // 8
+        for b in range(NBINS - 1):
+            bin_  = arena.addr + self._layout.bins + 16 * b - 16
+            chunk = state[first + 2 * b]
+            kind  = 'unsorted' if b == 0 else 'small' if b + 1 < NSMALLBINS else 'large'
+            for _ in range(MAX_CHAIN):
+                if chunk == bin_ or chunk is None:
+                    break
+                arena.bins[kind] += 1
+                chunk = memory.word(chunk + 16)
+
+    def _cache(self, arenas, memory, addr, kind):
+        '''Moves a chunk found into a fast bin or the tcache from the
+        allocated chunks to the cached ones.'''
+        segment = memory.find(addr)
+        if segment is None or segment[2] is None or addr % MALLOC_ALIGNMENT != 0:
+            return False
+        arena = arenas[segment[2]]
+        size  = memory.word(addr + 8) & ~SIZE_BITS
+        if arena.stats.allocated[size] == 0:
+            return False
+        arena.stats.allocated[size] -= 1
+        arena.stats.free[size]      += 1
+        arena.stats.cached[size]    += 1
+        arena.bins[kind]            += 1
+        return True
+
+    def _walk_fastbins(self, arenas, state, memory, cached):
+        for b in range(NFASTBINS):
+            chunk = state[self._layout.fastbins // 8 + b]
+            for _ in range(MAX_CHAIN):
+                if chunk == 0 or chunk in cached or not self._cache(arenas, memory, chunk, 'fast'):
+                    break
+                cached.add(chunk)
+                raw = memory.word(chunk + 16)
+                if raw is None:
+                    break
+                chunk = self._reveal(chunk + 16, raw)
+
+    def _walk_tcache(self, arenas, memory, addr, cached):
+        '''Walks the tcache stored into a chunk, if it is a tcache.'''
+        layout  = self._layout
+        segment = memory.find(addr)
+        data    = segment[1].obj
+        off     = addr + 16 - segment[0]
+        size    = TCACHE_MAX_BINS * layout.count_size
+        counts  = memoryview(data[off:off + size]).cast('H' if layout.count_size == 2 else 'B')
+        entries = data[off + size:off + size + TCACHE_MAX_BINS * 8]
+        if len(entries) != TCACHE_MAX_BINS * 8:
+            return
+        entries = memoryview(entries).cast('Q')
+        # the empty bins have no entry and the entries are chunks
+        for count, entry in zip(counts, entries):
+            if (count == 0) != (entry == 0) or entry % MALLOC_ALIGNMENT != 0 \
+               or (entry != 0 and memory.find(entry) is None):
+                return
+        for count, entry in zip(counts, entries):
+            for _ in range(min(count, MAX_CHAIN)):
+                chunk = entry - 16
+                if entry == 0 or chunk in cached or not self._cache(arenas, memory, chunk, 'tcache'):
+                    break
+                cached.add(chunk)
+                raw_next = memory.word(entry)
+                if raw_next is None:
+                    break
+                entry = self._reveal(entry, raw_next)
+
+    def walk(self, chunks=False):
+        '''Walks all the arenas.
+
+        Each arena structure is read, then each of its heap segments with one
+        read. The chunks, the bins, the fast bins and the tcache are parsed
+        from the read segments.
+
+        Parameters
+        ----------
+        chunks : bool, optional
+            If True, the chunks are listed into `Arena.chunks`.
+
+        Returns
+        -------
+        list of Arena
+            The arenas, `main_arena` first.
+        '''
+        process  = self._process
+        layout   = self._layout
+        maps_    = process.get_maps()
+        memory   = _Memory()
+        arenas   = []
+        states   = []
+        tcaches  = []
+        addr     = self.main_arena
+        while len(arenas) < MAX_ARENAS:
+            arena            = Arena(addr, addr == self.main_arena)
+            state            = self._read_arena(addr)
+            arena.top        = state[layout.top // 8]
+            arena.system_mem = state[layout.system_mem // 8]
+            if chunks:
+                arena.chunks = []
+            segments = self._segments(arena, state, maps_)
+            segment  = next(segments, None)
+            while segment is not None:
+                start, first, size = segment
+                words = memory.add(start, _read_segment(process, start, size), len(arenas))
+                if not arena.main:
+                    # the heap_info gives the used size of the heap
+                    words = words[:min(len(words), words[2] // 8)]
+                arena.heaps.append((start, start + 8 * len(words)))
+                tcaches.extend(self._walk_segment(arena, start, first, words))
+                try:
+                    segment = segments.send(words[1] if not arena.main else None)
+                except StopIteration:
+                    segment = None
+            arena.heaps.reverse()
+            arenas.append(arena)
+            states.append(state)
+            addr = state[layout.next // 8]
+            if addr == self.main_arena or addr == 0:
+                break
+        cached = set()
+        for arena, state in zip(arenas, states):
+            self._walk_bins(arena, state, memory)
+            self._walk_fastbins(arenas, state, memory, cached)
+        for addr in tcaches:
+            self._walk_tcache(arenas, memory, addr, cached)
+        if chunks:
+            for arena in arenas:
+                arena.chunks = [
+                    (addr, size, 'cached' if addr in cached else state)
+                    for addr, size, state in arena.chunks
+                ]
+        return arenas
+
+
+#############
+# Functions #
+#############
+
+def walk(process, chunks=False):
+    '''Walks the arenas of a process (see `HeapWalker.walk`).'''
+    return HeapWalker(process).walk(chunks)
+
+
+def summarize(arenas):
+    '''Sums the histograms of some arenas.
+
+    Returns
+    -------
+    HeapStats
+        The histograms of all the arenas.
+    '''
+    stats = HeapStats()
+    for arena in arenas:
+        stats += arena.stats
+    return stats
@@ -0,0 +1,254 @@
+
+'''Opt-in instrumentation of the ptrace, waitpid and memory transfer calls.
+
+When enabled, the following boundaries are wrapped:
+
+    - `Process._call_ptrace` (one counter per ptrace helper, e.g.
+      `ptrace.peekdata`),
+    - `Process._wait` and `Process._wait_thread`,
+    - `uio.read`, `uio.write`, `uio.readv` and `uio.writev`,
+    - `readmem.ProcMem._io` (the /proc/<pid>/mem transfers),
+    - the `__call__` method of every plugin.
+
+Each wrapped call updates the `Stat` of its name: number of calls, number of
+errors, bytes moved and a log2 histogram of its latency. When disabled, the
+original functions are put back: the instrumentation costs nothing.
+
+Examples
+--------
+>>> from deedee.proc import instrument
+>>> with instrument.enabled():
+>>>     loadlib(process, libc_path, lib_path)
+>>> for name, stat in instrument.snapshot().items():
+>>>     print(name, stat['calls'], stat['total_ns'])
+'''
+
+import contextlib
+import functools
+import time
+
+from .process          import Process
+from .libc             import uio
+from .plugins.plugin   import Plugin
+from .plugins.readmem  import ProcMem
+
+
+#############
+# Constants #
+#############
+
+# number of histogram buckets: bucket i counts the latencies in [2^(i-1), 2^i) ns
+NB_BUCKETS = 64
+
+# ptrace helpers moving one word
+_WORD_REQUESTS = {'peekdata', 'pokedata', 'peekuser', 'pokeuser'}
+
+
+###########
+# Classes #
+###########
+
+class Stat:
+    '''Stores the measures of one instrumented call.
+
+    Attributes
+    ----------
+    calls : int
+        The number of calls.
+    errors : int
+        The number of calls which failed (raised an exception or returned
+        an error).
+    bytes : int
+        The number of bytes moved (memory transfers only).
+    total_ns : int
+        The cumulated latency.
+    histogram : list of int
+        The number of calls whose latency is in [2^(i-1), 2^i) ns.
+    '''
+
+    __slots__ = ('calls', 'errors', 'bytes', 'total_ns', 'histogram')
+
+    def __init__(self):
+        self.calls     = 0
+        self.errors    = 0
+        self.bytes     = 0
+        self.total_ns  = 0
+        self.histogram = [0] * NB_BUCKETS
+
+    def add(self, elapsed, nbytes, error):
+        self.calls    += 1
+        self.errors   += error
+        self.bytes    += nbytes
+        self.total_ns += elapsed
+        self.histogram[min(elapsed.bit_length(), NB_BUCKETS - 1)] += 1
+
+    def to_dict(self):
+        '''Returns the measures as a dict (the histogram keys are the upper
+        bounds of the non empty buckets, in ns).'''
+        return {
+            'calls':     self.calls,
+            'errors':    self.errors,
+            'bytes':     self.bytes,
+            'total_ns':  self.total_ns,
+            'histogram': {1 << i: n for i, n in enumerate(self.histogram) if n != 0}
+        }
+
+
+###########
+# Globals #
+###########
+
+# name -> Stat
+_stats   = {}
+_hooks   = []
+# (owner, attribute name, original value) of the wrapped functions
+_patched = []
+_enabled = False
+
+
+###########
+# Helpers #
+###########
+
+def _record(name, elapsed, nbytes, error):
+    stat = _stats.get(name)
+    if stat is None:
+        stat = _stats[name] = Stat()
+    stat.add(elapsed, nbytes, error)
+    for hook in _hooks:
+        hook(name, elapsed, nbytes, error)
+
+
+def _wrap(fct, name_of, bytes_of, failed):
+    '''Returns fct wrapped into a function measuring each call.
+
+    name_of is called with the call arguments, bytes_of with the arguments
+    and the result, failed with the result (for the calls returning their
+    errors instead of raising them).
+    '''
+    @functools.wraps(fct)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            result = fct(*args, **kwargs)
+        except BaseException:
+            _record(name_of(args), time.perf_counter_ns() - start, 0, True)
+            raise
+        elapsed = time.perf_counter_ns() - start
+        _record(name_of(args), elapsed, bytes_of(args, result), failed(result))
+        return result
+    return wrapper
+
+
+def _patch(owner, attr, name_of, bytes_of=lambda args, result: 0, failed=lambda result: False):
+    original = owner.__dict__[attr]
+    _patched.append((owner, attr, original))
+    setattr(owner, attr, _wrap(original, name_of, bytes_of, failed))
+
+
+def _ptrace_name(args):
+    return f'ptrace.{args[1].__name__}'
+
+
+def _ptrace_bytes(args, result):
+    return 8 if args[1].__name__ in _WORD_REQUESTS else 0
+
+
+def _uio_bytes(args, result):
+    return max(result, 0)
+
+
+def _patch_plugin(cls):
+    '''Wraps the `__call__` method of a plugin class (if it defines one).'''
+    if '__call__' in cls.__dict__:
+        name = f'plugin.{cls.__module__.rsplit(".", 1)[-1]}.{cls.__name__}'
+        _patch(cls, '__call__', lambda args: name)
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+#############
+# Functions #
+#############
+
+def enable():
+    '''Wraps all the instrumented calls (does nothing if already enabled).'''
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    _patch(Process, '_call_ptrace', _ptrace_name, _ptrace_bytes)
+    _patch(Process, '_wait', lambda args: 'wait')
+    _patch(Process, '_wait_thread', lambda args: 'wait_thread')
+    for fct in ('read', 'write', 'readv', 'writev'):
+        _patch(uio, fct, lambda args, fct=fct: f'uio.{fct}', _uio_bytes, lambda result: result < 0)
+    _patch(
+        ProcMem,
+        '_io',
+        lambda args: f'procmem.{args[2].__name__}',
+        lambda args, result: result
+    )
+    for cls in _subclasses(Plugin):
+        _patch_plugin(cls)
+    # the plugins defined later are wrapped when created
+    Plugin._on_subclass = _patch_plugin
+
+
+def disable():
+    '''Puts back the original functions. The stats are kept.'''
+    global _enabled
+    _enabled            = False
+    Plugin._on_subclass = None
+    while len(_patched) != 0:
+        owner, attr, original = _patched.pop()
+        setattr(owner, attr, original)
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextlib.contextmanager
+def enabled():
+    '''Contextmanager enabling the instrumentation.'''
+    was_enabled = _enabled
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+
+
+def add_hook(hook):
+    '''Registers a callable called after each instrumented call.
+
+    It is called with the name of the call, its latency (ns), the number of
+    moved bytes and a bool set if the call failed. It allows to
+    forward the measures to a metrics system.
+    '''
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def snapshot():
+    '''Returns a copy of all the stats.
+
+    Returns
+    -------
+    dict
+        The name of each instrumented call and its `Stat.to_dict`.
+    '''
+    return {name: stat.to_dict() for name, stat in sorted(_stats.items())}
+
+
+def reset():
+    '''Clears all the stats.'''
+    _stats.clear()
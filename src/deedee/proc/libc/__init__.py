@@ -1,4 +1,5 @@
 
+from . import lib
 from . import ptrace
 from . import uio
 
@@ -0,0 +1,96 @@
+
+'''The libc binding shared by the ctypes wrappers.
+
+The library is loaded on the first call to one of its functions, with
+`use_errno=True` (so `ctypes.get_errno` is meaningful after each call). It is
+opened as `libc.so.6` directly: `ctypes.util.find_library`, which may spawn
+`ldconfig` or `gcc`, is only used if it fails.
+'''
+
+import ctypes
+
+
+__all__ = ['LazyLibrary', 'libc']
+
+
+###########
+# Classes #
+###########
+
+class LazyLibrary:
+    '''A `ctypes.CDLL` loaded on the first access to one of its functions.
+
+    The prototypes declared with `prototype` are applied to the functions
+    when they are first accessed. A function is then stored as an attribute
+    of the instance: the next accesses are plain attribute lookups.
+
+    Examples
+    --------
+    >>> libc = LazyLibrary('libc.so.6', 'c')
+    >>> libc.prototype('getpid', ctypes.c_int, [])
+    >>> libc.getpid()
+    '''
+
+    def __init__(self, soname, name, use_errno=True):
+        '''
+        Parameters
+        ----------
+        soname : str
+            The name given to `dlopen` first (e.g. 'libc.so.6').
+        name : str
+            The name given to `ctypes.util.find_library` if `dlopen` fails
+            (e.g. 'c').
+        use_errno : bool, optional
+            Passed to `ctypes.CDLL`.
+        '''
+        self._soname     = soname
+        self._name       = name
+        self._use_errno  = use_errno
+        self._dll        = None
+        self._prototypes = {}
+
+    @property
+    def dll(self):
+        '''The underlying `ctypes.CDLL` (loaded if needed).
+
+        Raises
+        ------
+        OSError
+            If the library can be found neither by its soname nor by
+            `ctypes.util.find_library`.
+        '''
+        if self._dll is None:
+            try:
+                self._dll = ctypes.CDLL(self._soname, use_errno=self._use_errno)
+            except OSError:
+                # ctypes.util is slow to import: only imported here
+                from ctypes import util
+                path = util.find_library(self._name)
+                if path is None:
+                    raise
+                self._dll = ctypes.CDLL(path, use_errno=self._use_errno)
+        return self._dll
+
+    def prototype(self, name, restype, argtypes=None):
+        '''Declares the return type and the argument types of a function.'''
+        self._prototypes[name] = (restype, argtypes)
+        self.__dict__.pop(name, None)
+
+    def __getattr__(self, name):
+        # only called for the functions not accessed yet
+        if name.startswith('_'):
+            raise AttributeError(name)
+        fct = getattr(self.dll, name)
+        if name in self._prototypes:
+            fct.restype, argtypes = self._prototypes[name]
+            if argtypes is not None:
+                fct.argtypes = argtypes
+        setattr(self, name, fct)
+        return fct
+
+
+#############
+# Instances #
+#############
+
+libc = LazyLibrary('libc.so.6', 'c')
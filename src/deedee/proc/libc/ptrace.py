@@ -1,11 +1,15 @@
 
 from ctypes import *
-from ctypes import util
+
+from .lib import libc
+from .uio import IOVec
 
 
 _all__ = [
-    'UserRegsStruct', 'attach', 'detach', 'getregs', 'setregs',
-    'peekdata', 'pokedata', 'singlestep', 'cont'
+    'UserRegsStruct', 'UserFpregsStruct', 'User', 'attach', 'detach',
+    'getregs', 'setregs', 'peekdata', 'pokedata', 'peekuser', 'pokeuser',
+    'singlestep', 'cont', 'cont_syscall', 'setoptions', 'geteventmsg',
+    'getregset', 'setregset', 'RegSet', 'tgkill'
 ]
 
 
@@ -14,16 +18,47 @@ _all__ = [
 #############
 
 # __ptrace_request
-PTRACE_PEEKTEXT   = 1
-PTRACE_PEEKDATA   = 2
-PTRACE_POKETEXT   = 4
-PTRACE_POKEDATA   = 5
-PTRACE_CONT       = 7
-PTRACE_SINGLESTEP = 9
-PTRACE_GETREGS    = 12
-PTRACE_SETREGS    = 13
-PTRACE_ATTACH     = 16
-PTRACE_DETACH     = 17
+PTRACE_PEEKTEXT    = 1
+PTRACE_PEEKDATA    = 2
+PTRACE_PEEKUSER    = 3
+PTRACE_POKETEXT    = 4
+PTRACE_POKEDATA    = 5
+PTRACE_POKEUSER    = 6
+PTRACE_CONT        = 7
+PTRACE_SINGLESTEP  = 9
+PTRACE_GETREGS     = 12
+PTRACE_SETREGS     = 13
+PTRACE_ATTACH      = 16
+PTRACE_DETACH      = 17
+PTRACE_SYSCALL     = 24
+PTRACE_SETOPTIONS  = 0x4200
+PTRACE_GETEVENTMSG = 0x4201
+PTRACE_GETREGSET   = 0x4204
+PTRACE_SETREGSET   = 0x4205
+
+# PTRACE_GETREGSET/PTRACE_SETREGSET register sets (elf.h note types)
+NT_PRSTATUS   = 1
+NT_PRFPREG    = 2
+NT_X86_XSTATE = 0x202
+
+# the XSAVE area size depends on the CPU features (about 2.7 KiB with
+# AVX-512, 11 KiB with AMX): the kernel gives the size it filled
+XSTATE_MAX_SIZE = 16384
+
+# PTRACE_SETOPTIONS options
+PTRACE_O_TRACESYSGOOD = 0x01
+PTRACE_O_TRACECLONE   = 0x08
+PTRACE_O_TRACESECCOMP = 0x80
+
+# events (status >> 16)
+PTRACE_EVENT_CLONE   = 3
+PTRACE_EVENT_SECCOMP = 7
+
+# waitpid option allowing to wait for any kind of child (threads included)
+WALL = 0x40000000
+
+# syscall numbers
+SYS_TGKILL = 234
 
 
 ###########
@@ -62,19 +97,99 @@ class UserRegsStruct(Structure):
     ]
 
 
+class UserFpregsStruct(Structure):
+    _fields_ = [
+        ('cwd',       c_ushort),
+        ('swd',       c_ushort),
+        ('ftw',       c_ushort),
+        ('fop',       c_ushort),
+        ('rip',       c_ulonglong),
+        ('rdp',       c_ulonglong),
+        ('mxcsr',     c_uint),
+        ('mxcr_mask', c_uint),
+        ('st_space',  c_uint * 32),
+        ('xmm_space', c_uint * 64),
+        ('padding',   c_uint * 24)
+    ]
+
+
+class User(Structure):
+    '''The `struct user` whose fields are accessed by PEEKUSER/POKEUSER.'''
+    _fields_ = [
+        ('regs',        UserRegsStruct),
+        ('u_fpvalid',   c_int),
+        ('i387',        UserFpregsStruct),
+        ('u_tsize',     c_ulonglong),
+        ('u_dsize',     c_ulonglong),
+        ('u_ssize',     c_ulonglong),
+        ('start_code',  c_ulonglong),
+        ('start_stack', c_ulonglong),
+        ('signal',      c_longlong),
+        ('reserved',    c_int),
+        ('u_ar0',       c_void_p),
+        ('u_fpstate',   c_void_p),
+        ('magic',       c_ulonglong),
+        ('u_comm',      c_char * 32),
+        ('u_debugreg',  c_ulonglong * 8)
+    ]
+
+
+# offsetof(struct user, u_debugreg)
+DEBUGREG_OFFSET = User.u_debugreg.offset
+
+
+class RegSet:
+    '''A preallocated buffer and its iovec for PTRACE_GETREGSET and
+    PTRACE_SETREGSET.
+
+    The buffer is a UserRegsStruct for NT_PRSTATUS, a UserFpregsStruct for
+    NT_PRFPREG and a byte array for the other sets (e.g. NT_X86_XSTATE).
+    '''
+
+    def __init__(self, type_=NT_PRSTATUS, size=None):
+        '''
+        Parameters
+        ----------
+        type_ : int
+            The register set (NT_PRSTATUS, NT_PRFPREG, NT_X86_XSTATE, etc.).
+        size : int, optional
+            The size of the buffer of the sets without structure
+            (XSTATE_MAX_SIZE by default).
+        '''
+        self.type_ = type_
+        if type_ == NT_PRSTATUS:
+            self.buffer = UserRegsStruct()
+        elif type_ == NT_PRFPREG:
+            self.buffer = UserFpregsStruct()
+        else:
+            self.buffer = (c_ubyte * (size or XSTATE_MAX_SIZE))()
+        self.iov = IOVec(addressof(self.buffer), sizeof(self.buffer))
+
+    def reset(self):
+        '''Gives the whole buffer to the next request.'''
+        self.iov.iov_len = sizeof(self.buffer)
+
+    @property
+    def size(self):
+        '''The size of the set (filled by the kernel on a get).'''
+        return self.iov.iov_len
+
+    @property
+    def data(self):
+        '''The content of the set (a view of the buffer).'''
+        return memoryview(self.buffer).cast('B')[:self.iov.iov_len]
+
+
 ##########
 # Ctypes #
 ##########
 
-path = util.find_library('c')
-libc = CDLL(path)
-libc.ptrace.restype  = c_uint64
-libc.ptrace.argtypes = [
+libc.prototype('ptrace', c_uint64, [
     c_uint64,
     c_uint64,
     c_void_p,
     c_void_p
-]
+])
 
 
 ###########
@@ -101,9 +216,34 @@ def pokedata(pid, addr, value):
     addr = c_void_p(addr)
     return libc.ptrace(PTRACE_POKEDATA, pid, addr, value)
 
-def singlestep(pid):
-    return libc.ptrace(PTRACE_SINGLESTEP, pid, None, None)
+def peekuser(pid, offset):
+    offset = c_void_p(offset)
+    return libc.ptrace(PTRACE_PEEKUSER, pid, offset, None)
+
+def pokeuser(pid, offset, value):
+    offset = c_void_p(offset)
+    return libc.ptrace(PTRACE_POKEUSER, pid, offset, value)
+
+def singlestep(pid, sig=0):
+    return libc.ptrace(PTRACE_SINGLESTEP, pid, None, sig)
+
+def cont(pid, sig=0):
+    return libc.ptrace(PTRACE_CONT, pid, None, sig)
+
+def cont_syscall(pid, sig=0):
+    return libc.ptrace(PTRACE_SYSCALL, pid, None, sig)
+
+def setoptions(pid, options):
+    return libc.ptrace(PTRACE_SETOPTIONS, pid, None, options)
+
+def geteventmsg(pid, msg):
+    return libc.ptrace(PTRACE_GETEVENTMSG, pid, None, byref(msg))
+
+def getregset(pid, type_, iov):
+    return libc.ptrace(PTRACE_GETREGSET, pid, type_, byref(iov))
 
-def cont(pid):
-    return libc.ptrace(PTRACE_CONT, pid, None, None)
+def setregset(pid, type_, iov):
+    return libc.ptrace(PTRACE_SETREGSET, pid, type_, byref(iov))
 
+def tgkill(pid, tid, sig):
+    return libc.syscall(SYS_TGKILL, pid, tid, sig)
@@ -1,9 +1,18 @@
 
 from ctypes import *
-from ctypes import util
 
+from .lib import libc
 
-__all__ = ['IOVec', 'read', 'write', 'iovec']
+
+__all__ = ['IOVec', 'IOV_MAX', 'read', 'write', 'readv', 'writev', 'iovec']
+
+
+#############
+# Constants #
+#############
+
+# maximum number of iovec elements accepted by one process_vm_[readv|writev]
+IOV_MAX = 1024
 
 
 ###########
@@ -21,23 +30,9 @@ class IOVec(Structure):
 # Ctypes #
 ##########
 
-path = util.find_library('c')
-libc = CDLL(path)
-
-# process_vm_readv
-libc.process_vm_readv.restype = c_ssize_t
-libc.process_vm_readv.argtype = [
-    c_uint64,
-    POINTER(IOVec),
-    c_ulong,
-    POINTER(IOVec),
-    c_ulong,
-    c_ulong
-]
-
-# process_vm_writev
-libc.process_vm_writev.restype = libc.process_vm_readv.restype
-libc.process_vm_writev.argtype = libc.process_vm_readv.argtype
+# process_vm_readv / process_vm_writev
+libc.prototype('process_vm_readv',  c_ssize_t)
+libc.prototype('process_vm_writev', c_ssize_t)
 
 
 ###########
@@ -50,6 +45,18 @@ def read(pid, local_iov, remote_iov):
 def write(pid, local_iov, remote_iov):
     return libc.process_vm_writev(pid, byref(local_iov), 1, byref(remote_iov), 1, 0)
 
+def readv(pid, local_iovs, remote_iovs):
+    '''Scatter read: `local_iovs` and `remote_iovs` are IOVec arrays.'''
+    return libc.process_vm_readv(
+        pid, local_iovs, len(local_iovs), remote_iovs, len(remote_iovs), 0
+    )
+
+def writev(pid, local_iovs, remote_iovs):
+    '''Gather write: `local_iovs` and `remote_iovs` are IOVec arrays.'''
+    return libc.process_vm_writev(
+        pid, local_iovs, len(local_iovs), remote_iovs, len(remote_iovs), 0
+    )
+
 def iovec(base, size):
     return IOVec(cast(base, c_void_p), size)
 
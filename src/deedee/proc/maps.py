@@ -10,7 +10,7 @@ from dataclasses import dataclass
 
 # allows to parse proc maps files
 _RE_MAPS = re.compile(
-    r'^([0-9a-f]+)-([0-9a-f]+) ([rwxsp-]{4}) ([0-9a-f]+) ([^ ]+) (\d+)\s*([^ $]*?)$',
+    r'^([0-9a-f]+)-([0-9a-f]+) ([rwxsp-]{4}) ([0-9a-f]+) ([^ ]+) (\d+)[ \t]*([^\n]*?)$',
     flags=re.MULTILINE
 )
 
@@ -65,8 +65,21 @@ def get_maps(pid, filter_=None):
     maps_path = f'/proc/{pid}/maps'
     with open(maps_path, 'r') as f:
         maps = f.read()
+    return parse_maps(maps, filter_)
+
+
+def parse_maps(text, filter_=None):
+    '''Parses the content of a maps file.
+
+    Parameters
+    ----------
+    text : str
+        The content of a proc maps file.
+    filter_ : callable, optional
+        See `get_maps`.
+    '''
     regions = []
-    for m in _RE_MAPS.findall(maps):
+    for m in _RE_MAPS.findall(text):
         start_address = int(m[0], 16)
         end_address    = int(m[1], 16)
         size          = end_address - start_address
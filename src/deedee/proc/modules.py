@@ -0,0 +1,236 @@
+
+'''Groups the file-backed mappings of a process into loaded modules.'''
+
+import bisect
+import os
+import struct
+
+from dataclasses import dataclass, field
+
+from .elf  import ElfFile, ElfException
+from .maps import parse_maps
+
+
+###########
+# Classes #
+###########
+
+@dataclass
+class Module:
+    '''Stores the information of a loaded file (executable, library, etc.).
+
+    Attributes
+    ----------
+    path : str
+        The path of the file.
+    dev : str
+        The device of the file.
+    inode : str
+        The inode of the file.
+    base : int
+        The address of the first mapping (the one of offset 0).
+    end : int
+        The end address of the last mapping.
+    text : list of (int, int)
+        The (start, end) of the executable mappings.
+    data : list of (int, int)
+        The (start, end) of the writable mappings.
+    mappings : list of maps.Mapping
+        All the mappings of the file.
+    build_id : str
+        The GNU build-id of the file (None if it has none or if it is not an
+        ELF file).
+    '''
+    path     : str
+    dev      : str
+    inode    : str
+    base     : int
+    end      : int
+    text     : list = field(default_factory=list)
+    data     : list = field(default_factory=list)
+    mappings : list = field(default_factory=list)
+    build_id : str  = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def __contains__(self, addr):
+        return any(m.start_address <= addr < m.end_address for m in self.mappings)
+
+
+class ModuleTable:
+    '''The modules of a process, indexed by path, basename and build-id.
+
+    `refresh` only builds the modules which appeared since the last refresh:
+    the others (and their build-id) are reused. Before each lookup by key,
+    the maps file is read again and compared to the one the table was built
+    from: the table is only refreshed when the mappings changed (e.g. after
+    a `dlclose`/`dlopen` done by the process itself).
+
+    Examples
+    --------
+    >>> libc = process.modules().get('libc.so.6')
+    >>> hex(libc.base), libc.build_id
+    '''
+
+    def __init__(self, pid, maps_=None):
+        '''
+        Parameters
+        ----------
+        pid : int
+            The pid of the process.
+        maps_ : list of maps.Mapping, optional
+            The current mappings of the process (read if not given).
+        '''
+        self._pid       = pid
+        self._modules   = []
+        self._by_path   = {}
+        self._by_name   = {}
+        self._by_id     = {}
+        # base addresses of the modules (sorted)
+        self._bases     = []
+        # content of the maps file the table was built from
+        self._text      = None
+        # (path, dev, inode) -> build-id
+        self._build_ids = {}
+        self.refresh(maps_)
+
+    def __iter__(self):
+        return iter(self._modules)
+
+    def __len__(self):
+        return len(self._modules)
+
+    def _build_id(self, path, dev, inode):
+        key = (path, dev, inode)
+        if key not in self._build_ids:
+            build_id = None
+            try:
+                elf = ElfFile(f'/proc/{self._pid}/root{path}')
+            except (OSError, ValueError, struct.error, ElfException):
+                pass
+            else:
+                try:
+                    build_id = elf.build_id()
+                except (ValueError, struct.error, ElfException):
+                    pass
+                elf.close()
+            self._build_ids[key] = build_id
+        return self._build_ids[key]
+
+    def _read_maps(self):
+        with open(f'/proc/{self._pid}/maps', 'r') as f:
+            return f.read()
+
+    def refresh(self, maps_=None):
+        '''Updates the table from the current mappings of the process.
+
+        Parameters
+        ----------
+        maps_ : list of maps.Mapping, optional
+            The current mappings of the process (read if not given).
+        '''
+        if maps_ is None:
+            self._text = self._read_maps()
+            maps_      = parse_maps(self._text)
+        else:
+            self._text = None
+        self._update(maps_)
+
+    def _update(self, maps_):
+        old     = {(m.path, m.inode, m.base): m for m in self._modules}
+        groups  = []
+        for mapping in sorted(maps_, key=lambda m: m.start_address):
+            path = mapping.pathname
+            if not path.startswith('/') or mapping.inode == '0':
+                continue
+            last = groups[-1] if len(groups) != 0 else None
+            # a new module starts at each offset 0 mapping
+            if last is None or last[-1].pathname != path or mapping.offset == 0 \
+               or last[-1].inode != mapping.inode:
+                groups.append([mapping])
+            else:
+                last.append(mapping)
+        modules = []
+        for group in groups:
+            first  = group[0]
+            module = old.get((first.pathname, first.inode, first.start_address))
+            if module is None:
+                module = Module(
+                    first.pathname,
+                    first.dev,
+                    first.inode,
+                    first.start_address,
+                    0,
+                    build_id=self._build_id(first.pathname, first.dev, first.inode)
+                )
+            module.end      = group[-1].end_address
+            module.mappings = group
+            module.text     = [(m.start_address, m.end_address) for m in group if 'x' in m.perms]
+            module.data     = [(m.start_address, m.end_address) for m in group if 'w' in m.perms]
+            modules.append(module)
+        self._modules = modules
+        self._bases   = [module.base for module in modules]
+        self._by_path = {}
+        self._by_name = {}
+        self._by_id   = {}
+        # the first loaded module wins
+        for module in reversed(modules):
+            self._by_path[module.path] = module
+            self._by_name[module.name] = module
+            if module.build_id is not None:
+                self._by_id[module.build_id] = module
+
+    def _check(self):
+        '''Refreshes the table if the mappings changed since it was built.'''
+        text = self._read_maps()
+        if text != self._text:
+            self._text = text
+            self._update(parse_maps(text))
+
+    def _lookup(self, indexes, key):
+        self._check()
+        for index in indexes:
+            module = getattr(self, index).get(key)
+            if module is not None:
+                return module
+        return None
+
+    def by_path(self, path):
+        '''Returns the module loaded from path (or None).'''
+        return self._lookup(['_by_path'], path)
+
+    def by_name(self, name):
+        '''Returns the module whose basename is name (or None).'''
+        return self._lookup(['_by_name'], name)
+
+    def by_build_id(self, build_id):
+        '''Returns the module of a build-id (hex string, or None).'''
+        return self._lookup(['_by_id'], build_id)
+
+    def get(self, key):
+        '''Returns the module of a path, a basename or a build-id (or None).
+
+        A path which is not found is also looked up by its real path (e.g.
+        /lib/... instead of /usr/lib/...) and by its basename.
+        '''
+        module = self._lookup(['_by_path', '_by_name', '_by_id'], key)
+        if module is None and '/' in key:
+            module = self._by_path.get(os.path.realpath(key)) \
+                  or self._by_name.get(os.path.basename(key))
+        return module
+
+    def find(self, addr):
+        '''Returns the module containing addr (or None).
+
+        Contrary to the lookups by key, the mappings are not checked again:
+        call `refresh` first if they may have changed.
+        '''
+        i = bisect.bisect_right(self._bases, addr) - 1
+        if i < 0:
+            return None
+        module = self._modules[i]
+        if addr < module.end and addr in module:
+            return module
+        return None
@@ -0,0 +1,347 @@
+
+'''Reads the pagemap of a process and manages its soft-dirty bits.
+
+Each page of a process is described into `/proc/<pid>/pagemap` by a 64 bits
+entry (see the kernel documentation, admin-guide/mm/pagemap.rst):
+
+    - bit 63: the page is present into the RAM;
+    - bit 62: the page is swapped;
+    - bit 61: the page is file-backed or shared anonymous;
+    - bit 56: the page is exclusively mapped;
+    - bit 55: the page is soft-dirty (written since the last clear);
+    - bits 0-54: the page frame number (only visible with CAP_SYS_ADMIN).
+
+The analysis of the pages (`analyze`, `summarize`) requires numpy.
+'''
+
+import ctypes
+import mmap
+import os
+
+from array       import array
+from dataclasses import dataclass
+
+from .maps    import Mapping, get_maps
+from .modules import ModuleTable
+
+
+#############
+# Constants #
+#############
+
+PAGE_SIZE = 4096
+
+PM_PRESENT    = 1 << 63
+PM_SWAP       = 1 << 62
+PM_FILE       = 1 << 61
+PM_EXCLUSIVE  = 1 << 56
+PM_SOFT_DIRTY = 1 << 55
+PM_PFN_MASK   = (1 << 55) - 1
+
+# value written into clear_refs to clear the soft-dirty bits
+CLEAR_SOFT_DIRTY = b'4'
+
+
+#############
+# Functions #
+#############
+
+def read_pagemap(pid, start, end):
+    '''Reads the pagemap entries of the pages between two addresses.
+
+    Parameters
+    ----------
+    pid : int
+        The pid of the process.
+    start : int
+        The start address (rounded down to the page size).
+    end : int
+        The end address (rounded up to the page size).
+
+    Returns
+    -------
+    array.array
+        The entry (unsigned 64 bits) of each page.
+    '''
+    first   = start // PAGE_SIZE
+    last    = (end + PAGE_SIZE - 1) // PAGE_SIZE
+    entries = array('Q')
+    fd      = os.open(f'/proc/{pid}/pagemap', os.O_RDONLY)
+    try:
+        data = os.pread(fd, (last - first) * 8, first * 8)
+    finally:
+        os.close(fd)
+    entries.frombytes(data[:len(data) & ~7])
+    return entries
+
+
+def clear_soft_dirty(pid):
+    '''Clears the soft-dirty bits of all the pages of a process.'''
+    with open(f'/proc/{pid}/clear_refs', 'wb') as f:
+        f.write(CLEAR_SOFT_DIRTY)
+
+
+_soft_dirty = None
+
+def soft_dirty_supported():
+    '''Returns True if the kernel tracks the soft-dirty bits.
+
+    A page written for the first time is soft-dirty if the kernel is built
+    with CONFIG_MEM_SOFT_DIRTY: this is checked once on a page of the
+    current process.
+    '''
+    global _soft_dirty
+    if _soft_dirty is None:
+        page    = mmap.mmap(-1, PAGE_SIZE)
+        page[0] = 1
+        # the ctypes object is dropped at once: the mapping can be closed
+        addr    = ctypes.addressof(ctypes.c_char.from_buffer(page))
+        entries = read_pagemap(os.getpid(), addr, addr + PAGE_SIZE)
+        page.close()
+        _soft_dirty = len(entries) == 1 and bool(entries[0] & PM_SOFT_DIRTY)
+    return _soft_dirty
+
+
+############
+# Analysis #
+############
+
+# number of entries read by each pread (8 MiB of entries, 4 GiB of space); a
+# multiple of 8 so that the bitmaps of the chunks can be concatenated
+CHUNK_PAGES = 1024 * 1024
+
+
+@dataclass
+class PageStats:
+    '''Counts the pages of a space by state.
+
+    Attributes
+    ----------
+    pages : int
+        The number of pages of the space.
+    present : int
+        The number of pages into the RAM.
+    swapped : int
+        The number of swapped pages.
+    file : int
+        The number of file-backed or shared anonymous pages.
+    exclusive : int
+        The number of pages mapped only once.
+    soft_dirty : int
+        The number of soft-dirty pages.
+    '''
+    pages      : int = 0
+    present    : int = 0
+    swapped    : int = 0
+    file       : int = 0
+    exclusive  : int = 0
+    soft_dirty : int = 0
+
+    def __iadd__(self, other):
+        for name in ('pages', 'present', 'swapped', 'file', 'exclusive', 'soft_dirty'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    @property
+    def rss(self):
+        '''The resident size (in bytes).'''
+        return self.present * PAGE_SIZE
+
+    @property
+    def swap(self):
+        '''The swapped size (in bytes).'''
+        return self.swapped * PAGE_SIZE
+
+
+@dataclass
+class MappingPages:
+    '''The state of the pages of a mapping.
+
+    The bitmaps hold one bit per page (`numpy.packbits` with the little bit
+    order: the page i is the bit i % 8 of the byte i // 8).
+
+    Attributes
+    ----------
+    mapping : maps.Mapping
+        The mapping.
+    stats : PageStats
+        The page counts.
+    present : numpy.ndarray
+        The bitmap of the pages into the RAM (None if not computed).
+    swapped : numpy.ndarray
+        The bitmap of the swapped pages (None if not computed).
+    exclusive : numpy.ndarray
+        The bitmap of the pages mapped only once (None if not computed).
+    '''
+    mapping   : Mapping
+    stats     : PageStats
+    present   : object
+    swapped   : object
+    exclusive : object
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('the pagemap analysis requires numpy') from None
+    return numpy
+
+
+def read_entries(fd, start, end, chunk=CHUNK_PAGES):
+    '''Reads the pagemap entries of a space into a numpy array.
+
+    The entries are read directly into the array, by chunks of `chunk`
+    entries (one `preadv` each). The entries which can not be read (e.g. for
+    [vsyscall]) are 0.
+
+    Parameters
+    ----------
+    fd : int
+        A file descriptor of a pagemap file.
+    start : int
+        The start address (rounded down to the page size).
+    end : int
+        The end address (rounded up to the page size).
+    chunk : int, optional
+        The max number of entries read by each call.
+
+    Returns
+    -------
+    numpy.ndarray
+        The entries (uint64).
+    '''
+    numpy   = _numpy()
+    first   = start // PAGE_SIZE
+    count   = (end + PAGE_SIZE - 1) // PAGE_SIZE - first
+    entries = numpy.zeros(count, dtype='<u8')
+    raw     = memoryview(entries).cast('B')
+    for i in range(0, count, chunk):
+        n = min(chunk, count - i)
+        try:
+            os.preadv(fd, [raw[i * 8:(i + n) * 8]], (first + i) * 8)
+        except OSError:
+            break
+    return entries
+
+
+def _iter_entries(fd, start, end, chunk):
+    '''Yields the pagemap entries of a space by chunks of `chunk` entries.
+
+    The chunks are views of one reused array: they must be reduced before
+    reading the next one.
+    '''
+    numpy  = _numpy()
+    first  = start // PAGE_SIZE
+    count  = (end + PAGE_SIZE - 1) // PAGE_SIZE - first
+    buf    = numpy.zeros(min(chunk, count), dtype='<u8')
+    raw    = memoryview(buf).cast('B')
+    failed = False
+    for i in range(0, count, chunk):
+        n = min(chunk, count - i)
+        if failed:
+            buf[:n] = 0
+        else:
+            try:
+                done = os.preadv(fd, [raw[:n * 8]], (first + i) * 8)
+            except OSError:
+                done, failed = 0, True
+            buf[done // 8:n] = 0
+        yield buf[:n]
+
+
+def analyze(pid, maps_=None, filter_=None, bitmaps=True, chunk=CHUNK_PAGES):
+    '''Reads the state of the pages of the mappings of a process.
+
+    The entries are read and reduced (counted, packed into bitmaps) by
+    chunks: the memory used does not depend on the size of the mappings
+    but on the bitmaps (one bit per page), which can be disabled for the
+    processes reserving huge address spaces.
+
+    Parameters
+    ----------
+    pid : int
+        The pid of the process.
+    maps_ : list of maps.Mapping, optional
+        The mappings to analyze (all the mappings of the process if not
+        given).
+    filter_ : callable, optional
+        If defined, only the mappings for which it returns True are
+        analyzed.
+    bitmaps : bool, optional
+        If False, only the page counts are computed (the bitmaps of the
+        results are None).
+    chunk : int, optional
+        The number of entries read and reduced at once (a multiple of 8).
+
+    Returns
+    -------
+    list of MappingPages
+        The state of the pages of each mapping.
+
+    Raises
+    ------
+    ImportError
+        If numpy is not installed.
+    ValueError
+        If chunk is not a positive multiple of 8.
+
+    Examples
+    --------
+    >>> for result in analyze(pid, filter_=lambda m: m.pathname == '[heap]'):
+    >>>     print(result.stats.rss, result.stats.swap)
+    '''
+    if chunk <= 0 or chunk % 8 != 0:
+        raise ValueError('chunk must be a positive multiple of 8')
+    numpy   = _numpy()
+    maps_   = get_maps(pid) if maps_ is None else maps_
+    names   = (('present', 63), ('swapped', 62), ('file', 61),
+               ('exclusive', 56), ('soft_dirty', 55))
+    packed  = ('present', 'swapped', 'exclusive')
+    results = []
+    fd      = os.open(f'/proc/{pid}/pagemap', os.O_RDONLY)
+    try:
+        for mapping in maps_:
+            if filter_ is not None and not filter_(mapping):
+                continue
+            stats = PageStats()
+            parts = {name: [] for name in packed}
+            for entries in _iter_entries(fd, mapping.start_address, mapping.end_address, chunk):
+                flags        = (entries >> 55).astype(numpy.uint16)
+                stats.pages += len(entries)
+                for name, bit in names:
+                    bitmap = (flags & (1 << (bit - 55))) != 0
+                    setattr(stats, name, getattr(stats, name) + int(numpy.count_nonzero(bitmap)))
+                    if bitmaps and name in packed:
+                        parts[name].append(numpy.packbits(bitmap, bitorder='little'))
+            results.append(MappingPages(mapping, stats, *(
+                numpy.concatenate(parts[name]) if bitmaps else None for name in packed
+            )))
+    finally:
+        os.close(fd)
+    return results
+
+
+def summarize(pid, results):
+    '''Sums the page counts by module.
+
+    The file-backed mappings are grouped by loaded module (see
+    `modules.ModuleTable`), the other ones by pathname ('[heap]',
+    '[stack]', etc.) or into '[anon]'.
+
+    Returns
+    -------
+    dict
+        The PageStats of each module path or group name.
+    '''
+    table   = ModuleTable(pid, [result.mapping for result in results])
+    summary = {}
+    for result in results:
+        module = table.find(result.mapping.start_address)
+        if module is not None:
+            name = module.path
+        else:
+            name = result.mapping.pathname or '[anon]'
+        summary.setdefault(name, PageStats())
+        summary[name] += result.stats
+    return summary
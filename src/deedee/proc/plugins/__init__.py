@@ -1,10 +1,34 @@
 
+'''The plugins, each one into its own module.
+
+The modules are imported on their first access (e.g. `plugins.syscall`): the
+import of `deedee.proc` does not pay for the plugins which are not used.
+'''
+
+import importlib
+
 from .plugin import Plugin
 
-from . import getsym
-from . import call
-from . import syscall
-from . import loadlib
-from . import unloadlib
-from . import readmem
 
+PLUGINS = [
+    'getsym',
+    'call',
+    'syscall',
+    'loadlib',
+    'unloadlib',
+    'readmem',
+    'systrace',
+    'alloc',
+    'memfd'
+]
+
+
+def __getattr__(name):
+    if name in PLUGINS:
+        # the import stores the module into the package namespace
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(PLUGINS))
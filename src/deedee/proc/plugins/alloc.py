@@ -0,0 +1,163 @@
+
+'''Defines some strategies to allocate memory into a process.'''
+
+from .plugin  import Plugin
+from .syscall import Syscalls
+
+
+# mmap prot constants
+PROT_READ  = 1
+PROT_WRITE = 2
+
+# mmap flags constants
+MAP_PRIVATE   = 0x02
+MAP_ANONYMOUS = 0x20
+
+PAGE_SIZE = 4096
+
+# the smallest and the biggest size classes
+MIN_CLASS = 16
+MAX_CLASS = 64 * 1024
+
+
+class _Arenas:
+    '''Stores the allocator state of one process.'''
+
+    def __init__(self):
+        # (addr, size) of the mmapped arenas
+        self.arenas = []
+        # bump pointer into the last arena
+        self.cur    = 0
+        self.end    = 0
+        # size class -> freed blocks
+        self.free   = {}
+        # block addr -> size class (or mapping size for the big blocks)
+        self.blocks = {}
+        # blocks with their own mapping
+        self.big    = set()
+
+
+class ArenaAllocator(Plugin):
+    '''Allocates blocks of memory into a process.
+
+    Here is its internal working:
+
+        1. The first allocation maps an arena with an injected mmap.
+        2. The requested size is rounded to a size class (a power of two) and
+           a freed block of this class is reused if possible.
+        3. Else the block is taken from the arena with a bump pointer. A new
+           arena is only mapped when the current one is exhausted.
+        4. Blocks bigger than the biggest size class get their own mapping.
+        5. Everything is unmapped when the process is detached (or on
+           `release`).
+
+    A block of a given class is aligned on this class (up to the page size).
+
+    Examples
+    --------
+    >>> syscall = plugins.syscall.SyscallByInstrReplacement()
+    >>> alloc   = ArenaAllocator(syscall)
+    >>> addr    = alloc(process, 100)
+    >>> process.write_mem_array(addr, b'Hello World!\\x00')
+    >>> alloc.free(process, addr)
+    '''
+
+    def __init__(self, syscall, arena_size=1024 * 1024, prot=PROT_READ | PROT_WRITE):
+        '''
+        Parameters
+        ----------
+        syscall : Plugin
+            The strategy used to inject the mmap/munmap syscalls.
+        arena_size : int, optional
+            The size of each arena.
+        prot : int, optional
+            The protection of the arenas.
+        '''
+        self._syscall    = syscall
+        self._arena_size = (arena_size + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+        self._prot       = prot
+        self._states     = {}
+
+    def _mmap(self, process, size):
+        flags = MAP_ANONYMOUS | MAP_PRIVATE
+        addr  = self._syscall(process, Syscalls.mmap, 0, size, self._prot, flags, 0, 0)
+        if addr >= 2**64 - 4095:
+            raise RuntimeError(f'mmap failed ({addr:#x})')
+        return addr
+
+    def _munmap(self, process, addr, size):
+        self._syscall(process, Syscalls.munmap, addr, size)
+
+    def _state(self, process):
+        state = self._states.get(process.pid)
+        if state is None:
+            state = self._states[process.pid] = _Arenas()
+            process.on_detach(self.release)
+        return state
+
+    def __call__(self, process, size, align=MIN_CLASS):
+        '''
+        Parameters
+        ----------
+        size : int
+            The size of the block.
+        align : int, optional
+            The alignment of the block (a power of two, at most the page
+            size).
+
+        Returns
+        -------
+        int
+            The address of the block into the process.
+
+        Raises
+        ------
+        ValueError
+            If align is not a power of two or is bigger than the page size.
+        '''
+        if align <= 0 or align & (align - 1) != 0:
+            raise ValueError('align must be a power of two')
+        if align > PAGE_SIZE:
+            raise ValueError(f'align must be at most {PAGE_SIZE}')
+        state  = self._state(process)
+        class_ = max(MIN_CLASS, align, 1 << (max(size, 1) - 1).bit_length())
+        if class_ > min(MAX_CLASS, self._arena_size):
+            size = (class_ + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+            addr = self._mmap(process, size)
+            state.blocks[addr] = size
+            state.big.add(addr)
+            return addr
+        free = state.free.get(class_)
+        if free:
+            addr = free.pop()
+        else:
+            boundary = min(class_, PAGE_SIZE)
+            addr     = (state.cur + boundary - 1) & ~(boundary - 1)
+            if addr + class_ > state.end:
+                arena = self._mmap(process, self._arena_size)
+                state.arenas.append((arena, self._arena_size))
+                state.end = arena + self._arena_size
+                addr      = arena
+            state.cur = addr + class_
+        state.blocks[addr] = class_
+        return addr
+
+    def free(self, process, addr):
+        '''Gives back a block allocated by this allocator.'''
+        state  = self._states[process.pid]
+        class_ = state.blocks.pop(addr)
+        if addr in state.big:
+            state.big.discard(addr)
+            self._munmap(process, addr, class_)
+        else:
+            state.free.setdefault(class_, []).append(addr)
+
+    def release(self, process):
+        '''Unmaps all the arenas and blocks of a process.'''
+        state = self._states.pop(process.pid, None)
+        if state is None:
+            return
+        for addr in state.big:
+            self._munmap(process, addr, state.blocks[addr])
+        for addr, size in state.arenas:
+            self._munmap(process, addr, size)
@@ -1,7 +1,10 @@
 
 '''Defines some strategies to make the process call one of its functions.'''
 
-from .plugin import Plugin
+import struct
+
+from .plugin  import Plugin
+from .syscall import Syscalls
 
 
 class CallInt3(Plugin):
@@ -38,3 +41,187 @@ class CallInt3(Plugin):
                 ret = regs.rax
         return ret
 
+
+
+# mmap prot constants
+PROT_READ  = 1
+PROT_WRITE = 2
+PROT_EXEC  = 4
+
+# mmap flags constants
+MAP_PRIVATE   = 0x02
+MAP_ANONYMOUS = 0x20
+
+PAGE_SIZE = 4096
+
+# the stack space below rsp which must not be used (System V ABI)
+RED_ZONE = 128
+
+
+class Ret:
+    '''The return value of an earlier call of a chain, used as an argument.
+
+    Attributes
+    ----------
+    index : int
+        The index of the call into the chain.
+    '''
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f'Ret({self.index})'
+
+
+class CallChain(Plugin):
+    '''Makes the process call several functions with only one stop.
+
+    Here is its internal working:
+
+        1. A stub is assembled: for each call, the arguments are loaded (an
+           immediate or a return value stored earlier), the function is
+           called and its return value is stored into a result array. The
+           stub ends with an int3.
+        2. The stub and the (zeroed) result array are written into an
+           executable page mapped into the process at the first call, then
+           reused. The page is unmapped on `release` or before the detach.
+        3. The process runs the stub from its current stack (below the red
+           zone) and the registers are restored when it stops.
+        4. The result array is read with one read.
+
+    rbx points to the result array during the chain: it is callee-saved so
+    the functions keep it.
+
+    Examples
+    --------
+    >>> syscall = plugins.syscall.SyscallByInstrReplacement()
+    >>> chain   = CallChain(syscall)
+    >>> handle, init, _ = chain(process, [
+    >>>     (dlopen_addr, [path_addr, RTLD_NOW]),
+    >>>     (dlsym_addr,  [Ret(0), name_addr]),
+    >>>     (call_addr,   [Ret(1)])
+    >>> ])
+    '''
+
+    CALL_ABI = ['rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9']
+    # register numbers used by the encodings
+    REGS     = {'rax': 0, 'rcx': 1, 'rdx': 2, 'rbx': 3, 'rsi': 6, 'rdi': 7, 'r8': 8, 'r9': 9}
+
+    def __init__(self, syscall):
+        '''
+        Parameters
+        ----------
+        syscall : Plugin
+            The strategy used to inject the mmap/munmap syscalls.
+        '''
+        self._syscall = syscall
+        # pid -> (addr, size) of the stub page
+        self._pages   = {}
+
+    @classmethod
+    def _movabs(cls, reg, value):
+        # mov reg, imm64
+        r = cls.REGS[reg]
+        return bytes([0x48 | (r >> 3), 0xb8 | (r & 7)]) + (value & (2**64 - 1)).to_bytes(8, 'little')
+
+    @classmethod
+    def _load(cls, reg, disp):
+        # mov reg, [rbx + disp32]
+        r = cls.REGS[reg]
+        return bytes([0x48 | ((r >> 3) << 2), 0x8b, 0x83 | ((r & 7) << 3)]) + disp.to_bytes(4, 'little')
+
+    @classmethod
+    def _assemble(cls, chain):
+        '''Returns the stub running the chain.'''
+        code = bytearray()
+        for i, (fct_addr, args) in enumerate(chain):
+            if len(args) > len(cls.CALL_ABI):
+                raise ValueError(f'call {i}: at most {len(cls.CALL_ABI)} arguments are supported')
+            for reg, arg in zip(cls.CALL_ABI, args):
+                if isinstance(arg, Ret):
+                    if not 0 <= arg.index < i:
+                        raise ValueError(f'call {i}: {arg} does not refer to an earlier call')
+                    code += cls._load(reg, arg.index * 8)
+                else:
+                    code += cls._movabs(reg, arg)
+            code += cls._movabs('rax', fct_addr)
+            # call rax
+            code += b'\xff\xd0'
+            # mov [rbx + disp32], rax
+            code += b'\x48\x89\x83' + (i * 8).to_bytes(4, 'little')
+        # int3
+        code += b'\xcc'
+        return bytes(code)
+
+    def _page(self, process, size):
+        '''Returns the address of a stub page of at least size bytes.'''
+        size = (size + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+        page = self._pages.get(process.pid)
+        if page is not None and page[1] >= size:
+            return page[0]
+        if page is None:
+            process.on_detach(self.release)
+        else:
+            self._syscall(process, Syscalls.munmap, *page)
+            del self._pages[process.pid]
+        prot  = PROT_READ | PROT_WRITE | PROT_EXEC
+        flags = MAP_ANONYMOUS | MAP_PRIVATE
+        addr  = self._syscall(process, Syscalls.mmap, 0, size, prot, flags, 0, 0)
+        if addr >= 2**64 - 4095:
+            raise RuntimeError(f'mmap failed ({addr:#x})')
+        self._pages[process.pid] = (addr, size)
+        return addr
+
+    def __call__(self, process, chain, stack_frame_addr=None):
+        '''Makes the process call a chain of functions.
+
+        Parameters
+        ----------
+        chain : list of (int, list)
+            The address and the arguments of each function to call, in the
+            calling order. An argument can be an int or a `Ret` referencing
+            the return value of an earlier call.
+        stack_frame_addr : int, optional
+            Set stack frame to this address.
+
+        Returns
+        -------
+        list of int
+            The return value (rax) of each call.
+
+        Raises
+        ------
+        ValueError
+            If a call has more than 6 arguments or if a `Ret` does not refer
+            to an earlier call.
+        RuntimeError
+            If the stub page could not be mapped.
+        '''
+        chain = [(fct_addr, list(args)) for fct_addr, args in chain]
+        if len(chain) == 0:
+            return []
+        code    = self._assemble(chain)
+        # the result array follows the stub (8 bytes aligned)
+        offset  = (len(code) + 7) & ~7
+        stub    = code.ljust(offset, b'\xcc') + bytes(8 * len(chain))
+        addr    = self._page(process, len(stub))
+        process.write(addr, stub)
+        with process.get_regs_and_restore() as regs:
+            rsp = regs.rsp - RED_ZONE if stack_frame_addr is None else stack_frame_addr
+            # rsp must be 16 bytes aligned at each call
+            regs.rsp = rsp & ~0xf
+            regs.rbp = regs.rsp
+            regs.rip = addr
+            regs.rax = addr
+            regs.rbx = addr + offset
+            process.set_regs(regs)
+            process.continue_()
+        results = process.read(addr + offset, 8 * len(chain))
+        return list(struct.unpack(f'<{len(chain)}Q', results))
+
+    def release(self, process):
+        '''Unmaps the stub page of a process.'''
+        page = self._pages.pop(process.pid, None)
+        if page is not None:
+            self._syscall(process, Syscalls.munmap, *page)
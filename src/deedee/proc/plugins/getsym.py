@@ -4,8 +4,11 @@
 import os
 import ctypes
 
-from .plugin import Plugin
-from ..maps  import get_maps
+from collections import OrderedDict
+
+from .plugin   import Plugin
+from ..elf     import ElfFile
+from ..modules import ModuleTable
 
 
 class ByLibLoading(Plugin):
@@ -27,6 +30,14 @@ class ByLibLoading(Plugin):
     are defined into, these one will be executed by the host process.
     '''
 
+    def __init__(self):
+        self._local = None
+
+    def _local_modules(self):
+        if self._local is None:
+            self._local = ModuleTable(os.getpid())
+        return self._local
+
     def __call__(self, process, lib_path, sym_name):
         '''
         Parameters
@@ -44,50 +55,95 @@ class ByLibLoading(Plugin):
         Raises
         ------
         RuntimeError
-            No executable mapping is found into the library.
+            The lib is not mapped into one of the processes.
         '''
         # load the lib into the local process
-        self_pid = os.getpid()
-        lib      = ctypes.CDLL(lib_path)
-        filter_  = lambda m: m.pathname == lib_path and 'w' in m.perms
-        # get the lib mem base addr
-        mappings = get_maps(self_pid, filter_)
-        if len(mappings) == 0:
-            raise RuntimeError('impossible to find an executable mapping into the lib')
-        base_addr = mappings[0].start_address
+        lib    = ctypes.CDLL(lib_path)
+        module = self._local_modules().get(lib_path)
+        if module is None:
+            raise RuntimeError('impossible to find the lib into the local process')
         # get the sym addr of this process
         sym      = getattr(lib, sym_name)
         addr     = ctypes.addressof(sym)
         addr     = ctypes.cast(addr, ctypes.POINTER(ctypes.c_ulonglong))
         sym_addr = addr.contents.value
-        # compute and return the offset
-        sym_offset = sym_addr - base_addr
+        # compute the offset
+        sym_offset = sym_addr - module.base
         # get the lib addr in the target process
-        mappings = process.get_maps(filter_)
-        if len(mappings) == 0:
-            raise RuntimeError('impossible to find an executable mapping into the lib')
-        lib_addr = mappings[0].start_address
+        module = process.modules().get(lib_path)
+        if module is None:
+            raise RuntimeError(f'{lib_path} is not mapped into the process')
         # compute the remote sym addr
-        sym_addr = lib_addr + sym_offset
-        return sym_addr
+        return module.base + sym_offset
 
 
 class ByElfParsing(Plugin):
+    '''Get a sym address by parsing the library in which the sym is defined.
 
-    def __call__(self, process, lib_path, sym_name):
-        '''Get a sym address by parsing the library in which the sym is defined.
+    Below is a summary of its working:
+
+        1. Gets the sym offset into the lib (from its .dynsym or .symtab).
+        2. Gets the virtual address of the first loadable segment of the lib.
+        3. Gets the addr of the lib into the target process.
+        4. Compute the address: offset + (step3 - step2)
+
+    Contrary to `ByLibLoading`, the library is never loaded into the host
+    process and non exported symbols (e.g. `main_arena`) can be found when
+    the library is not stripped.
 
-        This strategy parses the output of the `readelf` command.
-        Below is a summary of its working:
+    The parsed libraries (an open file and a mapping each) are kept into a
+    LRU cache: call `close` to release them.
+    '''
 
-            1. Gets the sym offset into the lib.
-            2. Gets the virtual address of the executable mapping of the lib.
-            3. Gets the addr of the lib into the target process.
-            4. Compute the address: offset + (step3 - step2)
+    def __init__(self, max_files=16):
+        '''
+        Parameters
+        ----------
+        max_files : int, optional
+            The max number of parsed libraries kept open.
+        '''
+        self._max_files = max_files
+        self._elfs      = OrderedDict()
+
+    def _elf(self, lib_path):
+        elf = self._elfs.get(lib_path)
+        if elf is not None:
+            self._elfs.move_to_end(lib_path)
+            return elf
+        elf = self._elfs[lib_path] = ElfFile(lib_path)
+        while len(self._elfs) > self._max_files:
+            self._elfs.popitem(last=False)[1].close()
+        return elf
+
+    def close(self):
+        '''Closes all the parsed libraries.'''
+        while len(self._elfs) != 0:
+            self._elfs.popitem()[1].close()
 
-        Warnings
-        --------
-        This strategy needs the command `readelf` to work.
+    def __call__(self, process, lib_path, sym_name):
         '''
-        raise NotImplemented('this method is not yet implemented')
+        Parameters
+        ----------
+        lib_path : str
+            The path to the library in which the symbol is defined.
+        sym_name : str
+            The name of the symbol whose address is retrieved.
+
+        Returns
+        -------
+        int
+            The symbol address.
 
+        Raises
+        ------
+        RuntimeError
+            The symbol is not defined or the lib is not mapped.
+        '''
+        elf   = self._elf(lib_path)
+        value = elf.get_symbol(sym_name)
+        if value is None:
+            raise RuntimeError(f'{sym_name} is not defined into {lib_path}')
+        module = process.modules().get(lib_path)
+        if module is None:
+            raise RuntimeError(f'{lib_path} is not mapped into the process')
+        return module.base - elf.min_vaddr + value
@@ -17,14 +17,53 @@ MAP_ANONYMOUS = 0x20
 RTLD_NOW = 0x02
 
 
+# size of the stack used by dlopen
+STACK_SIZE = 4096
+
+
 class LibcDlopen(Plugin):
 
-    def __init__(self, syscall, call, getsym):
+    def __init__(self, syscall, call, getsym, alloc=None):
+        '''
+        Parameters
+        ----------
+        alloc : Plugin, optional
+            If provided (e.g. an `alloc.ArenaAllocator`), it is used to hold
+            the lib path and the stack instead of mapping (then unmapping)
+            8192 bytes for each injection.
+        '''
         self._syscall = syscall
         self._call    = call
         self._getsym  = getsym
+        self._alloc   = alloc
+
+    def _call_dlopen(self, process, libc_path, path_addr, stack_top):
+        dlopen_addr = self._getsym(process, libc_path, '__libc_dlopen_mode')
+        return self._call(
+            process,
+            dlopen_addr,
+            path_addr,
+            RTLD_NOW,
+            stack_frame_addr=stack_top
+        )
+
+    def _dlopen_with_alloc(self, process, libc_path, lib_path):
+        path       = lib_path.encode() + b'\x00'
+        path_addr  = self._alloc(process, len(path))
+        stack_addr = self._alloc(process, STACK_SIZE, align=STACK_SIZE)
+        try:
+            process.write_mem_array(path_addr, path)
+            return self._call_dlopen(process, libc_path, path_addr, stack_addr + STACK_SIZE)
+        finally:
+            self._alloc.free(process, stack_addr)
+            self._alloc.free(process, path_addr)
 
     def __call__(self, process, libc_path, lib_path):
+        if self._alloc is not None:
+            handler = self._dlopen_with_alloc(process, libc_path, lib_path)
+            if handler == 0:
+                raise RuntimeError('dlopen returned NULL (is the path of your lib valid?)')
+            return handler
         # allocate a new mapping
         prot    = PROT_WRITE | PROT_READ
         flags   = MAP_ANONYMOUS | MAP_PRIVATE
@@ -35,14 +74,7 @@ class LibcDlopen(Plugin):
         path = lib_path.encode() + b'\x00'
         process.write_mem_array(mapping, path)
         # call dlopen
-        dlopen_addr = self._getsym(process, libc_path, '__libc_dlopen_mode')
-        handler     = self._call(
-            process,
-            dlopen_addr,
-            mapping,
-            RTLD_NOW,
-            stack_frame_addr=mapping+4096
-        )
+        handler = self._call_dlopen(process, libc_path, mapping, mapping + STACK_SIZE)
         # deallocate the mapping
         self._syscall(process, Syscalls.munmap, mapping, 8192)
         # return the handler
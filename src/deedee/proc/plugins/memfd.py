@@ -0,0 +1,179 @@
+
+'''Defines some strategies to share memory with a process.'''
+
+import mmap
+import os
+
+from .plugin  import Plugin
+from .syscall import Syscalls
+
+
+# mmap prot constants
+PROT_READ  = 1
+PROT_WRITE = 2
+
+# mmap flags constants
+MAP_SHARED    = 0x01
+MAP_PRIVATE   = 0x02
+MAP_ANONYMOUS = 0x20
+
+# memfd_create flags constants
+MFD_CLOEXEC = 0x01
+
+PAGE_SIZE = 4096
+
+
+def _check(ret, name):
+    if ret >= 2**64 - 4095:
+        raise RuntimeError(f'{name} failed ({ret - 2**64})')
+    return ret
+
+
+class Channel:
+    '''A memory space mapped into both the current process and a process.
+
+    Attributes
+    ----------
+    remote_addr : int
+        The address of the space into the process.
+    size : int
+        The size of the space.
+    buf : memoryview
+        The space mapped into the current process: a write into it is seen
+        by the process (and vice versa) without any syscall.
+    '''
+
+    def __init__(self, process, syscall, remote_addr, size, local_fd):
+        self._process    = process
+        self._syscall    = syscall
+        self._local_fd   = local_fd
+        self._map        = mmap.mmap(local_fd, size, mmap.MAP_SHARED)
+        self.remote_addr = remote_addr
+        self.size        = size
+        self.buf         = memoryview(self._map)
+
+    def __repr__(self):
+        return f'Channel(remote_addr={hex(self.remote_addr)}, size={self.size})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._map is None
+
+    def write(self, data, offset=0):
+        '''Copies data into the space.
+
+        Returns
+        -------
+        int
+            The address of the data into the process.
+        '''
+        self.buf[offset:offset + len(data)] = data
+        return self.remote_addr + offset
+
+    def read(self, offset, size):
+        '''Copies size bytes of the space.'''
+        return bytes(self.buf[offset:offset + size])
+
+    def close(self, process=None):
+        '''Unmaps the space from both processes (the process must be
+        attached). Does nothing if already closed.
+
+        The views taken from `buf` must have been released before.
+        '''
+        if self._map is None:
+            return
+        self.buf.release()
+        self._map.close()
+        os.close(self._local_fd)
+        self._map = None
+        self._syscall(self._process, Syscalls.munmap, self.remote_addr, self.size)
+
+
+class MemfdChannel(Plugin):
+    '''Creates a memory space shared with a process.
+
+    Here is its internal working:
+
+        1. Injects a memfd_create, a ftruncate and a mmap (MAP_SHARED) into
+           the process.
+        2. Opens the memfd through /proc/<pid>/fd and maps it into the
+           current process.
+        3. Closes the memfd into the process: the mapping keeps it alive.
+
+    After this setup, the data are moved with plain memory copies. The space
+    is unmapped from both processes by `Channel.close` or before the detach
+    of the process.
+
+    Examples
+    --------
+    >>> syscall = plugins.syscall.SyscallByInstrReplacement()
+    >>> channel = MemfdChannel(syscall)(process, 16 * 1024 * 1024)
+    >>> addr    = channel.write(payload)
+    >>> call(process, parse_addr, addr, len(payload))
+    >>> channel.close()
+    '''
+
+    def __init__(self, syscall, name='deedee'):
+        '''
+        Parameters
+        ----------
+        syscall : Plugin
+            The strategy used to inject the syscalls.
+        name : str, optional
+            The name of the memfd (shown into /proc/<pid>/maps).
+        '''
+        self._syscall = syscall
+        self._name    = name.encode() + b'\x00'
+
+    def _memfd_create(self, process):
+        # the name must be stored into the process memory
+        prot    = PROT_READ | PROT_WRITE
+        flags   = MAP_ANONYMOUS | MAP_PRIVATE
+        scratch = _check(self._syscall(process, Syscalls.mmap, 0, PAGE_SIZE, prot, flags, 0, 0), 'mmap')
+        try:
+            process.write_mem_array(scratch, self._name)
+            ret = self._syscall(process, Syscalls.memfd_create, scratch, MFD_CLOEXEC)
+            return _check(ret, 'memfd_create')
+        finally:
+            self._syscall(process, Syscalls.munmap, scratch, PAGE_SIZE)
+
+    def __call__(self, process, size):
+        '''
+        Parameters
+        ----------
+        size : int
+            The size of the shared space (rounded to the page size).
+
+        Returns
+        -------
+        Channel
+            The shared space.
+
+        Raises
+        ------
+        RuntimeError
+            If a syscall injected into the process failed.
+        '''
+        size = (size + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+        fd   = self._memfd_create(process)
+        try:
+            _check(self._syscall(process, Syscalls.ftruncate, fd, size), 'ftruncate')
+            prot = PROT_READ | PROT_WRITE
+            addr = self._syscall(process, Syscalls.mmap, 0, size, prot, MAP_SHARED, fd, 0)
+            addr = _check(addr, 'mmap')
+            try:
+                local   = os.open(f'/proc/{process.pid}/fd/{fd}', os.O_RDWR | os.O_CLOEXEC)
+                channel = Channel(process, self._syscall, addr, size, local)
+            except BaseException:
+                self._syscall(process, Syscalls.munmap, addr, size)
+                raise
+        finally:
+            self._syscall(process, Syscalls.close, fd)
+        process.on_detach(channel.close)
+        return channel
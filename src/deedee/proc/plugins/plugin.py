@@ -2,9 +2,16 @@
 class Plugin:
     '''Base class for all the plugins.'''
 
+    # called with each new subclass (set by the instrument module)
+    _on_subclass = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if Plugin._on_subclass is not None:
+            Plugin._on_subclass(cls)
+
     def __init__(self):
         pass
 
     def __call__(self, *args, **kwargs):
         pass
-
@@ -1,30 +1,262 @@
 
 '''Defines some strategies to read into the memory of a process.'''
 
+import os
+import threading
+
+from collections import OrderedDict
+
 from .plugin import Plugin
+from ..libc  import uio
+
+
+class FdPool:
+    '''A LRU pool of /proc/<pid>/mem file descriptors shared by all processes.
+
+    The files are opened read-write when allowed (read-only else) and kept
+    open between calls. A file opened before an exec (or before the death of
+    the process) refers to the old address space and reads nothing: such a
+    descriptor is invalidated and reopened by `ProcMem`.
+
+    A descriptor is taken with `acquire` and given back with `release`. When
+    it is evicted or invalidated while used by another thread, it is only
+    closed by its last `release`.
+    '''
+
+    def __init__(self, maxsize=64):
+        self._maxsize = maxsize
+        self._lock    = threading.Lock()
+        # pid -> (fd, writable)
+        self._fds     = OrderedDict()
+        # fd -> number of users
+        self._users   = {}
+        # fds removed from the pool while used, closed by their last release
+        self._retired = set()
+
+    def _drop(self, fd):
+        if self._users.get(fd, 0) != 0:
+            self._retired.add(fd)
+        else:
+            os.close(fd)
+
+    def acquire(self, pid, write=False):
+        '''Returns an opened file descriptor for the mem file of pid.
+
+        It must be given back with `release`.
+        '''
+        with self._lock:
+            entry = self._fds.get(pid)
+            if entry is not None and (entry[1] or not write):
+                self._fds.move_to_end(pid)
+                fd = entry[0]
+            else:
+                if entry is not None:
+                    self._drop(self._fds.pop(pid)[0])
+                path = f'/proc/{pid}/mem'
+                try:
+                    fd, writable = os.open(path, os.O_RDWR | os.O_CLOEXEC), True
+                except PermissionError:
+                    if write:
+                        raise
+                    fd, writable = os.open(path, os.O_RDONLY | os.O_CLOEXEC), False
+                self._fds[pid] = (fd, writable)
+                while len(self._fds) > self._maxsize:
+                    self._drop(self._fds.popitem(last=False)[1][0])
+            self._users[fd] = self._users.get(fd, 0) + 1
+            return fd
+
+    def release(self, fd):
+        '''Gives back a file descriptor taken with `acquire`.'''
+        with self._lock:
+            users = self._users.pop(fd) - 1
+            if users != 0:
+                self._users[fd] = users
+            elif fd in self._retired:
+                self._retired.discard(fd)
+                os.close(fd)
+
+    def invalidate(self, pid):
+        '''Closes the file descriptor of pid (if any).'''
+        with self._lock:
+            entry = self._fds.pop(pid, None)
+            if entry is not None:
+                self._drop(entry[0])
+
+    def clear(self):
+        '''Closes all the file descriptors.'''
+        with self._lock:
+            while len(self._fds) != 0:
+                self._drop(self._fds.popitem()[1][0])
+
+
+# the pool used by default
+POOL = FdPool()
+
+
+class ProcMem(Plugin):
+    '''Reads and writes the memory of a process through its /proc/mem file.
+
+    The file is accessed with `os.preadv`/`os.pwritev` on a raw file
+    descriptor (no Python buffering, no seek) taken from a shared `FdPool`.
+    Adjacent ranges given to `readv`/`writev` are coalesced into one call.
+
+    Contrary to `process_vm_readv`, the kernel accesses the memory as a
+    debugger would: read-only mappings (e.g. code) can be written in bulk.
+    The process must be traced by the current process (or the caller must
+    be allowed to trace it).
+    '''
+
+    def __init__(self, pool=None):
+        self._pool = POOL if pool is None else pool
 
+    def _io(self, pid, fct, buffers, addr, write):
+        '''Calls fct (preadv or pwritev), reopening once a stale descriptor.'''
+        size = sum(len(b) for b in buffers)
+        for retry in (False, True):
+            if retry:
+                self._pool.invalidate(pid)
+            fd = self._pool.acquire(pid, write)
+            try:
+                done = fct(fd, buffers, addr)
+            finally:
+                self._pool.release(fd)
+            if done != 0 or size == 0:
+                break
+        return done
 
-class ProcMemRead(Plugin):
+    @staticmethod
+    def _groups(ranges):
+        '''Groups the indexes of adjacent ranges (sorted by address).
+
+        A group holds at most `uio.IOV_MAX` ranges: preadv/pwritev fail with
+        EINVAL above.
+        '''
+        groups = []
+        end    = None
+        for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+            addr, size = ranges[i]
+            if addr != end or len(groups[-1]) == uio.IOV_MAX:
+                groups.append([])
+            groups[-1].append(i)
+            end = addr + size
+        return groups
+
+    def read(self, process, addr, size):
+        '''Reads a contiguous space of the process memory.
+
+        Returns
+        -------
+        bytearray
+            The read bytes (shorter than size if the end is not mapped).
+
+        Raises
+        ------
+        OSError
+            If the first byte is not mapped (EIO).
+        '''
+        buf  = bytearray(size)
+        done = self.readinto(process, addr, buf)
+        del buf[done:]
+        return buf
+
+    def readinto(self, process, addr, buf):
+        '''Reads a contiguous space of the process memory into buf.
+
+        Parameters
+        ----------
+        buf : writable bytes-like
+            The buffer to fill (e.g. a `memoryview` slice of a bigger one).
+
+        Returns
+        -------
+        int
+            The number of read bytes (less than len(buf) if the end is not
+            mapped).
+
+        Raises
+        ------
+        OSError
+            If the first byte is not mapped (EIO).
+        '''
+        return self._io(process.pid, os.preadv, [buf], addr, False)
+
+    def readv(self, process, ranges):
+        '''Reads several spaces of the process memory.
+
+        Parameters
+        ----------
+        ranges : list of (int, int)
+            The (address, size) of each space.
+
+        Returns
+        -------
+        list of bytearray
+            The data of each space (shorter or empty if not mapped).
+        '''
+        results = [bytearray(size) for _, size in ranges]
+        for group in self._groups(ranges):
+            buffers = [results[i] for i in group]
+            try:
+                done = self._io(process.pid, os.preadv, buffers, ranges[group[0]][0], False)
+            except OSError:
+                done = 0
+            for buf in buffers:
+                got   = min(len(buf), done)
+                done -= got
+                del buf[got:]
+        return results
+
+    def write(self, process, addr, data):
+        '''Writes into a contiguous space of the process memory.
+
+        Returns
+        -------
+        int
+            The number of written bytes.
+        '''
+        return self._io(process.pid, os.pwritev, [data], addr, True)
+
+    def writev(self, process, chunks):
+        '''Writes several spaces of the process memory.
+
+        Parameters
+        ----------
+        chunks : list of (int, bytes)
+            The address and the data of each space.
+
+        Returns
+        -------
+        int
+            The total number of written bytes.
+        '''
+        ranges = [(addr, len(data)) for addr, data in chunks]
+        total  = 0
+        for group in self._groups(ranges):
+            buffers = [chunks[i][1] for i in group]
+            total  += self._io(process.pid, os.pwritev, buffers, ranges[group[0]][0], True)
+        return total
+
+    def __call__(self, process, offset, size):
+        return self.read(process, offset, size)
+
+
+class ProcMemRead(ProcMem):
     '''Allows to read the memory of a process by reading its /proc/mem file.
 
-    Warnings
-    --------
-    It can only be used to read readable mappings.
+    It is the plugin form of `ProcMem.read`: calling it returns the read
+    data as `bytes`. Use the `ProcMem` methods to read into a buffer, to
+    read several spaces or to write.
     '''
 
-    def __init__(self, auto_refresh=False):
+    def __init__(self, auto_refresh=False, pool=None):
+        super().__init__(pool)
         self._auto_refresh = auto_refresh
-        self._f            = None
 
     def refresh(self, process):
         '''Close and open the proc mem file.'''
-        if self._f is not None:
-            self._f.close()
-        self._f = open(f'/proc/{process.pid}/mem', 'rb')
+        self._pool.invalidate(process.pid)
 
     def __call__(self, process, offset, size):
-        if self._f is None or self._auto_refresh:
+        if self._auto_refresh:
             self.refresh(process)
-        self._f.seek(offset)
-        return self._f.read(size)
-
+        return bytes(self.read(process, offset, size))
@@ -0,0 +1,340 @@
+
+'''Defines some strategies to trace the syscalls of a process.'''
+
+import ctypes
+import os
+import signal
+import struct
+import time
+
+from .plugin  import Plugin
+from .syscall import Syscalls
+from ..libc   import ptrace
+
+
+# mmap prot constants
+PROT_READ  = 1
+PROT_WRITE = 2
+
+# mmap flags constants
+MAP_PRIVATE   = 0x02
+MAP_ANONYMOUS = 0x20
+
+# prctl constants
+PR_SET_NO_NEW_PRIVS = 38
+
+# seccomp constants
+SECCOMP_SET_MODE_FILTER   = 1
+SECCOMP_FILTER_FLAG_TSYNC = 1
+SECCOMP_RET_ALLOW         = 0x7fff0000
+SECCOMP_RET_TRACE         = 0x7ff00000
+AUDIT_ARCH_X86_64         = 0xc000003e
+
+# offsets into struct seccomp_data
+SECCOMP_DATA_NR   = 0
+SECCOMP_DATA_ARCH = 4
+
+# classic BPF opcodes
+BPF_LD_W_ABS = 0x20
+BPF_JEQ_K    = 0x15
+BPF_RET_K    = 0x06
+
+# stop signal of a syscall-exit-stop (PTRACE_O_TRACESYSGOOD)
+SIGTRAP_SYSGOOD = signal.SIGTRAP | 0x80
+
+
+class SyscallEvent(ctypes.Structure):
+    '''A traced syscall.
+
+    `ret` is only valid when `done` is set (the exit of the syscall has
+    been traced).
+    '''
+    _fields_ = [
+        ('time_ns', ctypes.c_uint64),
+        ('args',    ctypes.c_uint64 * 6),
+        ('ret',     ctypes.c_int64),
+        ('tid',     ctypes.c_int32),
+        ('nr',      ctypes.c_int16),
+        ('done',    ctypes.c_uint8)
+    ]
+
+    @property
+    def syscall(self):
+        return Syscalls(self.nr)
+
+    def __repr__(self):
+        args = ', '.join(hex(a) for a in self.args)
+        ret  = self.ret if self.done else '?'
+        return f'[{self.tid}] {self.syscall.name}({args}) = {ret}'
+
+
+class EventRing:
+    '''A preallocated ring buffer of `SyscallEvent`.
+
+    When the buffer is full, the oldest events are overwritten (and
+    counted into `dropped`).
+    '''
+
+    def __init__(self, capacity):
+        self._events   = (SyscallEvent * capacity)()
+        self._capacity = capacity
+        # number of pushed and consumed events
+        self._head     = 0
+        self._tail     = 0
+        self.dropped   = 0
+
+    def __len__(self):
+        return self._head - self._tail
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def head(self):
+        '''The number of events pushed since the creation of the buffer.'''
+        return self._head
+
+    def push(self):
+        '''Returns the slot of a new event, to be filled in place.'''
+        if self._head - self._tail == self._capacity:
+            self._tail   += 1
+            self.dropped += 1
+        event = self._events[self._head % self._capacity]
+        self._head += 1
+        return event
+
+    def drain(self, max_events=None):
+        '''Consumes the oldest events.
+
+        Parameters
+        ----------
+        max_events : int, optional
+            The max number of consumed events. All by default.
+
+        Returns
+        -------
+        ctypes array of SyscallEvent
+            A copy of the consumed events (at most two `memmove`).
+        '''
+        n = len(self)
+        if max_events is not None:
+            n = min(n, max_events)
+        batch = (SyscallEvent * n)()
+        size  = ctypes.sizeof(SyscallEvent)
+        start = self._tail % self._capacity
+        first = min(n, self._capacity - start)
+        base  = ctypes.addressof(self._events)
+        ctypes.memmove(batch, base + start * size, first * size)
+        if first < n:
+            ctypes.memmove(ctypes.addressof(batch) + first * size, base, (n - first) * size)
+        self._tail += n
+        return batch
+
+
+class SeccompTracer(Plugin):
+    '''Traces a set of syscalls by using a seccomp filter.
+
+    Here is its internal working:
+
+        1. Attaches all the threads and enables PTRACE_O_TRACESECCOMP.
+        2. Injects a BPF filter returning SECCOMP_RET_TRACE for the chosen
+           syscalls and SECCOMP_RET_ALLOW for the other ones.
+        3. Continues the threads: they only stop on the chosen syscalls
+           (and on their exit if `exits` is set).
+        4. Decodes each stop into the preallocated ring buffer.
+
+    Warnings
+    --------
+    A seccomp filter can not be removed and, without a tracer, the kernel
+    fails the syscalls it gives to the tracer with ENOSYS. The filter can not
+    depend on whether the process is traced (a BPF filter only sees the
+    syscall number, its arguments and the instruction pointer, not the
+    process memory). Thus `install` pins the process: `Process.detach`
+    raises a `RuntimeError` unless force is set, which leaves the chosen
+    syscalls failing. Only use it on processes traced until their end.
+
+    Examples
+    --------
+    >>> syscall = plugins.syscall.SyscallByInstrReplacement()
+    >>> tracer  = SeccompTracer(syscall, [Syscalls.openat, Syscalls.connect])
+    >>> process.attach()
+    >>> tracer.install(process)
+    >>> while tracer(process, count=1000) == 1000:
+    >>>     for event in tracer.ring.drain():
+    >>>         print(event)
+    '''
+
+    def __init__(self, syscall, syscalls, capacity=65536, exits=True):
+        '''
+        Parameters
+        ----------
+        syscall : Plugin
+            The strategy used to inject the syscalls installing the filter.
+        syscalls : iterable of Syscalls
+            The syscalls to trace.
+        capacity : int, optional
+            The number of events of the ring buffer.
+        exits : bool, optional
+            Also stop on the syscall exits to get their return values.
+        '''
+        self._syscall = syscall
+        self._nrs     = sorted({int(s) for s in syscalls})
+        self._exits   = exits
+        self._regs    = ptrace.UserRegsStruct()
+        # tid -> (event, head) of the syscalls waiting for their exit
+        self._pending = {}
+        # threads created since the installation (stopped by a SIGSTOP)
+        self._new     = set()
+        self.ring     = EventRing(capacity)
+        if not 0 < len(self._nrs) < 256:
+            raise ValueError('between 1 and 255 syscalls can be traced')
+
+    def _build_filter(self):
+        '''Returns the BPF program and its number of instructions.'''
+        n    = len(self._nrs)
+        prog = [
+            (BPF_LD_W_ABS, 0, 0, SECCOMP_DATA_ARCH),
+            (BPF_JEQ_K,    1, 0, AUDIT_ARCH_X86_64),
+            (BPF_RET_K,    0, 0, SECCOMP_RET_ALLOW),
+            (BPF_LD_W_ABS, 0, 0, SECCOMP_DATA_NR)
+        ]
+        # each comparison jumps to the final SECCOMP_RET_TRACE
+        for i, nr in enumerate(self._nrs):
+            prog.append((BPF_JEQ_K, n - i, 0, nr))
+        prog.append((BPF_RET_K, 0, 0, SECCOMP_RET_ALLOW))
+        prog.append((BPF_RET_K, 0, 0, SECCOMP_RET_TRACE))
+        return b''.join(struct.pack('<HBBI', *insn) for insn in prog), len(prog)
+
+    def install(self, process):
+        '''Installs the seccomp filter into the (attached) process.
+
+        Raises
+        ------
+        RuntimeError
+            If a syscall injected into the process failed.
+        '''
+        process.attach_threads()
+        process.on_interrupt(self._on_interrupt)
+        options = ptrace.PTRACE_O_TRACESECCOMP | ptrace.PTRACE_O_TRACESYSGOOD \
+                | ptrace.PTRACE_O_TRACECLONE
+        for tid in process.threads:
+            process._call_ptrace(ptrace.setoptions, options, tid=tid)
+        # write the sock_fprog and the filter into a new mapping
+        prog, n = self._build_filter()
+        prot    = PROT_WRITE | PROT_READ
+        flags   = MAP_ANONYMOUS | MAP_PRIVATE
+        mapping = self._syscall(process, Syscalls.mmap, 0, 4096, prot, flags, 0, 0)
+        if mapping >= 2**64 - 4095:
+            raise RuntimeError('mmap failed')
+        try:
+            fprog = struct.pack('<H6xQ', n, mapping + 16)
+            process.write_mem_array(mapping, fprog + prog)
+            self._syscall(process, Syscalls.prctl, PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0)
+            ret = self._syscall(
+                process,
+                Syscalls.seccomp,
+                SECCOMP_SET_MODE_FILTER,
+                SECCOMP_FILTER_FLAG_TSYNC,
+                mapping
+            )
+            if ret != 0:
+                raise RuntimeError(f'seccomp failed ({ret:#x})')
+            process.pin('a seccomp filter tracing syscalls is installed')
+        finally:
+            self._syscall(process, Syscalls.munmap, mapping, 4096)
+
+    def _record_entry(self, process, tid):
+        regs  = self._regs
+        process._call_ptrace(ptrace.getregs, regs, tid=tid)
+        event = self.ring.push()
+        event.time_ns = time.perf_counter_ns()
+        event.tid     = tid
+        event.nr      = regs.orig_rax
+        event.args[:] = (regs.rdi, regs.rsi, regs.rdx, regs.r10, regs.r8, regs.r9)
+        event.ret     = 0
+        event.done    = 0
+        if self._exits:
+            self._pending[tid] = (event, self.ring.head)
+
+    def _record_exit(self, process, tid):
+        event, head = self._pending.pop(tid, (None, 0))
+        # the event may have been overwritten in the meantime
+        if event is None or self.ring.head - head >= self.ring.capacity:
+            return
+        regs = self._regs
+        process._call_ptrace(ptrace.getregs, regs, tid=tid)
+        event.ret  = ctypes.c_int64(regs.rax).value
+        event.done = 1
+
+    def _handle(self, process, tid, status):
+        '''Records a stop of a thread.
+
+        Returns
+        -------
+        (fct, int, int)
+            The ptrace request and the signal to resume the thread with, and
+            the number of recorded syscalls (0 or 1).
+        '''
+        sig      = os.WSTOPSIG(status)
+        event    = status >> 16
+        request  = ptrace.cont
+        deliver  = 0
+        recorded = 0
+        if sig == signal.SIGTRAP and event == ptrace.PTRACE_EVENT_SECCOMP:
+            self._record_entry(process, tid)
+            recorded = 1
+            if self._exits:
+                request = ptrace.cont_syscall
+        elif sig == SIGTRAP_SYSGOOD:
+            self._record_exit(process, tid)
+        elif sig == signal.SIGTRAP and event == ptrace.PTRACE_EVENT_CLONE:
+            msg = ctypes.c_ulong()
+            process._call_ptrace(ptrace.geteventmsg, msg, tid=tid)
+            self._new.add(msg.value)
+            process._threads.add(msg.value)
+        elif sig == signal.SIGSTOP and (tid in self._new or tid not in process.threads):
+            # first stop of a thread created since the installation
+            self._new.discard(tid)
+            process._threads.add(tid)
+        elif not process._is_interrupted(tid, status):
+            deliver = sig
+        return request, deliver, recorded
+
+    def _on_interrupt(self, process, tid, status):
+        '''Records the stops reported while `Process.interrupt` waits for
+        the SIGSTOP of a thread (see `Process.on_interrupt`).'''
+        request, _, _ = self._handle(process, tid, status)
+        return request
+
+    def __call__(self, process, count=None):
+        '''Continues the process while recording the traced syscalls.
+
+        The threads are not stopped when this method returns: use
+        `Process.interrupt` (or `Process.detach`) to stop them.
+
+        Parameters
+        ----------
+        count : int, optional
+            Return after this number of syscalls. By default, the method
+            returns when the process exits.
+
+        Returns
+        -------
+        int
+            The number of recorded syscalls.
+        '''
+        recorded = 0
+        for tid in process.threads:
+            if tid not in process._running:
+                process._cont_thread(tid)
+        while count is None or recorded < count:
+            tid, status = process._wait_thread()
+            if not os.WIFSTOPPED(status):
+                if tid == process.pid:
+                    break
+                continue
+            request, deliver, traced = self._handle(process, tid, status)
+            recorded += traced
+            process._cont_thread(tid, deliver, request)
+        return recorded
@@ -7,11 +7,52 @@ import signal
 import copy
 import contextlib
 import struct
+import bisect
+import time
 
 from .plugins import Plugin
 from .libc    import ptrace
 from .libc    import uio
 from .maps    import get_maps
+from .modules import ModuleTable
+
+from .breakpoints import BreakpointManager
+from .watchpoints import WatchpointManager
+from .transaction import Transaction
+
+from .plugins.readmem import ProcMem
+
+
+#############
+# Constants #
+#############
+
+# backends tried by `Process.read` and `Process.write`, by order of
+# preference, depending on whether the mapping has the needed permission:
+#   - vm: process_vm_readv/process_vm_writev
+#   - mem: the /proc/<pid>/mem file
+#   - words: PTRACE_PEEKDATA/PTRACE_POKEDATA
+# the reads through /proc/<pid>/mem are faster than process_vm_readv at every
+# size (see benchmarks/bench.py), which is only used when the file can not be
+# opened
+READ_BACKENDS = {
+    True:  ('mem', 'vm', 'words'),
+    False: ('mem', 'words')
+}
+WRITE_BACKENDS = {
+    True:  ('vm', 'mem', 'words'),
+    False: ('mem', 'words')
+}
+
+# bounds of the delay (in seconds) between two polls of the traced threads
+# while another child of the current process has an unconsumed event
+WAIT_POLL_MIN = 0.0001
+WAIT_POLL_MAX = 0.01
+
+# biggest write allowed to be done word by word
+WORDS_MAX_WRITE = 64
+
+PAGE_SIZE = 4096
 
 
 ##############
@@ -40,13 +81,65 @@ class Process:
     '''
 
     def __init__(self, pid):
-        self._pid = pid
+        self._pid         = pid
+        self._attached    = False
+        self._threads     = set()
+        # threads continued without being waited for
+        self._running     = set()
+        # threads to which a SIGSTOP has been sent by `interrupt`
+        self._stopping    = set()
+        self._breakpoints = None
+        self._watchpoints = None
+        self._on_detach   = []
+        self._on_interrupt = []
+        # reasons preventing the detach
+        self._pins        = []
+        # cached mappings (sorted) and their start addresses
+        self._maps        = None
+        self._maps_starts = None
+        # (start, end, op) -> backend which worked for this mapping
+        self._backends    = {}
+        self._procmem     = ProcMem()
+        self._modules     = None
+        # (key, (tid, iovec) pairs) reused by `get_threads_regs` and the
+        # sizes of the register sets without structure
+        self._regset_iovs = None
+        self._regset_lens = {}
 
     @property
     def pid(self):
         return self._pid
 
-    def _call_ptrace(self, fct, *args):
+    @property
+    def breakpoints(self):
+        '''The breakpoints manager of the process.
+
+        See Also
+        --------
+        breakpoints.BreakpointManager
+        '''
+        if self._breakpoints is None:
+            self._breakpoints = BreakpointManager(self)
+        return self._breakpoints
+
+    @property
+    def watchpoints(self):
+        '''The hardware watchpoints manager of the process.
+
+        See Also
+        --------
+        watchpoints.WatchpointManager
+        '''
+        if self._watchpoints is None:
+            self._watchpoints = WatchpointManager(self)
+        return self._watchpoints
+
+    @property
+    def threads(self):
+        '''The tids of the traced threads (the main thread first).'''
+        return [self._pid] + sorted(self._threads)
+
+    def _call_ptrace(self, fct, *args, tid=None):
         '''Helper method allowing to check if ptrace returned an error.
 
         Parameters
@@ -56,6 +149,9 @@ class Process:
         *args
             Arguments given to the ptrace helper. Do not provide the pid, this
             one is automatically given by this method.
+        tid : int, optional
+            The thread to which the request is sent (the main thread by
+            default).
 
         Raises
         ------
@@ -63,7 +159,7 @@ class Process:
             If a ptrace call failed.
         '''
         ctypes.set_errno(0)
-        res   = fct(self._pid, *args)
+        res   = fct(self._pid if tid is None else tid, *args)
         errno = ctypes.get_errno()
         if errno != 0:
             raise PtraceException(f'ptrace failed, errno: {errno}')
@@ -77,6 +173,11 @@ class Process:
         signal : int
             The expected signal.
 
+        Returns
+        -------
+        int
+            The status returned by `waitpid`.
+
         Raises
         ------
         PtraceException
@@ -86,11 +187,138 @@ class Process:
         if os.WIFSTOPPED(status):
             recv_sig = os.WSTOPSIG(status)
             if recv_sig != signal:
-                return
+                return status
                 raise PtraceException(
                     f'tracee stopped by unexpected signal: ' \
                     f'{recv_sig} ({signal} expected)'
                 )
+        return status
+
+    def _wait_thread(self, tid=None):
+        '''Helper method allowing to wait for a stop of a traced thread.
+
+        Parameters
+        ----------
+        tid : int, optional
+            The thread to wait for. By default, the main thread if it is the
+            only traced one, else any traced thread (the other children of
+            the current process are left alone).
+
+        Returns
+        -------
+        (int, int)
+            The tid and the status returned by `waitpid`.
+        '''
+        if tid is None and len(self._threads) == 0:
+            tid = self._pid
+        if tid is None:
+            tid, status = self._wait_traced()
+        else:
+            tid, status = os.waitpid(tid, ptrace.WALL)
+        self._running.discard(tid)
+        if not os.WIFSTOPPED(status):
+            self._threads.discard(tid)
+        return tid, status
+
+    def _wait_traced(self):
+        '''Waits for a stop of any traced thread.
+
+        The traced threads are polled with WNOHANG. When none of them has an
+        event, the events of all the children are watched without being
+        consumed (WNOWAIT): the call blocks until one of the traced threads
+        has an event, or polls with a growing delay while another child has
+        an unconsumed event.
+
+        Returns
+        -------
+        (int, int)
+            The tid and the status returned by `waitpid`.
+        '''
+        delay   = WAIT_POLL_MIN
+        options = os.WEXITED | os.WSTOPPED | os.WNOWAIT | ptrace.WALL
+        while True:
+            traced = [self._pid] + list(self._threads)
+            alive  = False
+            for tid in traced:
+                try:
+                    found, status = os.waitpid(tid, ptrace.WALL | os.WNOHANG)
+                except ChildProcessError:
+                    continue
+                alive = True
+                if found != 0:
+                    return found, status
+            if not alive:
+                raise ChildProcessError('no traced thread left')
+            info = os.waitid(os.P_ALL, 0, options)
+            if info is not None and info.si_pid in traced:
+                return os.waitpid(info.si_pid, ptrace.WALL)
+            # the event of another child stays pending: poll
+            time.sleep(delay)
+            delay = min(2 * delay, WAIT_POLL_MAX)
+
+    def _cont_thread(self, tid, sig=0, request=ptrace.cont):
+        '''Helper method allowing to continue a thread without waiting for it.
+
+        The thread is stopped by `interrupt` if it is still running.
+        '''
+        self._call_ptrace(request, sig, tid=tid)
+        self._running.add(tid)
+
+    def _is_interrupted(self, tid, status):
+        '''Returns True if the stop is the late one requested by `interrupt`.'''
+        if tid in self._stopping and os.WSTOPSIG(status) == signal.SIGSTOP:
+            self._stopping.discard(tid)
+            return True
+        return False
+
+    def on_interrupt(self, hook):
+        '''Registers a callable called by `interrupt` for the other stops.
+
+        The hook is called with the process, the tid and the `waitpid`
+        status of each stop reported by a thread before its SIGSTOP (e.g. a
+        syscall-exit-stop), while the thread is still stopped. It may return
+        the ptrace request used to resume the thread (`ptrace.cont` by
+        default).
+        '''
+        self._on_interrupt.append(hook)
+
+    def interrupt(self):
+        '''Stops all the threads continued by `_cont_thread`.
+
+        A thread which stops for another reason before receiving its SIGSTOP
+        is given to the `on_interrupt` hooks and resumed (without its
+        signal) until it consumes the SIGSTOP, so that no SIGSTOP is left
+        pending.
+
+        Returns
+        -------
+        dict
+            The tid and the `waitpid` status of the threads which exited or
+            were stopped by another signal before receiving the SIGSTOP.
+        '''
+        for tid in self._running:
+            ptrace.tgkill(self._pid, tid, signal.SIGSTOP)
+        self._stopping.update(self._running)
+        others = {}
+        while len(self._running) != 0:
+            tid, status = self._wait_thread()
+            if not os.WIFSTOPPED(status):
+                self._stopping.discard(tid)
+                others[tid] = status
+                continue
+            if self._is_interrupted(tid, status):
+                continue
+            request = None
+            for hook in self._on_interrupt:
+                request = hook(self, tid, status) or request
+            # the ptrace event and syscall stops are not signals to deliver
+            sig = os.WSTOPSIG(status)
+            if status >> 16 == 0 and sig != signal.SIGTRAP | 0x80:
+                others[tid] = status
+            # a thread without a pending SIGSTOP (e.g. a new one) stays stopped
+            if tid in self._stopping:
+                self._cont_thread(tid, 0, request or ptrace.cont)
+        return others
 
     def get_maps(self, filter_=None):
         '''Returns the mappings of the process.
@@ -106,16 +334,212 @@ class Process:
         maps.get_maps
         '''
         maps_ = get_maps(self._pid, filter_)
+        if filter_ is None:
+            self._set_maps(maps_)
         return maps_
 
+    def _set_maps(self, maps_):
+        self._maps        = sorted(maps_, key=lambda m: m.start_address)
+        self._maps_starts = [m.start_address for m in self._maps]
+        live              = {(m.start_address, m.end_address) for m in self._maps}
+        self._backends    = {
+            key: backend for key, backend in self._backends.items() if key[:2] in live
+        }
+
+    def _split(self, addr, size):
+        '''Splits a space of the process memory by mapping.
+
+        The cached mappings are refreshed once if a part of the space is not
+        found.
+
+        Returns
+        -------
+        list of (maps.Mapping, int, int)
+            The mapping, the address and the size of each part.
+
+        Raises
+        ------
+        ProcessVMException
+            If a part of the space is not mapped.
+        '''
+        for refresh in (self._maps is None, True):
+            if refresh:
+                self.get_maps()
+            parts = []
+            cur   = addr
+            end   = addr + size
+            while cur < end:
+                i = bisect.bisect_right(self._maps_starts, cur) - 1
+                if i < 0 or cur >= self._maps[i].end_address:
+                    break
+                mapping = self._maps[i]
+                n       = min(end, mapping.end_address) - cur
+                parts.append((mapping, cur, n))
+                cur    += n
+            else:
+                return parts
+        raise ProcessVMException(f'{hex(cur)} is not mapped')
+
+    def _access(self, op, mapping, fct):
+        '''Calls fct with the backends allowed for a mapping until one works.
+
+        The backend which worked is remembered and tried first the next time.
+        '''
+        key    = (mapping.start_address, mapping.end_address, op)
+        cached = self._backends.get(key)
+        error  = None
+        if cached is not None:
+            try:
+                return fct(cached)
+            except (ProcessVMException, PtraceException, OSError) as e:
+                error = e
+        if op == 'read':
+            backends = READ_BACKENDS['r' in mapping.perms]
+        else:
+            backends = WRITE_BACKENDS['w' in mapping.perms]
+        for backend in backends:
+            if backend == cached:
+                continue
+            try:
+                result = fct(backend)
+            except (ProcessVMException, PtraceException, OSError) as e:
+                error = e
+                continue
+            self._backends[key] = backend
+            return result
+        raise ProcessVMException(
+            f'unable to {op} {hex(mapping.start_address)}-' \
+            f'{hex(mapping.end_address)} ({mapping.perms}): {error}'
+        ) from error
+
+    def modules(self, refresh=False):
+        '''Returns the table of the files (executable, libraries, etc.) loaded
+        into the process.
+
+        The table is built once. It is refreshed by the lookups when the
+        mappings changed or when refresh is set (only the new modules are
+        then built).
+
+        See Also
+        --------
+        modules.ModuleTable
+        '''
+        if self._modules is None:
+            self._modules = ModuleTable(self._pid, self.get_maps())
+        elif refresh:
+            self._modules.refresh(self.get_maps())
+        return self._modules
+
+    def snapshot(self, syscall=None):
+        '''Saves the registers of the traced threads and the content of the
+        writable mappings.
+
+        Parameters
+        ----------
+        syscall : Plugin, optional
+            The strategy used to inject syscalls if the mappings must be
+            fixed by a restore.
+
+        Returns
+        -------
+        snapshot.Snapshot
+            The saved state, put back by `Snapshot.restore`.
+        '''
+        # imported here: it needs the syscall plugin
+        from .snapshot import Snapshot
+        return Snapshot(self, syscall)
+
+    def get_threads(self):
+        '''Returns the tids of all the threads of the process.'''
+        return [int(tid) for tid in os.listdir(f'/proc/{self._pid}/task')]
+
+    @property
+    def attached(self):
+        '''True if the process has been attached by `attach` (and not
+        detached since).'''
+        return self._attached
+
     def attach(self):
         '''Attaches the process with ptrace.'''
         self._call_ptrace(ptrace.attach)
         self._wait(signal.SIGSTOP)
+        self._attached = True
+
+    def attach_threads(self):
+        '''Attaches all the other threads of the process.
+
+        `attach` only attaches the main thread. The threads created after
+        this call are not attached.
+
+        Returns
+        -------
+        list of int
+            The tids of the newly attached threads.
+        '''
+        attached = []
+        for tid in self.get_threads():
+            if tid == self._pid or tid in self._threads:
+                continue
+            self._call_ptrace(ptrace.attach, tid=tid)
+            os.waitpid(tid, ptrace.WALL)
+            self._threads.add(tid)
+            attached.append(tid)
+        return attached
 
-    def detach(self):
-        '''Detaches the process.'''
+    def on_detach(self, hook):
+        '''Registers a callable called with the process before its detach.
+
+        It allows plugins to release what they created into the process
+        (e.g. memory mappings). The hooks are called once, in the reverse
+        order of their registration.
+        '''
+        self._on_detach.append(hook)
+
+    def pin(self, reason):
+        '''Prevents the process from being detached by `detach`.
+
+        It is used by the plugins leaving the process unusable once
+        detached (e.g. `systrace.SeccompTracer`).
+
+        Parameters
+        ----------
+        reason : str
+            Why the process must stay traced (given into the error raised by
+            `detach`).
+        '''
+        self._pins.append(reason)
+
+    def detach(self, force=False):
+        '''Detaches the process (and all its attached threads).
+
+        The running threads are stopped, all the watchpoints and breakpoints
+        are removed and the `on_detach` hooks are called before.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Detach even if the process has been pinned (see `pin`).
+
+        Raises
+        ------
+        RuntimeError
+            If the process has been pinned and force is not set. Nothing is
+            done then.
+        '''
+        if len(self._pins) != 0 and not force:
+            raise RuntimeError(f'the process can not be detached: {self._pins[0]}')
+        self.interrupt()
+        if self._watchpoints is not None:
+            self._watchpoints.clear()
+        if self._breakpoints is not None:
+            self._breakpoints.clear()
+        while len(self._on_detach) != 0:
+            self._on_detach.pop()(self)
+        for tid in self._threads:
+            self._call_ptrace(ptrace.detach, tid=tid)
+        self._threads.clear()
         self._call_ptrace(ptrace.detach)
+        self._attached = False
 
     def step(self):
         '''Executes one instruction into the process, pauses it and returns.'''
@@ -157,6 +581,98 @@ class Process:
         '''
         self._call_ptrace(ptrace.setregs, regs)
 
+    def get_regset(self, type_=ptrace.NT_PRSTATUS, regset=None, tid=None):
+        '''Gets a register set with PTRACE_GETREGSET.
+
+        Parameters
+        ----------
+        type_ : int, optional
+            The register set: ptrace.NT_PRSTATUS (the general registers),
+            ptrace.NT_PRFPREG (the x87/SSE registers) or ptrace.NT_X86_XSTATE
+            (the XSAVE area: AVX, etc.).
+        regset : ptrace.RegSet, optional
+            If provided, it is filled instead of a new one (type_ is then
+            ignored).
+        tid : int, optional
+            The thread (the main thread by default).
+
+        Returns
+        -------
+        ptrace.RegSet
+            The register set (its size is the one given by the kernel).
+        '''
+        if regset is None:
+            regset = ptrace.RegSet(type_)
+        regset.reset()
+        self._call_ptrace(ptrace.getregset, regset.type_, regset.iov, tid=tid)
+        return regset
+
+    def set_regset(self, regset, tid=None):
+        '''Sets a register set (got by `get_regset`) with PTRACE_SETREGSET.'''
+        self._call_ptrace(ptrace.setregset, regset.type_, regset.iov, tid=tid)
+
+    def _regset_type(self, type_):
+        if type_ == ptrace.NT_PRSTATUS:
+            return ptrace.UserRegsStruct
+        if type_ == ptrace.NT_PRFPREG:
+            return ptrace.UserFpregsStruct
+        if type_ not in self._regset_lens:
+            self._regset_lens[type_] = self.get_regset(type_).size
+        return ctypes.c_ubyte * self._regset_lens[type_]
+
+    def get_threads_regs(self, type_=ptrace.NT_PRSTATUS, regs=None):
+        '''Gets a register set of all the traced threads into one array.
+
+        Each thread is read with one PTRACE_GETREGSET writing directly into
+        the array, through iovecs kept for the next calls.
+
+        Parameters
+        ----------
+        type_ : int, optional
+            The register set (see `get_regset`).
+        regs : ctypes array, optional
+            An array returned by a previous call for the same set, reused if
+            the number of threads did not change.
+
+        Returns
+        -------
+        ctypes array
+            The registers of each thread, in the order of `threads`: an array
+            of ptrace.UserRegsStruct for NT_PRSTATUS, of
+            ptrace.UserFpregsStruct for NT_PRFPREG and of byte arrays (of the
+            set size) for the other sets.
+
+        Raises
+        ------
+        ValueError
+            If regs is not an array of the type of the set.
+
+        Examples
+        --------
+        >>> regs = process.get_threads_regs()
+        >>> for tid, thread_regs in zip(process.threads, regs):
+        >>>     print(tid, hex(thread_regs.rip))
+        '''
+        tids = self.threads
+        elem = self._regset_type(type_)
+        if regs is not None and getattr(regs, '_type_', None) is not elem:
+            raise ValueError(f'regs is not an array of {elem.__name__}')
+        if regs is None or len(regs) != len(tids):
+            regs = (elem * len(tids))()
+        key = (tuple(tids), ctypes.addressof(regs), ctypes.sizeof(regs))
+        # the iovecs are only set again for a new array or new threads
+        if self._regset_iovs is None or self._regset_iovs[0] != key:
+            iovs = (uio.IOVec * len(tids))()
+            size = ctypes.sizeof(regs) // len(tids)
+            for i in range(len(tids)):
+                iovs[i].iov_base = key[1] + i * size
+                iovs[i].iov_len  = size
+            self._regset_iovs = (key, list(zip(tids, iovs)))
+        for tid, iov in self._regset_iovs[1]:
+            # the elements have the size of the set: the kernel keeps iov_len
+            self._call_ptrace(ptrace.getregset, type_, iov, tid=tid)
+        return regs
+
     @contextlib.contextmanager
     def get_regs_and_restore(self, regs=None):
         '''Contextmanager allowing to restore registers.
@@ -279,6 +795,190 @@ class Process:
                 f'{nb_write} ({size} expected)'
             )
 
+    def read_mem_scatter(self, ranges):
+        '''Reads several spaces of the process memory with as few syscalls as
+        possible.
+
+        All the ranges are given to one `uio_readv` call (split in batches of
+        `uio.IOV_MAX` ranges). The process does not need to be stopped.
+
+        Parameters
+        ----------
+        ranges : iterable of (int, int)
+            The (address, size) of each space to read.
+
+        Returns
+        -------
+        list of bytes
+            The data read for each range, in the same order. Contrary to
+            `read_mem_array`, no exception is raised when a space is not
+            readable: its result is just shorter than expected (or empty).
+        '''
+        ranges  = list(ranges)
+        results = []
+        start   = 0
+        while start < len(ranges):
+            batch  = ranges[start:start + uio.IOV_MAX]
+            total  = sum(size for _, size in batch)
+            buf    = bytearray(total)
+            local  = (uio.IOVec * len(batch))()
+            remote = (uio.IOVec * len(batch))()
+            base   = ctypes.addressof((ctypes.c_char * total).from_buffer(buf)) if total else 0
+            off    = 0
+            for i, (addr, size) in enumerate(batch):
+                local[i].iov_base  = base + off
+                local[i].iov_len   = size
+                remote[i].iov_base = addr
+                remote[i].iov_len  = size
+                off += size
+            nb_read = max(uio.readv(self._pid, local, remote), 0)
+            raw     = memoryview(buf)
+            off     = 0
+            # the kernel stops at the first unreadable range: keep what has
+            # been read and restart just after this one
+            for i, (_, size) in enumerate(batch):
+                got = min(size, max(nb_read - off, 0))
+                results.append(bytes(raw[off:off + got]))
+                off += size
+                if got < size:
+                    start += i + 1
+                    break
+            else:
+                start += len(batch)
+        return results
+
+    @staticmethod
+    def _find_nul(data, width, start):
+        '''Returns the offset of the first NUL character (aligned on width).'''
+        nul = b'\x00' * width
+        pos = data.find(nul, start)
+        while pos != -1 and pos % width != 0:
+            pos = data.find(nul, pos + 1)
+        return pos
+
+    def _read_strings(self, addrs, width, max_size):
+        '''Reads NUL-terminated strings of width bytes characters.
+
+        Each round reads the next chunk of every unterminated string with one
+        `read_mem_scatter` call. A chunk never crosses a page boundary: the
+        strings ending just before an unmapped page are read.
+        '''
+        max_size = max_size - max_size % width
+        results  = [bytearray() for _ in addrs]
+        valid    = [True] * len(addrs)
+        pending  = list(range(len(addrs)))
+        while len(pending) != 0:
+            ranges = []
+            for i in pending:
+                cur  = addrs[i] + len(results[i])
+                size = min(PAGE_SIZE - cur % PAGE_SIZE, max_size - len(results[i]))
+                ranges.append((cur, size))
+            next_ = []
+            for i, (_, size), data in zip(pending, ranges, self.read_mem_scatter(ranges)):
+                result = results[i]
+                start  = len(result) - len(result) % width
+                result.extend(data)
+                end    = self._find_nul(result, width, start)
+                if end != -1:
+                    del result[end:]
+                elif len(data) != size:
+                    # unmapped (or unreadable) page
+                    valid[i] = len(result) != 0
+                    del result[len(result) - len(result) % width:]
+                elif len(result) < max_size:
+                    next_.append(i)
+            pending = next_
+        return [bytes(r) if ok else None for r, ok in zip(results, valid)]
+
+    def read_cstrings(self, addrs, max_size=PAGE_SIZE):
+        '''Reads several NUL-terminated strings.
+
+        The first chunk of every string (up to the end of its page) is read
+        with one `process_vm_readv` call, then the next page of each
+        unterminated string is read with one more call, and so on.
+
+        Parameters
+        ----------
+        addrs : iterable of int
+            The addresses of the strings.
+        max_size : int, optional
+            The max size of a string (without its NUL).
+
+        Returns
+        -------
+        list of bytes
+            The strings (without their NUL), in the same order. A string is
+            truncated if it reaches max_size or an unreadable page, and is
+            None if its first byte is not readable.
+        '''
+        return self._read_strings(list(addrs), 1, max_size)
+
+    def read_cstring(self, addr, max_size=PAGE_SIZE):
+        '''Reads a NUL-terminated string (see `read_cstrings`).'''
+        return self.read_cstrings([addr], max_size)[0]
+
+    def read_wstrings(self, addrs, max_chars=PAGE_SIZE // 4):
+        '''Reads several NUL-terminated wide strings (4 bytes `wchar_t`).
+
+        It works like `read_cstrings` and returns a list of str (or None).
+        '''
+        results = self._read_strings(list(addrs), 4, 4 * max_chars)
+        return [None if r is None else r.decode('utf-32-le', 'replace') for r in results]
+
+    def read_wstring(self, addr, max_chars=PAGE_SIZE // 4):
+        '''Reads a NUL-terminated wide string (see `read_wstrings`).'''
+        return self.read_wstrings([addr], max_chars)[0]
+
+    def write_mem_scatter(self, chunks):
+        '''Writes into several spaces of the process memory with as few
+        syscalls as possible.
+
+        All the chunks are given to one `uio_writev` call (split in batches of
+        `uio.IOV_MAX` chunks).
+
+        Parameters
+        ----------
+        chunks : iterable of (int, bytes)
+            The address and the data of each space to write.
+
+        Returns
+        -------
+        list of int
+            The number of bytes written for each chunk, in the same order. As
+            for `read_mem_scatter`, no exception is raised when a space is not
+            writable.
+        '''
+        chunks  = list(chunks)
+        results = []
+        start   = 0
+        while start < len(chunks):
+            batch  = chunks[start:start + uio.IOV_MAX]
+            buf    = ctypes.create_string_buffer(b''.join(data for _, data in batch))
+            local  = (uio.IOVec * len(batch))()
+            remote = (uio.IOVec * len(batch))()
+            base   = ctypes.addressof(buf)
+            off    = 0
+            for i, (addr, data) in enumerate(batch):
+                local[i].iov_base  = base + off
+                local[i].iov_len   = len(data)
+                remote[i].iov_base = addr
+                remote[i].iov_len  = len(data)
+                off += len(data)
+            nb_write = max(uio.writev(self._pid, local, remote), 0)
+            off      = 0
+            # the kernel stops at the first unwritable chunk: restart just
+            # after this one
+            for i, (_, data) in enumerate(batch):
+                done = min(len(data), max(nb_write - off, 0))
+                results.append(done)
+                off += len(data)
+                if done < len(data):
+                    start += i + 1
+                    break
+            else:
+                start += len(batch)
+        return results
+
     @contextlib.contextmanager
     def write_mem_array_and_restore(self, addr, data):
         '''Contextmanager allowing to restore a written contiguous space.'''
@@ -287,5 +987,146 @@ class Process:
             self.write_mem_array(addr, data)
             yield
         finally:
-            self.write_mem_array(addr, backup.raw)
+            # the buffer ends with an extra NUL byte
+            self.write_mem_array(addr, backup.raw[:len(data)])
+
+    def transaction(self, rollback=True):
+        '''Returns a transaction grouping writes into the process memory.
+
+        Contrary to the `*_and_restore` context managers, the writes are
+        applied with one batch at the commit and all undone with one batch
+        at the exit.
+
+        Parameters
+        ----------
+        rollback : bool, optional
+            If True, everything is rolled back at the exit of the context
+            manager. Else the pending writes are committed at the exit (and
+            everything is rolled back only on exception).
+
+        Returns
+        -------
+        transaction.Transaction
+            The transaction, to use as a context manager.
+        '''
+        return Transaction(self, rollback)
+
+    def _read_with(self, backend, addr, buf):
+        '''Fills buf (a writable memoryview) with the memory at addr.'''
+        size = len(buf)
+        if backend == 'vm':
+            local_iov  = uio.iovec((ctypes.c_char * size).from_buffer(buf), size)
+            remote_iov = uio.iovec(addr, size)
+            nb_read    = uio.read(self._pid, local_iov, remote_iov)
+        elif backend == 'mem':
+            nb_read    = self._procmem.readinto(self, addr, buf)
+        else:
+            start      = addr & ~7
+            end        = (addr + size + 7) & ~7
+            data       = self.read_mem_words(start, (end - start) // 8)
+            buf[:]     = memoryview(data)[addr - start:addr - start + size]
+            nb_read    = size
+        if nb_read != size:
+            raise ProcessVMException(
+                f'invalid read number:' \
+                f'{nb_read} ({size} expected)'
+            )
+
+    def _write_with(self, backend, addr, data):
+        if backend == 'vm':
+            return self.write_mem_array(addr, data)
+        if backend == 'mem':
+            nb_write = self._procmem.write(self, addr, data)
+            if nb_write != len(data):
+                raise ProcessVMException(
+                    f'invalid write number:' \
+                    f'{nb_write} ({len(data)} expected)'
+                )
+            return
+        # a big write would be slow, and done partially on a failure
+        if len(data) > WORDS_MAX_WRITE:
+            raise ProcessVMException(
+                f'refusing to write {len(data)} bytes word by word'
+            )
+        start = addr & ~7
+        end   = (addr + len(data) + 7) & ~7
+        buf   = self.read_mem_words(start, (end - start) // 8)
+        buf[addr - start:addr - start + len(data)] = data
+        self.write_mem_words(start, bytes(buf))
+
+    def read(self, addr, size):
+        '''Reads a space of the process memory with the fastest available
+        method.
+
+        The space is split by mapping and read into one buffer. For each
+        mapping, its /proc/mem file (`plugins.readmem.ProcMem`) is used, else
+        `read_mem_array` (process_vm_readv) if it is readable or, as a last
+        resort, `read_mem_words`.
+        When a method fails, the next one is tried and the method which
+        worked is remembered for the next accesses to the mapping.
+
+        The mappings are cached: call `get_maps` to refresh them after the
+        process changed its mappings (they are refreshed automatically when
+        an address is not found).
 
+        Parameters
+        ----------
+        addr : int
+            The address of the space.
+        size : int
+            The size of the space.
+
+        Returns
+        -------
+        bytes
+            The read bytes.
+
+        Raises
+        ------
+        ProcessVMException
+            If a part of the space is not mapped or can not be read.
+        '''
+        buf  = bytearray(size)
+        view = memoryview(buf)
+        for mapping, cur, n in self._split(addr, size):
+            part = view[cur - addr:cur - addr + n]
+            self._access(
+                'read',
+                mapping,
+                lambda backend: self._read_with(backend, cur, part)
+            )
+        return bytes(buf)
+
+    def write(self, addr, data):
+        '''Writes into a space of the process memory with the fastest
+        available method.
+
+        It works like `read`: `write_mem_array` (process_vm_writev) is used
+        for the writable mappings, the /proc/mem file for the other ones
+        (e.g. code) and `write_mem_words` as a last resort.
+
+        Warnings
+        --------
+        `write_mem_words` is only used for writes of at most
+        `WORDS_MAX_WRITE` bytes.
+
+        Parameters
+        ----------
+        addr : int
+            The address of the space.
+        data : bytes-like
+            The data to write.
+
+        Raises
+        ------
+        ProcessVMException
+            If a part of the space is not mapped or can not be written.
+        '''
+        data = bytes(data)
+        for mapping, cur, n in self._split(addr, len(data)):
+            chunk = data[cur - addr:cur - addr + n]
+            self._access(
+                'write',
+                mapping,
+                lambda backend: self._write_with(backend, cur, chunk)
+            )
@@ -0,0 +1,197 @@
+
+'''Indexes the pointers stored into the memory of a process by target.
+
+The index answers "which words point to this object?". It is built by
+reading the writable mappings of the process by large chunks (with
+`process_vm_readv` into a reused numpy buffer), seeing them as arrays of
+aligned 64 bits words and keeping the words whose value is into a mapping
+(one vectorized `searchsorted` against the sorted mappings). The (target,
+source) pairs are sorted by target and stored into a `.npy` file of shape
+(2, n): the first row holds the targets, the second one the sources. The
+file is memory-mapped and a lookup is a binary search.
+
+This module requires numpy.
+'''
+
+import os
+import tempfile
+
+from .libc import uio
+
+
+#############
+# Constants #
+#############
+
+# size of the reads done while building an index
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+###########
+# Helpers #
+###########
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('the pointer index requires numpy') from None
+    return numpy
+
+
+def _writable(mapping):
+    return 'w' in mapping.perms
+
+
+###########
+# Classes #
+###########
+
+class PointerIndex:
+    '''A sorted and memory-mapped index of the pointers of a process.
+
+    Examples
+    --------
+    >>> index = PointerIndex.build(process, 'pointers.npy')
+    >>> index.referrers(obj_addr)
+    >>> # the pointers to any byte of the object
+    >>> targets, sources = index.referrers_range(obj_addr, obj_addr + obj_size)
+    '''
+
+    def __init__(self, path):
+        '''Opens an index built by `build`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the index.
+
+        Raises
+        ------
+        ValueError
+            If the file is not an index.
+        '''
+        numpy = _numpy()
+        pairs = numpy.load(path, mmap_mode='r')
+        if pairs.ndim != 2 or pairs.shape[0] != 2 or pairs.dtype != numpy.dtype('<u8'):
+            raise ValueError(f'{path} is not a pointer index')
+        self._numpy   = numpy
+        self._targets = pairs[0]
+        self._sources = pairs[1]
+
+    @classmethod
+    def build(cls, process, path, sources=_writable, targets=None, chunk_size=CHUNK_SIZE):
+        '''Builds the index of the pointers of a process.
+
+        The process should be stopped for the index to be consistent.
+
+        Parameters
+        ----------
+        process : Process
+            The process to index.
+        path : str
+            The path of the index (a `.npy` file).
+        sources : callable, optional
+            Selects the mappings scanned for pointers (the writable ones by
+            default).
+        targets : callable, optional
+            Selects the mappings into which a value is a pointer (all the
+            mappings by default).
+        chunk_size : int, optional
+            The size of each read.
+
+        Returns
+        -------
+        PointerIndex
+            The opened index.
+        '''
+        numpy  = _numpy()
+        maps_  = process.get_maps()
+        ranges = sorted(
+            (m.start_address, m.end_address)
+            for m in maps_ if targets is None or targets(m)
+        )
+        starts = numpy.array([start for start, _ in ranges], dtype=numpy.uint64)
+        ends   = numpy.array([end for _, end in ranges], dtype=numpy.uint64)
+        chunk_size -= chunk_size % 8
+        folder      = os.path.dirname(os.path.abspath(path))
+        # the pairs are first appended to temporary files
+        with tempfile.TemporaryFile(dir=folder) as tmp_targets, \
+             tempfile.TemporaryFile(dir=folder) as tmp_sources:
+            count  = 0
+            # the chunks are read into the same buffer, without copy
+            buf    = numpy.empty(chunk_size // 8, dtype='<u8')
+            local  = (uio.IOVec * 1)()
+            remote = (uio.IOVec * 1)()
+            local[0].iov_base = buf.ctypes.data
+            for mapping in maps_:
+                if sources is not None and not sources(mapping):
+                    continue
+                for addr in range(mapping.start_address, mapping.end_address, chunk_size):
+                    size               = min(chunk_size, mapping.end_address - addr)
+                    local[0].iov_len   = size
+                    remote[0].iov_base = addr
+                    remote[0].iov_len  = size
+                    nb_read            = max(uio.readv(process.pid, local, remote), 0)
+                    words              = buf[:nb_read // 8]
+                    if len(starts) == 0:
+                        break
+                    # most of the words (0, small integers, etc.) are out of
+                    # all the mappings: a cheap bound check drops them first
+                    found = numpy.flatnonzero((words >= starts[0]) & (words < ends[-1]))
+                    i     = numpy.searchsorted(starts, words[found], side='right') - 1
+                    found = found[words[found] < ends[i]]
+                    tmp_targets.write(words[found].tobytes())
+                    tmp_sources.write((addr + 8 * found.astype(numpy.uint64)).tobytes())
+                    count += len(found)
+                    if nb_read != size:
+                        break
+            tmp_targets.flush()
+            tmp_sources.flush()
+            pairs = numpy.lib.format.open_memmap(path, mode='w+', dtype='<u8', shape=(2, count))
+            if count != 0:
+                all_targets = numpy.memmap(tmp_targets, dtype='<u8', mode='r', shape=(count,))
+                order       = numpy.argsort(all_targets, kind='stable')
+                pairs[0]    = all_targets[order]
+                del all_targets
+                pairs[1]    = numpy.memmap(tmp_sources, dtype='<u8', mode='r', shape=(count,))[order]
+            pairs.flush()
+            del pairs
+        return cls(path)
+
+    def __len__(self):
+        return len(self._targets)
+
+    def referrers(self, addr):
+        '''Returns the addresses of the words whose value is addr.
+
+        Returns
+        -------
+        numpy.ndarray
+            The sorted source addresses (a view of the index).
+        '''
+        addr = self._numpy.uint64(addr)
+        lo   = self._targets.searchsorted(addr, side='left')
+        hi   = self._targets.searchsorted(addr, side='right')
+        return self._sources[lo:hi]
+
+    def referrers_range(self, start, end):
+        '''Returns the pointers to an address of [start, end) (e.g. to any
+        field of an object).
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+            The targets (sorted) and the matching sources (views of the
+            index).
+        '''
+        lo = self._targets.searchsorted(self._numpy.uint64(start), side='left')
+        hi = self._targets.searchsorted(self._numpy.uint64(end), side='left')
+        return self._targets[lo:hi], self._sources[lo:hi]
+
+    def count_referrers(self, addrs):
+        '''Returns the number of words pointing to each address.'''
+        addrs = self._numpy.asarray(addrs, dtype=self._numpy.uint64)
+        lo    = self._targets.searchsorted(addrs, side='left')
+        hi    = self._targets.searchsorted(addrs, side='right')
+        return hi - lo
@@ -0,0 +1,394 @@
+
+'''Samples the Python stacks of a CPython process without stopping it.
+
+The interpreter state is found through the `_PyRuntime` symbol, then all the
+thread states and frames are read with `Process.read_mem_scatter` (which uses
+`process_vm_readv`): the target is never attached nor stopped.
+
+Supported versions: CPython 3.11, 3.12 and 3.13 (x86 64). Other builds can be
+sampled by giving their own `PyOffsets`.
+'''
+
+import os
+import struct
+import time
+
+from dataclasses import dataclass, field
+
+from .elf import ElfFile, ElfException
+
+
+#############
+# Constants #
+#############
+
+# _PyInterpreterFrame.owner of the C stack shim frames (3.12+)
+FRAME_OWNED_BY_CSTACK = 3
+
+# max depth of a frame chain (protects against inconsistent reads)
+MAX_DEPTH = 1024
+
+# max number of bytes read for one code object name/filename
+MAX_STR_SIZE = 512
+
+# cookie at the beginning of _PyRuntime since 3.13
+DEBUG_OFFSETS_COOKIE = b'xdebugpy'
+
+_U64 = struct.Struct('<Q')
+_U32 = struct.Struct('<I')
+_I32 = struct.Struct('<i')
+
+
+###########
+# Classes #
+###########
+
+@dataclass
+class PyOffsets:
+    '''Offsets of the CPython structure fields read by the sampler.'''
+    runtime_interpreters_head : int
+    interp_threads_head       : int
+    tstate_next               : int
+    tstate_thread_id          : int
+    tstate_native_thread_id   : int
+    # PyThreadState.cframe (< 3.13) or PyThreadState.current_frame
+    tstate_frame              : int
+    # _PyCFrame.current_frame or None if there is no cframe (3.13+)
+    cframe_current_frame      : int
+    frame_previous            : int
+    frame_code                : int
+    frame_owner               : int
+    code_filename             : int
+    code_name                 : int
+    code_qualname             : int
+    code_firstlineno          : int
+    unicode_state             : int
+    unicode_length            : int
+    ascii_size                : int
+    compact_size              : int
+
+
+# offsets computed from the headers of each version
+OFFSETS = {
+    (3, 11): PyOffsets(
+        runtime_interpreters_head = 40,
+        interp_threads_head       = 16,
+        tstate_next               = 8,
+        tstate_thread_id          = 152,
+        tstate_native_thread_id   = 160,
+        tstate_frame              = 56,
+        cframe_current_frame      = 8,
+        frame_previous            = 48,
+        frame_code                = 32,
+        frame_owner               = 69,
+        code_filename             = 112,
+        code_name                 = 120,
+        code_qualname             = 128,
+        code_firstlineno          = 72,
+        unicode_state             = 32,
+        unicode_length            = 16,
+        ascii_size                = 48,
+        compact_size              = 72
+    ),
+    (3, 12): PyOffsets(
+        runtime_interpreters_head = 40,
+        interp_threads_head       = 72,
+        tstate_next               = 8,
+        tstate_thread_id          = 136,
+        tstate_native_thread_id   = 144,
+        tstate_frame              = 56,
+        cframe_current_frame      = 0,
+        frame_previous            = 8,
+        frame_code                = 0,
+        frame_owner               = 70,
+        code_filename             = 112,
+        code_name                 = 120,
+        code_qualname             = 128,
+        code_firstlineno          = 68,
+        unicode_state             = 32,
+        unicode_length            = 16,
+        ascii_size                = 40,
+        compact_size              = 56
+    )
+}
+
+
+@dataclass
+class PyFrame:
+    '''Stores the description of one Python frame.'''
+    name      : str
+    qualname  : str
+    filename  : str
+    firstline : int
+
+
+@dataclass
+class ThreadSample:
+    '''Stores the Python stack of one thread (innermost frame first).'''
+    thread_id        : int
+    native_thread_id : int
+    frames           : list = field(default_factory=list)
+
+
+class PyStackSampler:
+    '''Samples the Python stacks of all the threads of a CPython process.
+
+    Each sample costs one read per thread state, one scatter read per stack
+    level (all the threads are walked together) and, for code objects never
+    seen before, two more scatter reads. Code object descriptions are cached
+    by address, so a steady state sample mostly costs the frame reads.
+
+    Examples
+    --------
+    >>> sampler = PyStackSampler(Process(pid))
+    >>> for sample in sampler.sample():
+    >>>     print(sample.native_thread_id, [f.qualname for f in sample.frames])
+    '''
+
+    def __init__(self, process, offsets=None, cache_size=65536):
+        '''
+        Parameters
+        ----------
+        process : Process
+            The process to sample. It does not need to be attached.
+        offsets : PyOffsets, optional
+            The offsets to use. By default, they are found from the version
+            of the target interpreter.
+        cache_size : int, optional
+            The max number of code objects kept into the cache.
+        '''
+        self._process    = process
+        self._offsets    = offsets
+        self._cache_size = cache_size
+        self._codes      = {}
+        self._runtime    = None
+        self._version    = None
+
+    @property
+    def version(self):
+        '''The (major, minor) version of the target interpreter.'''
+        if self._runtime is None:
+            self._locate()
+        return self._version
+
+    @property
+    def offsets(self):
+        if self._runtime is None:
+            self._locate()
+        return self._offsets
+
+    def _read_word(self, addr):
+        data = self._process.read_mem_scatter([(addr, 8)])[0]
+        if len(data) != 8:
+            raise RuntimeError(f'unable to read the word at {hex(addr)}')
+        return _U64.unpack(data)[0]
+
+    def _locate(self):
+        '''Finds `_PyRuntime` into the mapped python binary or libpython.'''
+        pid   = self._process.pid
+        paths = {}
+        for m in self._process.get_maps(lambda m: 'python' in os.path.basename(m.pathname)):
+            if m.offset == 0 and m.pathname not in paths:
+                paths[m.pathname] = m.start_address
+        for path, start in paths.items():
+            try:
+                elf = ElfFile(f'/proc/{pid}/root{path}')
+            except (OSError, ElfException):
+                continue
+            try:
+                runtime = elf.get_symbol('_PyRuntime')
+                version = elf.get_symbol('Py_Version')
+                bias    = start - elf.min_vaddr
+            finally:
+                elf.close()
+            if runtime is None:
+                continue
+            self._runtime = bias + runtime
+            if version is not None:
+                hexversion    = self._read_word(bias + version)
+                self._version = ((hexversion >> 24) & 0xff, (hexversion >> 16) & 0xff)
+            break
+        else:
+            raise RuntimeError('_PyRuntime not found (is it a CPython process?)')
+        if self._offsets is None:
+            self._offsets = self._find_offsets()
+
+    def _find_offsets(self):
+        if self._version in OFFSETS:
+            return OFFSETS[self._version]
+        if self._version == (3, 13):
+            return self._read_debug_offsets()
+        raise RuntimeError(
+            f'no offsets known for CPython {self._version}, provide your own PyOffsets'
+        )
+
+    def _read_debug_offsets(self):
+        '''Builds the offsets from the _Py_DebugOffsets of a 3.13 runtime.'''
+        data = self._process.read_mem_scatter([(self._runtime, 71 * 8)])[0]
+        if len(data) != 71 * 8 or data[:8] != DEBUG_OFFSETS_COOKIE:
+            raise RuntimeError('invalid _Py_DebugOffsets')
+        words = struct.unpack_from('<71Q', data)
+        return PyOffsets(
+            runtime_interpreters_head = words[5],
+            interp_threads_head       = words[9],
+            tstate_next               = words[21],
+            tstate_thread_id          = words[24],
+            tstate_native_thread_id   = words[25],
+            tstate_frame              = words[23],
+            cframe_current_frame      = None,
+            frame_previous            = words[29],
+            frame_code                = words[30],
+            frame_owner               = words[33],
+            code_filename             = words[35],
+            code_name                 = words[36],
+            code_qualname             = words[37],
+            code_firstlineno          = words[39],
+            unicode_state             = words[68],
+            unicode_length            = words[69],
+            ascii_size                = words[70],
+            # PyCompactUnicodeObject adds utf8_length and utf8 to PyASCIIObject
+            compact_size              = words[70] + 16
+        )
+
+    def _thread_states(self):
+        '''Returns the (addr, raw data) of all the thread states.'''
+        o      = self._offsets
+        interp = self._read_word(self._runtime + o.runtime_interpreters_head)
+        addr   = self._read_word(interp + o.interp_threads_head)
+        size   = max(o.tstate_next, o.tstate_thread_id, o.tstate_native_thread_id, o.tstate_frame) + 8
+        states = []
+        seen   = set()
+        while addr != 0 and addr not in seen and len(states) < MAX_DEPTH:
+            seen.add(addr)
+            data = self._process.read_mem_scatter([(addr, size)])[0]
+            if len(data) != size:
+                break
+            states.append(data)
+            addr = _U64.unpack_from(data, o.tstate_next)[0]
+        return states
+
+    def _read_frames(self, samples, frames):
+        '''Walks all the frame chains together, one scatter read per level.
+
+        `frames` gives the current frame address of each sample.
+        '''
+        o       = self._offsets
+        size    = max(o.frame_previous, o.frame_code, o.frame_owner) + 8
+        pending = [(s, f) for s, f in zip(samples, frames) if f != 0]
+        depth   = 0
+        while len(pending) != 0 and depth < MAX_DEPTH:
+            datas = self._process.read_mem_scatter((f, size) for _, f in pending)
+            next_ = []
+            for (sample, _), data in zip(pending, datas):
+                if len(data) != size:
+                    continue
+                if data[o.frame_owner] != FRAME_OWNED_BY_CSTACK:
+                    sample.frames.append(_U64.unpack_from(data, o.frame_code)[0])
+                previous = _U64.unpack_from(data, o.frame_previous)[0]
+                if previous != 0:
+                    next_.append((sample, previous))
+            pending = next_
+            depth  += 1
+
+    def _decode_str(self, data):
+        o = self._offsets
+        if len(data) < o.ascii_size:
+            return '?'
+        state  = _U32.unpack_from(data, o.unicode_state)[0]
+        length = _U64.unpack_from(data, o.unicode_length)[0]
+        kind   = (state >> 2) & 7
+        if not (state >> 5) & 1 or kind not in (1, 2, 4):
+            return '?'
+        start = o.ascii_size if (state >> 6) & 1 else o.compact_size
+        raw   = data[start:start + length * kind]
+        return raw.decode({1: 'latin-1', 2: 'utf-16-le', 4: 'utf-32-le'}[kind], errors='replace')
+
+    def _resolve_codes(self, codes):
+        '''Reads and caches the description of the given code objects.'''
+        o      = self._offsets
+        size   = max(o.code_filename, o.code_name, o.code_qualname, o.code_firstlineno) + 8
+        codes  = list(codes)
+        datas  = self._process.read_mem_scatter((c, size) for c in codes)
+        fields = {}
+        for code, data in zip(codes, datas):
+            if len(data) != size:
+                continue
+            fields[code] = (
+                _U64.unpack_from(data, o.code_name)[0],
+                _U64.unpack_from(data, o.code_qualname)[0],
+                _U64.unpack_from(data, o.code_filename)[0],
+                _I32.unpack_from(data, o.code_firstlineno)[0]
+            )
+        # level 2: all the strings of all the new code objects
+        strs    = list({s for f in fields.values() for s in f[:3] if s != 0})
+        datas   = self._process.read_mem_scatter((s, o.compact_size + MAX_STR_SIZE) for s in strs)
+        decoded = {s: self._decode_str(d) for s, d in zip(strs, datas)}
+        if len(self._codes) + len(fields) > self._cache_size:
+            self._codes.clear()
+        for code, (name, qualname, filename, firstline) in fields.items():
+            self._codes[code] = PyFrame(
+                decoded.get(name, '?'),
+                decoded.get(qualname, '?'),
+                decoded.get(filename, '?'),
+                firstline
+            )
+
+    def sample(self):
+        '''Takes one sample of all the Python stacks.
+
+        Returns
+        -------
+        list of ThreadSample
+            One sample per thread. As the target keeps running, a stack may
+            be truncated when it changes during the read.
+        '''
+        if self._runtime is None:
+            self._locate()
+        o       = self._offsets
+        samples = []
+        frames  = []
+        for data in self._thread_states():
+            samples.append(ThreadSample(
+                _U64.unpack_from(data, o.tstate_thread_id)[0],
+                _U64.unpack_from(data, o.tstate_native_thread_id)[0]
+            ))
+            frames.append(_U64.unpack_from(data, o.tstate_frame)[0])
+        # < 3.13: one more level to read _PyCFrame.current_frame
+        if o.cframe_current_frame is not None:
+            ranges = [(f + o.cframe_current_frame, 8) for f in frames if f != 0]
+            datas  = iter(self._process.read_mem_scatter(ranges))
+            frames = [
+                _U64.unpack(d)[0] if len(d) == 8 else 0
+                for d in (next(datas) if f != 0 else b'' for f in frames)
+            ]
+        self._read_frames(samples, frames)
+        missing = {c for s in samples for c in s.frames if c not in self._codes}
+        if len(missing) != 0:
+            self._resolve_codes(missing)
+        unknown = PyFrame('?', '?', '?', 0)
+        for s in samples:
+            s.frames = [self._codes.get(c, unknown) for c in s.frames]
+        return samples
+
+    def samples(self, rate=100, count=None):
+        '''Yields samples at a fixed rate.
+
+        Parameters
+        ----------
+        rate : float, optional
+            The number of samples per second.
+        count : int, optional
+            The number of samples to take. Infinite by default.
+        '''
+        period = 1 / rate
+        next_  = time.perf_counter()
+        taken  = 0
+        while count is None or taken < count:
+            yield self.sample()
+            taken += 1
+            next_ += period
+            delay  = next_ - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_ = time.perf_counter()
@@ -0,0 +1,609 @@
+
+'''Typed views of remote C structures and of remote memory.
+
+A `RemoteStruct` binds a `ctypes.Structure` definition to an address of the
+process memory. The whole structure is read the first time one of its
+fields is accessed, then the fields are decoded from this local copy:
+
+    - the pointer fields (`ctypes.POINTER(T)`) give a lazy `RemoteStruct` of
+      the pointed structure (or None if NULL),
+    - the other pointer fields give the pointed address,
+    - the nested structures give a `RemoteStruct` sharing the local copy of
+      their parent,
+    - the other fields are decoded by ctypes (an array field is a ctypes
+      array: assign a whole array to write it).
+
+The written fields are only updated into the local copy and recorded into a
+`WriteBuffer`: `flush` writes all of them with one `process_vm_writev`.
+
+A `RemoteBuffer` exposes a space of the process memory as a bytes-like
+object whose pages are read on demand.
+'''
+
+import ctypes
+import struct
+import sys
+
+from collections import OrderedDict
+
+
+#############
+# Constants #
+#############
+
+PAGE_SIZE = 4096
+
+
+###########
+# Helpers #
+###########
+
+# ctypes type -> {name: (offset, size, type)}
+_layouts = {}
+
+
+def _layout(type_):
+    '''Returns the offset, the size and the type of each field of type_.'''
+    layout = _layouts.get(type_)
+    if layout is None:
+        layout = {}
+        for cls in reversed(type_.__mro__):
+            for field in cls.__dict__.get('_fields_', ()):
+                name, ftype = field[:2]
+                layout[name] = (getattr(type_, name).offset, ctypes.sizeof(ftype), ftype)
+        _layouts[type_] = layout
+    return layout
+
+
+def _is_struct(type_):
+    return issubclass(type_, (ctypes.Structure, ctypes.Union))
+
+
+def _is_pointer(type_):
+    return issubclass(type_, (ctypes._Pointer, ctypes.c_char_p, ctypes.c_wchar_p, ctypes.c_void_p))
+
+
+def fetch_all(structs):
+    '''Reads several remote structures with one `process_vm_readv` call.
+
+    The structures already read (or sharing the copy of a parent) are
+    skipped. All the structures must belong to the same process.
+
+    Returns
+    -------
+    list of RemoteStruct
+        The given structures.
+
+    Raises
+    ------
+    process.ProcessVMException
+        If a structure can not be read.
+    '''
+    structs = list(structs)
+    todo    = [s for s in structs if s._buf is None and s._parent is None]
+    if len(todo) == 0:
+        return structs
+    process = todo[0]._process
+    results = process.read_mem_scatter((s._addr, ctypes.sizeof(s._type)) for s in todo)
+    for struct, data in zip(todo, results):
+        if len(data) != ctypes.sizeof(struct._type):
+            # not readable with process_vm_readv: let `read` choose
+            data = process.read(struct._addr, ctypes.sizeof(struct._type))
+        struct._bind(bytearray(data), 0)
+    return structs
+
+
+###########
+# Classes #
+###########
+
+class WriteBuffer:
+    '''Collects the fields written into remote structures.
+
+    Examples
+    --------
+    >>> with WriteBuffer(process) as writer:
+    >>>     regs = RemoteStruct(process, ptrace.UserRegsStruct, addr, writer)
+    >>>     regs.rax = 0
+    >>>     regs.rip = 0x401000
+    >>> # here both fields have been written with one process_vm_writev
+    '''
+
+    def __init__(self, process):
+        self._process = process
+        # id of a local copy -> (local copy, remote address, [(offset, size)])
+        self._dirty   = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def __len__(self):
+        return sum(len(ranges) for _, _, ranges in self._dirty.values())
+
+    def add(self, buf, addr, offset, size):
+        '''Records that buf[offset:offset + size] must be written at addr +
+        offset.'''
+        entry = self._dirty.get(id(buf))
+        if entry is None:
+            entry = self._dirty[id(buf)] = (buf, addr, [])
+        entry[2].append((offset, size))
+
+    def chunks(self):
+        '''Returns the (address, data) to write, the adjacent ranges being
+        merged.'''
+        chunks = []
+        for buf, addr, ranges in self._dirty.values():
+            ranges.sort()
+            start, end = ranges[0][0], ranges[0][0] + ranges[0][1]
+            for offset, size in ranges[1:]:
+                if offset > end:
+                    chunks.append((addr + start, bytes(buf[start:end])))
+                    start = offset
+                end = max(end, offset + size)
+            chunks.append((addr + start, bytes(buf[start:end])))
+        return chunks
+
+    def flush(self):
+        '''Writes all the recorded ranges with one `process_vm_writev` call.
+
+        The ranges which can not be (fully) written this way (e.g. into a
+        non writable mapping) are completed with `Process.write`, which
+        raises a `ProcessVMException` if they still can not be written.
+        '''
+        if len(self._dirty) == 0:
+            return
+        chunks      = self.chunks()
+        self._dirty = {}
+        written     = self._process.write_mem_scatter(chunks)
+        for (addr, data), done in zip(chunks, written):
+            if done != len(data):
+                self._process.write(addr + done, data[done:])
+
+
+class RemoteStruct:
+    '''A view of a C structure stored into the process memory.
+
+    The fields are accessed as attributes (or items if a field name is
+    shadowed by a method of this class).
+
+    Examples
+    --------
+    >>> class Node(ctypes.Structure):
+    >>>     pass
+    >>> Node._fields_ = [('value', ctypes.c_int64), ('next', ctypes.POINTER(Node))]
+    >>> node = RemoteStruct(process, Node, head_addr)
+    >>> while node is not None:
+    >>>     print(node.value)
+    >>>     node = node.next
+    '''
+
+    __slots__ = ('_process', '_type', '_addr', '_writer', '_parent', '_buf', '_offset', '_local')
+
+    def __init__(self, process, type_, addr, writer=None, parent=None):
+        '''
+        Parameters
+        ----------
+        process : Process
+            The process owning the structure.
+        type_ : ctypes.Structure subclass
+            The definition of the structure.
+        addr : int
+            The address of the structure into the process.
+        writer : WriteBuffer, optional
+            The buffer recording the written fields. By default, a new one
+            is created (and shared with the structures reached from this
+            one).
+        parent : RemoteStruct, optional
+            The structure containing this one (its local copy is shared).
+        '''
+        set_ = object.__setattr__
+        set_(self, '_process', process)
+        set_(self, '_type',    type_)
+        set_(self, '_addr',    addr)
+        set_(self, '_writer',  WriteBuffer(process) if writer is None else writer)
+        set_(self, '_parent',  parent)
+        set_(self, '_buf',     None)
+        set_(self, '_offset',  0)
+        set_(self, '_local',   None)
+
+    def __repr__(self):
+        return f'RemoteStruct({self._type.__name__}, {hex(self._addr)})'
+
+    @property
+    def address(self):
+        return self._addr
+
+    @property
+    def type_(self):
+        return self._type
+
+    @property
+    def writer(self):
+        return self._writer
+
+    def _bind(self, buf, offset):
+        set_ = object.__setattr__
+        set_(self, '_buf',    buf)
+        set_(self, '_offset', offset)
+        set_(self, '_local',  self._type.from_buffer(buf, offset))
+
+    def fetch(self):
+        '''(Re)reads the structure (the pending writes are flushed before).
+
+        A nested structure is read with its parent.
+        '''
+        self._writer.flush()
+        if self._parent is not None:
+            parent = self._parent
+            parent.fetch()
+            self._bind(parent._buf, parent._offset + (self._addr - parent._addr))
+        else:
+            data = self._process.read(self._addr, ctypes.sizeof(self._type))
+            self._bind(bytearray(data), 0)
+        return self
+
+    def local(self):
+        '''Returns the local copy of the structure (a ctypes instance).'''
+        if self._local is None:
+            self.fetch()
+        return self._local
+
+    def flush(self):
+        '''Writes the modified fields (see `WriteBuffer.flush`).'''
+        self._writer.flush()
+
+    def array(self, length):
+        '''Returns a `RemoteArray` of length structures starting at this one.'''
+        return RemoteArray(self._process, self._type, self._addr, length, writer=self._writer)
+
+    def __getitem__(self, name):
+        layout = _layout(self._type)
+        if name not in layout:
+            raise KeyError(name)
+        offset, size, ftype = layout[name]
+        local = self.local()
+        if _is_struct(ftype):
+            child = RemoteStruct(self._process, ftype, self._addr + offset, self._writer, self)
+            child._bind(self._buf, self._offset + offset)
+            return child
+        if _is_pointer(ftype):
+            addr = ctypes.c_void_p.from_buffer(self._buf, self._offset + offset).value
+            if not issubclass(ftype, ctypes._Pointer) or not _is_struct(ftype._type_):
+                return addr
+            if addr is None:
+                return None
+            return RemoteStruct(self._process, ftype._type_, addr, self._writer)
+        return getattr(local, name)
+
+    def __setitem__(self, name, value):
+        layout = _layout(self._type)
+        if name not in layout:
+            raise KeyError(name)
+        offset, size, ftype = layout[name]
+        local = self.local()
+        if _is_struct(ftype):
+            raise TypeError('a nested structure must be written field by field')
+        if _is_pointer(ftype):
+            if isinstance(value, RemoteStruct):
+                value = value.address
+            ctypes.c_void_p.from_buffer(self._buf, self._offset + offset).value = value
+        else:
+            setattr(local, name, value)
+        # the local copy starts at self._addr - self._offset
+        self._writer.add(self._buf, self._addr - self._offset, self._offset + offset, size)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        if name not in _layout(self._type):
+            raise AttributeError(f'{self._type.__name__} has no field {name}')
+        self[name] = value
+
+
+class RemoteArray:
+    '''A view of an array stored into the process memory.
+
+    The elements are read by batches: accessing an element reads the whole
+    batch containing it with one read and a slice is read with one read.
+    The elements which are structures are given as `RemoteStruct` sharing
+    the local copy of their batch, the other ones are decoded by ctypes.
+
+    Examples
+    --------
+    >>> entries = RemoteArray(process, Entry, table_addr, 100000)
+    >>> for entry in entries[:1000]:
+    >>>     print(entry.key)
+    '''
+
+    def __init__(self, process, type_, addr, length, batch=None, writer=None):
+        '''
+        Parameters
+        ----------
+        process : Process
+            The process owning the array.
+        type_ : ctypes type
+            The type of the elements.
+        addr : int
+            The address of the first element.
+        length : int
+            The number of elements.
+        batch : int, optional
+            The number of elements read at once (64 KiB by default).
+        writer : WriteBuffer, optional
+            The buffer recording the written fields of the elements.
+        '''
+        self._process = process
+        self._type    = type_
+        self._addr    = addr
+        self._length  = length
+        self._size    = ctypes.sizeof(type_)
+        self._batch   = batch if batch is not None else max(1, 65536 // self._size)
+        self._writer  = WriteBuffer(process) if writer is None else writer
+        # batch index -> local copy
+        self._batches = {}
+
+    def __repr__(self):
+        return f'RemoteArray({self._type.__name__}, {hex(self._addr)}, {self._length})'
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def address(self):
+        return self._addr
+
+    @property
+    def writer(self):
+        return self._writer
+
+    def fetch(self, start=0, stop=None):
+        '''Reads the batches covering [start, stop) with one read.'''
+        stop  = self._length if stop is None else min(stop, self._length)
+        if start >= stop:
+            return
+        first = start // self._batch
+        last  = (stop - 1) // self._batch
+        todo  = [i for i in range(first, last + 1) if i not in self._batches]
+        if len(todo) == 0:
+            return
+        # one read from the first to the last missing batch
+        begin = todo[0] * self._batch
+        end   = min((todo[-1] + 1) * self._batch, self._length)
+        data  = self._process.read(self._addr + begin * self._size, (end - begin) * self._size)
+        for i in todo:
+            lo = (i * self._batch - begin) * self._size
+            hi = (min((i + 1) * self._batch, self._length) - begin) * self._size
+            self._batches[i] = bytearray(data[lo:hi])
+
+    def clear(self):
+        '''Drops the local copies (the pending writes are flushed before).'''
+        self._writer.flush()
+        self._batches.clear()
+
+    def _element(self, index):
+        batch  = index // self._batch
+        if batch not in self._batches:
+            self.fetch(index, index + 1)
+        buf    = self._batches[batch]
+        offset = (index - batch * self._batch) * self._size
+        addr   = self._addr + index * self._size
+        if _is_struct(self._type):
+            struct = RemoteStruct(self._process, self._type, addr, self._writer)
+            struct._bind(buf, offset)
+            return struct
+        return self._type.from_buffer(buf, offset).value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indexes = range(*index.indices(self._length))
+            if len(indexes) != 0:
+                self.fetch(min(indexes), max(indexes) + 1)
+            return [self._element(i) for i in indexes]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('array index out of range')
+        return self._element(index)
+
+    def __setitem__(self, index, value):
+        if _is_struct(self._type):
+            raise TypeError('a structure must be written field by field')
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('array index out of range')
+        batch = index // self._batch
+        if batch not in self._batches:
+            self.fetch(index, index + 1)
+        offset = (index - batch * self._batch) * self._size
+        self._type.from_buffer(self._batches[batch], offset).value = value
+        self._writer.add(
+            self._batches[batch],
+            self._addr + batch * self._batch * self._size,
+            offset,
+            self._size
+        )
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self._element(i)
+
+    def flush(self):
+        self._writer.flush()
+
+
+class RemoteBuffer:
+    '''A read-only bytes-like view of a space of the process memory.
+
+    The buffer is indexed from 0 (its start address) like a bytes object:
+    an index gives a byte and a slice gives bytes. The pages are read on
+    demand (all the missing pages of an access with one `process_vm_readv`)
+    and kept into a LRU cache of max_pages pages. The pages which can not be
+    read this way (non readable mappings) are read with `Process.read`.
+
+    The buffer protocol is supported on Python 3.12+ (`memoryview(buf)`,
+    `re.search(pattern, buf)`, `numpy.frombuffer(buf)`, etc.) and through
+    `memoryview()` on the older versions. As a memoryview needs contiguous
+    local memory, the whole space is then read: prefer slicing,
+    `unpack_from` and `find` to only read the needed pages.
+
+    Examples
+    --------
+    >>> heap = process.get_maps(lambda m: m.pathname == '[heap]')[0]
+    >>> buf  = RemoteBuffer.from_mapping(process, heap)
+    >>> magic, size = buf.unpack_from('<II', 0x10)
+    >>> offset = buf.find(b'password=')
+    '''
+
+    def __init__(self, process, start, end, max_pages=256):
+        '''
+        Parameters
+        ----------
+        process : Process
+            The process owning the memory.
+        start : int
+            The address of the first byte.
+        end : int
+            The address following the last byte.
+        max_pages : int, optional
+            The max number of cached pages.
+
+        Raises
+        ------
+        ValueError
+            If [start, end) is not covered by contiguous mappings.
+        '''
+        if end < start:
+            raise ValueError('end is lower than start')
+        cur = start
+        for m in sorted(process.get_maps(), key=lambda m: m.start_address):
+            if m.start_address <= cur < m.end_address:
+                cur = m.end_address
+        if cur < end:
+            raise ValueError(f'{hex(cur)} is not mapped')
+        self._process   = process
+        self._start     = start
+        self._end       = end
+        self._max_pages = max_pages
+        # page address -> page data
+        self._pages     = OrderedDict()
+
+    @classmethod
+    def from_mapping(cls, process, mapping, max_pages=256):
+        '''Returns a buffer covering a whole mapping (see `maps.Mapping`).'''
+        return cls(process, mapping.start_address, mapping.end_address, max_pages)
+
+    def __repr__(self):
+        return f'RemoteBuffer({hex(self._start)}, {hex(self._end)})'
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def end(self):
+        return self._end
+
+    def invalidate(self):
+        '''Drops the cached pages (e.g. after the process ran).'''
+        self._pages.clear()
+
+    def _load(self, pages):
+        '''Reads the missing pages with one scatter read.'''
+        missing = [page for page in pages if page not in self._pages]
+        datas   = self._process.read_mem_scatter((page, PAGE_SIZE) for page in missing)
+        for page, data in zip(missing, datas):
+            if len(data) != PAGE_SIZE:
+                # the mapping can not be read with process_vm_readv
+                first = max(page, self._start)
+                last  = min(page + PAGE_SIZE, self._end)
+                data  = bytes(first - page) + self._process.read(first, last - first)
+                data += bytes(PAGE_SIZE - len(data))
+            self._pages[page] = data
+
+    def read(self, offset, size):
+        '''Returns size bytes from offset (clipped to the buffer).
+
+        Raises
+        ------
+        process.ProcessVMException
+            If the memory can not be read anymore.
+        '''
+        first = self._start + max(offset, 0)
+        last  = min(first + max(size, 0), self._end)
+        if first >= last:
+            return b''
+        pages = range(first & ~(PAGE_SIZE - 1), last, PAGE_SIZE)
+        self._load(pages)
+        for page in pages:
+            self._pages.move_to_end(page)
+        data = b''.join(self._pages[page] for page in pages)
+        while len(self._pages) > self._max_pages:
+            self._pages.popitem(last=False)
+        skip = first - pages[0]
+        return data[skip:skip + last - first]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.read(start, stop - start)
+            if step > 0:
+                return self.read(start, stop - start)[::step]
+            return self.read(stop + 1, start - stop)[::step]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('buffer index out of range')
+        return self.read(index, 1)[0]
+
+    def __iter__(self):
+        for offset in range(0, len(self), PAGE_SIZE):
+            yield from self.read(offset, PAGE_SIZE)
+
+    def unpack_from(self, format_, offset=0):
+        '''Same as `struct.unpack_from`, only reading the needed pages.'''
+        format_ = struct.Struct(format_) if isinstance(format_, str) else format_
+        data    = self.read(offset, format_.size)
+        if len(data) != format_.size:
+            raise struct.error('unpack_from requires a bigger buffer')
+        return format_.unpack(data)
+
+    def find(self, sub, start=0, end=None, chunk=16 * PAGE_SIZE):
+        '''Returns the lowest offset of sub into [start, end) or -1.
+
+        The buffer is read by chunks: the pages following a match are not
+        read.
+        '''
+        end     = len(self) if end is None else min(end, len(self))
+        overlap = max(len(sub) - 1, 0)
+        offset  = start
+        while offset < end:
+            data  = self.read(offset, min(chunk + overlap, end - offset))
+            found = data.find(sub)
+            if found != -1:
+                return offset + found
+            offset += chunk
+        return -1
+
+    def tobytes(self):
+        '''Reads the whole buffer.'''
+        return self.read(0, len(self))
+
+    def memoryview(self):
+        '''Returns a memoryview of the whole buffer (read at once).'''
+        return memoryview(self.tobytes())
+
+    if sys.version_info >= (3, 12):
+        def __buffer__(self, flags):
+            return self.memoryview()
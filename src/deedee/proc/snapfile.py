@@ -0,0 +1,437 @@
+
+'''Saves the memory of a process into a file and reads it back offline.
+
+The file is made of (all the integers are little-endian):
+
+    - a header: magic, version, flags, pid, number of threads, number of
+      mappings and the offsets of the tables;
+    - the thread table: the tid and the `ptrace.UserRegsStruct` of each
+      thread;
+    - the mapping table: the addresses, offset, permissions and the location
+      of the data of each mapping (its dev and pathname are stored into a
+      string table);
+    - the data of each mapping. Without compression, they are page aligned
+      and read with zero-copy slices of the mmapped file. With compression,
+      they are split into zlib-compressed blocks of `BLOCK_SIZE` bytes,
+      preceded by the offsets of the blocks.
+
+`SnapshotProcess` provides the read methods of `Process` over such a file:
+the tools only reading the memory (remote structures, walkers, scanners,
+etc.) work on it unchanged.
+'''
+
+import bisect
+import contextlib
+import ctypes
+import mmap
+import os
+import struct
+import zlib
+
+from collections import OrderedDict
+
+from .libc    import ptrace
+from .maps    import Mapping
+from .process import Process, ProcessVMException
+
+
+#############
+# Constants #
+#############
+
+MAGIC   = b'DDSNAP\x00\x00'
+VERSION = 1
+
+PAGE_SIZE = 4096
+
+# size of the uncompressed blocks
+BLOCK_SIZE = 64 * 1024
+
+# size of the reads done while saving a mapping
+READ_SIZE = 16 * 1024 * 1024
+
+# mapping flags
+FLAG_ZLIB = 0x1
+
+# magic, version, flags, pid, threads, mappings, threads / mappings / strings offsets
+_HEADER  = struct.Struct('<8sIIIII4xQQQ')
+_THREAD  = struct.Struct('<Q')
+# start, end, offset, inode, data offset, data size, captured size, flags,
+# perms, dev offset, dev size, path offset, path size
+_MAPPING = struct.Struct('<QQQQQQQI4sIIII')
+_REGS    = ctypes.sizeof(ptrace.UserRegsStruct)
+
+# max number of uncompressed blocks kept by a reader
+MAX_BLOCKS = 256
+
+
+###########
+# Helpers #
+###########
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) & ~(alignment - 1)
+
+
+def _readable(mapping):
+    return mapping.perms[0] == 'r'
+
+
+#############
+# Functions #
+#############
+
+def save(process, path, compress=False, filter_=_readable, regs=None):
+    '''Saves the registers and the memory of a process into a file.
+
+    The file is removed if the save fails.
+
+    Parameters
+    ----------
+    process : Process
+        The process to save (it must be attached to save the registers).
+    path : str
+        The path of the file.
+    compress : bool, optional
+        If True, the data are compressed with zlib by blocks.
+    filter_ : callable, optional
+        Selects the mappings to save (the readable ones by default). The
+        data which can not be read are not saved: reading them from the
+        file raises `ProcessVMException`.
+    regs : bool, optional
+        If True, the registers of the traced threads are saved. By default,
+        they are saved only if the process is attached.
+
+    Returns
+    -------
+    int
+        The size of the file.
+
+    Raises
+    ------
+    RuntimeError
+        If regs is True and the process is not attached.
+    '''
+    if regs is None:
+        regs = process.attached
+    elif regs and not process.attached:
+        raise RuntimeError('the process must be attached to save its registers')
+    maps_   = [m for m in process.get_maps() if filter_ is None or filter_(m)]
+    threads = []
+    if regs:
+        for tid, regs_ in zip(process.threads, process.get_threads_regs()):
+            threads.append((tid, bytes(regs_)))
+    strings = bytearray()
+    names   = []
+    for m in maps_:
+        dev, path_ = m.dev.encode(), m.pathname.encode()
+        names.append((len(strings), len(dev), len(strings) + len(dev), len(path_)))
+        strings += dev + path_
+    try:
+        return _write(process, path, compress, maps_, threads, names, strings)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(path)
+        raise
+
+
+def _write(process, path, compress, maps_, threads, names, strings):
+    '''Writes the file of `save`.'''
+    threads_off = _HEADER.size
+    maps_off    = threads_off + len(threads) * (_THREAD.size + _REGS)
+    strings_off = maps_off + len(maps_) * _MAPPING.size
+    entries     = []
+    with open(path, 'wb') as f:
+        offset = _align(strings_off + len(strings), PAGE_SIZE)
+        for m in maps_:
+            f.seek(offset)
+            size, captured = _save_data(process, f, m, compress)
+            entries.append((offset, size, captured))
+            offset = _align(offset + size, 8 if compress else PAGE_SIZE)
+        f.truncate(max(offset, f.tell()))
+        f.seek(0)
+        f.write(_HEADER.pack(
+            MAGIC, VERSION, 0, process.pid, len(threads), len(maps_),
+            threads_off, maps_off, strings_off
+        ))
+        for tid, data in threads:
+            f.write(_THREAD.pack(tid) + data)
+        for m, (data_off, size, captured), names_ in zip(maps_, entries, names):
+            f.write(_MAPPING.pack(
+                m.start_address, m.end_address, m.offset, int(m.inode), data_off, size, captured,
+                FLAG_ZLIB if compress else 0, m.perms.encode(), *names_
+            ))
+        f.write(strings)
+        return offset
+
+
+def _save_data(process, f, mapping, compress):
+    '''Writes the data of a mapping at the current position of f.
+
+    Returns
+    -------
+    (int, int)
+        The size written into the file and the number of saved bytes.
+    '''
+    captured = 0
+    blocks   = []
+    start    = f.tell()
+    if compress:
+        n = (mapping.size + BLOCK_SIZE - 1) // BLOCK_SIZE
+        # room for the block offsets, written at the end
+        f.seek(start + 8 * (n + 1))
+    for addr in range(mapping.start_address, mapping.end_address, READ_SIZE):
+        size = min(READ_SIZE, mapping.end_address - addr)
+        data = process.read_mem_scatter([(addr, size)])[0]
+        if compress:
+            for off in range(0, len(data), BLOCK_SIZE):
+                blocks.append(f.tell() - start)
+                f.write(zlib.compress(data[off:off + BLOCK_SIZE], 1))
+        else:
+            f.write(data)
+        captured += len(data)
+        if len(data) != size:
+            break
+    if compress:
+        blocks.append(f.tell() - start)
+        end = f.tell()
+        f.seek(start)
+        f.write(struct.pack(f'<{len(blocks)}Q', *blocks))
+        f.seek(end)
+    return f.tell() - start, captured
+
+
+###########
+# Classes #
+###########
+
+class _Entry:
+    '''A mapping of a snapshot file and the location of its data.'''
+
+    __slots__ = ('mapping', 'data_off', 'size', 'captured', 'flags', 'blocks')
+
+    def __init__(self, mapping, data_off, size, captured, flags):
+        self.mapping  = mapping
+        self.data_off = data_off
+        self.size     = size
+        self.captured = captured
+        self.flags    = flags
+        self.blocks   = None
+
+
+class SnapshotProcess:
+    '''A process read from a snapshot file (see `save`).
+
+    It provides the read methods of `Process` (`read_mem_array`,
+    `read_mem_words`, `read`, `read_mem_scatter`, the string readers,
+    `get_maps`, `get_regs`). The uncompressed data are returned as slices of
+    the mmapped file, without copy.
+
+    Examples
+    --------
+    >>> snapfile.save(process, 'app.snap')
+    >>> process.detach()
+    >>> with SnapshotProcess('app.snap') as offline:
+    >>>     head = RemoteStruct(offline, Node, head_addr)
+    >>>     print(head.value)
+    '''
+
+    # the string readers of Process only rely on read_mem_scatter
+    _find_nul      = staticmethod(Process._find_nul)
+    _read_strings  = Process._read_strings
+    read_cstrings  = Process.read_cstrings
+    read_cstring   = Process.read_cstring
+    read_wstrings  = Process.read_wstrings
+    read_wstring   = Process.read_wstring
+
+    def __init__(self, path):
+        '''
+        Parameters
+        ----------
+        path : str
+            The path of the snapshot file.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a snapshot file.
+        '''
+        with open(path, 'rb') as f:
+            # a copy-on-write mapping: ctypes can build views on it
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        try:
+            self._parse()
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+        self._blocks = OrderedDict()
+
+    def _parse(self):
+        magic, version, _, pid, n_threads, n_maps, threads_off, maps_off, strings_off = \
+            _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a snapshot file (or unsupported version)')
+        self._pid  = pid
+        self._regs = {}
+        for i in range(n_threads):
+            off = threads_off + i * (_THREAD.size + _REGS)
+            tid = _THREAD.unpack_from(self._map, off)[0]
+            self._regs[tid] = ptrace.UserRegsStruct.from_buffer_copy(self._map, off + _THREAD.size)
+        self._entries = []
+        for i in range(n_maps):
+            start, end, offset, inode, data_off, size, captured, flags, perms, \
+                dev_off, dev_len, path_off, path_len = \
+                _MAPPING.unpack_from(self._map, maps_off + i * _MAPPING.size)
+            dev     = self._map[strings_off + dev_off:strings_off + dev_off + dev_len].decode()
+            path_   = self._map[strings_off + path_off:strings_off + path_off + path_len].decode()
+            mapping = Mapping(start, end, end - start, perms.decode(), offset, dev, str(inode), path_)
+            self._entries.append(_Entry(mapping, data_off, size, captured, flags))
+        self._entries.sort(key=lambda e: e.mapping.start_address)
+        self._starts = [e.mapping.start_address for e in self._entries]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''Closes the file. The views returned before must be released.'''
+        self._blocks.clear()
+        self._map.close()
+
+    @property
+    def pid(self):
+        return self._pid
+
+    @property
+    def threads(self):
+        '''The tids of the saved threads (the main thread first).'''
+        return sorted(self._regs, key=lambda tid: (tid != self._pid, tid))
+
+    def get_maps(self, filter_=None):
+        '''Returns the saved mappings (see `Process.get_maps`).'''
+        maps_ = [e.mapping for e in self._entries]
+        return maps_ if filter_ is None else [m for m in maps_ if filter_(m)]
+
+    def get_regs(self, regs=None, tid=None):
+        '''Returns a copy of the saved registers of a thread (the main one by
+        default).
+
+        Raises
+        ------
+        KeyError
+            If the registers of the thread were not saved.
+        '''
+        saved = self._regs[self._pid if tid is None else tid]
+        if regs is None:
+            regs = ptrace.UserRegsStruct()
+        ctypes.memmove(ctypes.addressof(regs), ctypes.addressof(saved), _REGS)
+        return regs
+
+    def _entry(self, addr):
+        i = bisect.bisect_right(self._starts, addr) - 1
+        if i >= 0 and addr < self._entries[i].mapping.end_address:
+            return self._entries[i]
+        return None
+
+    def _block(self, entry, index):
+        key  = (entry.data_off, index)
+        data = self._blocks.get(key)
+        if data is not None:
+            self._blocks.move_to_end(key)
+            return data
+        if entry.blocks is None:
+            n             = (entry.captured + BLOCK_SIZE - 1) // BLOCK_SIZE
+            entry.blocks  = struct.unpack_from(f'<{n + 1}Q', self._map, entry.data_off)
+        start = entry.data_off + entry.blocks[index]
+        end   = entry.data_off + entry.blocks[index + 1]
+        data  = zlib.decompress(self._map[start:end])
+        self._blocks[key] = data
+        if len(self._blocks) > MAX_BLOCKS:
+            self._blocks.popitem(last=False)
+        return data
+
+    def _read_entry(self, entry, addr, size):
+        '''Reads a space of one mapping (up to its captured data).'''
+        off  = addr - entry.mapping.start_address
+        size = max(0, min(size, entry.captured - off))
+        if not entry.flags & FLAG_ZLIB:
+            start = entry.data_off + off
+            return memoryview(self._map)[start:start + size]
+        parts = []
+        while size > 0:
+            block = self._block(entry, off // BLOCK_SIZE)
+            part  = block[off % BLOCK_SIZE:off % BLOCK_SIZE + size]
+            parts.append(part)
+            off  += len(part)
+            size -= len(part)
+        return memoryview(b''.join(parts))
+
+    def view(self, addr, size):
+        '''Returns a read-only view of a space of the saved memory.
+
+        The view is a slice of the mmapped file (without copy) if the space
+        is into one uncompressed mapping. It is shorter than size if the
+        space is not fully saved.
+        '''
+        parts = []
+        while size > 0:
+            entry = self._entry(addr)
+            if entry is None:
+                break
+            part = self._read_entry(entry, addr, size)
+            if len(parts) == 0 and len(part) == size:
+                return part.toreadonly()
+            parts.append(part)
+            addr += len(part)
+            size -= len(part)
+            if addr != entry.mapping.end_address:
+                break
+        return memoryview(b''.join(parts)).toreadonly()
+
+    def read(self, addr, size):
+        '''Reads a space of the saved memory (see `Process.read`).
+
+        Raises
+        ------
+        ProcessVMException
+            If a part of the space is not saved.
+        '''
+        data = self.view(addr, size)
+        if len(data) != size:
+            raise ProcessVMException(f'{addr + len(data):#x} is not saved')
+        return bytes(data)
+
+    def read_mem_array(self, addr, size):
+        '''Reads a contiguous space of the saved memory.
+
+        Returns
+        -------
+        ctypes.c_char array
+            The read space, as `Process.read_mem_array`. It is built over the
+            mmapped file (without copy) when possible.
+
+        Raises
+        ------
+        ProcessVMException
+            If a part of the space is not saved.
+        '''
+        entry = self._entry(addr)
+        if entry is not None and not entry.flags & FLAG_ZLIB \
+           and addr + size <= entry.mapping.start_address + entry.captured:
+            off = entry.data_off + addr - entry.mapping.start_address
+            return (ctypes.c_char * size).from_buffer(self._map, off)
+        return (ctypes.c_char * size).from_buffer_copy(self.read(addr, size))
+
+    def read_mem_words(self, addr, n=1):
+        '''Reads n words of the saved memory (see `Process.read_mem_words`).'''
+        return bytearray(self.read(addr, 8 * n))
+
+    def read_mem_scatter(self, ranges):
+        '''Reads several spaces of the saved memory.
+
+        As `Process.read_mem_scatter`, no exception is raised when a space
+        is not saved: its result is just shorter than expected.
+        '''
+        return [bytes(self.view(addr, size)) for addr, size in ranges]
@@ -0,0 +1,319 @@
+
+'''Saves the state of a process and puts it back later.
+
+A snapshot stores the registers of the traced threads and the content of all
+the writable mappings. A restore only writes the pages modified since the
+snapshot (or since the last restore):
+
+    - if the kernel tracks the soft-dirty bits, the soft-dirty bits are
+      cleared when the snapshot is taken and the dirty pages are found into
+      the pagemap of the process;
+    - else the writable mappings are read back (with one scatter read) and
+      compared page by page with the snapshot.
+
+The dirty pages are written back with `Process.write_mem_scatter` (one
+`process_vm_writev` per `uio.IOV_MAX` runs of pages).
+'''
+
+import bisect
+
+from dataclasses import dataclass
+
+from .                import pagemap
+from .libc            import ptrace
+from .pagemap         import PAGE_SIZE, PM_SOFT_DIRTY
+from .plugins.syscall import Syscalls
+
+
+#############
+# Constants #
+#############
+
+# mmap prot constants
+PROT_READ  = 1
+PROT_WRITE = 2
+PROT_EXEC  = 4
+
+# mmap flags constants
+MAP_PRIVATE   = 0x02
+MAP_FIXED     = 0x10
+MAP_ANONYMOUS = 0x20
+
+# index of start_brk into the fields of /proc/<pid>/stat after the command
+# name (field 47, the state being the field 3)
+_START_BRK = 44
+
+
+###########
+# Helpers #
+###########
+
+def _prot(perms):
+    return (
+        (PROT_READ  if perms[0] == 'r' else 0) |
+        (PROT_WRITE if perms[1] == 'w' else 0) |
+        (PROT_EXEC  if perms[2] == 'x' else 0)
+    )
+
+
+def _subtract(ranges, holes):
+    '''Returns the parts of some (start, end) ranges not covered by holes.'''
+    holes  = sorted(holes)
+    result = []
+    for start, end in sorted(ranges):
+        for hole_start, hole_end in holes:
+            if hole_end <= start or hole_start >= end:
+                continue
+            if hole_start > start:
+                result.append((start, hole_start))
+            start = max(start, hole_end)
+            if start >= end:
+                break
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def _start_brk(pid):
+    '''Returns the address above which the heap can be grown with brk.'''
+    with open(f'/proc/{pid}/stat', 'rb') as f:
+        data = f.read()
+    return int(data[data.rindex(b')') + 2:].split()[_START_BRK])
+
+
+def _runs(pages):
+    '''Merges the sorted addresses of some pages into (start, end) runs.'''
+    runs = []
+    for page in pages:
+        if len(runs) != 0 and runs[-1][1] == page:
+            runs[-1][1] = page + PAGE_SIZE
+        else:
+            runs.append([page, page + PAGE_SIZE])
+    return runs
+
+
+###########
+# Classes #
+###########
+
+@dataclass
+class Region:
+    '''Stores the content of a writable mapping.'''
+    start : int
+    end   : int
+    perms : str
+    path  : str
+    data  : bytes
+
+
+class Snapshot:
+    '''The registers and the writable memory of a process at a given time.
+
+    The process must be attached (and its threads too, for their registers
+    to be saved). The floating point registers are not saved.
+
+    A snapshot can only be restored if the process has the same threads as
+    when it was taken: the threads created since would keep running over the
+    restored memory.
+
+    If some mappings were created or removed since the snapshot, they are
+    fixed with injected syscalls (a syscall strategy is then required):
+
+        - the program break is put back with brk (which shrinks or removes
+          the heap grown since the snapshot), then the other new mappings
+          are unmapped (the stack is kept);
+        - the removed writable mappings are mapped again (anonymous) and
+          their content is written back;
+        - the changed protections are put back with mprotect.
+
+    The removed read-only mappings (e.g. a library closed since the snapshot)
+    are not mapped again.
+
+    Examples
+    --------
+    >>> snapshot = process.snapshot(plugins.syscall.SyscallByInstrReplacement())
+    >>> for input_ in inputs:
+    >>>     run(process, input_)
+    >>>     snapshot.restore()
+    '''
+
+    def __init__(self, process, syscall=None):
+        '''
+        Parameters
+        ----------
+        process : Process
+            The process to save.
+        syscall : Plugin, optional
+            The strategy used to inject the mmap/munmap/mprotect/brk syscalls
+            if the mappings must be fixed by a restore.
+        '''
+        self._process    = process
+        self._syscall    = syscall
+        self._soft_dirty = pagemap.soft_dirty_supported()
+        self.threads     = set(process.get_threads())
+        self.regs        = dict(zip(process.threads, process.get_threads_regs()))
+        self.maps        = process.get_maps()
+        self.brk         = self._program_break()
+        if self._soft_dirty:
+            pagemap.clear_soft_dirty(process.pid)
+        writable     = [m for m in self.maps if 'w' in m.perms]
+        datas        = process.read_mem_scatter((m.start_address, m.size) for m in writable)
+        self.regions = [
+            Region(m.start_address, m.end_address, m.perms, m.pathname, data)
+            for m, data in zip(writable, datas)
+        ]
+
+    @property
+    def size(self):
+        '''The number of saved bytes.'''
+        return sum(len(region.data) for region in self.regions)
+
+    def _inject(self, syscall, *args):
+        if self._syscall is None:
+            raise RuntimeError('the mappings changed since the snapshot: a syscall strategy is required')
+        ret = self._syscall(self._process, syscall, *args)
+        if ret >= 2**64 - 4095:
+            raise RuntimeError(f'{syscall.name} failed ({ret - 2**64})')
+        return ret
+
+    def _program_break(self):
+        '''Returns the program break of the process.
+
+        It is asked with an injected brk(0) when a syscall strategy is given,
+        else it is the end of the heap (or the start of the heap area if the
+        process has no heap yet).
+        '''
+        if self._syscall is not None:
+            return self._inject(Syscalls.brk, 0)
+        heap = [m for m in self.maps if m.pathname == '[heap]']
+        if len(heap) != 0:
+            return heap[-1].end_address
+        return _start_brk(self._process.pid)
+
+    def _fix_maps(self):
+        '''Puts back the mappings of the snapshot.
+
+        Returns
+        -------
+        list of (int, int)
+            The (start, end) of the mappings created again (to be fully
+            written).
+        '''
+        key     = lambda maps_: [(m.start_address, m.end_address, m.perms) for m in maps_]
+        current = self._process.get_maps()
+        if key(current) == key(self.maps):
+            return []
+        # a heap unmapped without brk would be given again by the next sbrk
+        if self._inject(Syscalls.brk, self.brk) != self.brk:
+            raise RuntimeError(f'brk failed to put back the program break {self.brk:#x}')
+        current = self._process.get_maps()
+        saved   = [(m.start_address, m.end_address) for m in self.maps]
+        changed = False
+        # the growth of the stack is kept
+        grown   = [(m.start_address, m.end_address) for m in current if m.pathname != '[stack]']
+        for start, end in _subtract(grown, saved):
+            self._inject(Syscalls.munmap, start, end - start)
+            changed = True
+        live     = [(m.start_address, m.end_address) for m in current]
+        remapped = []
+        for region in self.regions:
+            for start, end in _subtract([(region.start, region.end)], live):
+                flags = MAP_PRIVATE | MAP_ANONYMOUS | MAP_FIXED
+                self._inject(Syscalls.mmap, start, end - start, _prot(region.perms), flags, -1, 0)
+                remapped.append((start, end))
+                changed = True
+        # both lists are sorted: walk them together
+        i = 0
+        for old in self.maps:
+            while i < len(current) and current[i].end_address <= old.start_address:
+                i += 1
+            j = i
+            while j < len(current) and current[j].start_address < old.end_address:
+                new   = current[j]
+                start = max(old.start_address, new.start_address)
+                end   = min(old.end_address, new.end_address)
+                if old.perms[:3] != new.perms[:3]:
+                    self._inject(Syscalls.mprotect, start, end - start, _prot(old.perms))
+                    changed = True
+                j += 1
+        if changed:
+            # refreshes the mappings cached by the process
+            self._process.get_maps()
+        return remapped
+
+    def _dirty_pages(self):
+        '''Returns the sorted addresses of the pages modified since the
+        snapshot.'''
+        pid   = self._process.pid
+        pages = []
+        if self._soft_dirty:
+            for region in self.regions:
+                entries = pagemap.read_pagemap(pid, region.start, region.start + len(region.data))
+                pages.extend(
+                    region.start + i * PAGE_SIZE
+                    for i, entry in enumerate(entries)
+                    if entry & PM_SOFT_DIRTY
+                )
+            return pages
+        datas = self._process.read_mem_scatter((r.start, len(r.data)) for r in self.regions)
+        for region, data in zip(self.regions, datas):
+            old = region.data
+            # most of the regions are not modified
+            if old == data:
+                continue
+            for off in range(0, len(old), PAGE_SIZE):
+                if old[off:off + PAGE_SIZE] != data[off:off + PAGE_SIZE]:
+                    pages.append(region.start + off)
+        return pages
+
+    def restore(self):
+        '''Puts back the registers and the memory of the snapshot.
+
+        The snapshot can be restored several times.
+
+        Returns
+        -------
+        int
+            The number of written pages.
+
+        Raises
+        ------
+        RuntimeError
+            If the threads of the process changed since the snapshot (nothing
+            is restored then), if the mappings must be fixed and no syscall
+            strategy is given, or if an injected syscall failed.
+        '''
+        process  = self._process
+        threads  = set(process.get_threads())
+        if threads != self.threads:
+            created = sorted(threads - self.threads)
+            exited  = sorted(self.threads - threads)
+            raise RuntimeError(
+                f'the threads changed since the snapshot ' \
+                f'(created: {created}, exited: {exited})'
+            )
+        remapped = self._fix_maps()
+        pages    = self._dirty_pages()
+        if len(remapped) != 0:
+            for start, end in remapped:
+                pages.extend(range(start, end, PAGE_SIZE))
+            pages = sorted(set(pages))
+        chunks = []
+        for region in self.regions:
+            data  = memoryview(region.data)
+            first = bisect.bisect_left(pages, region.start)
+            last  = bisect.bisect_left(pages, region.end)
+            for start, end in _runs(pages[first:last]):
+                chunk = data[start - region.start:end - region.start]
+                if len(chunk) != 0:
+                    chunks.append((start, chunk))
+        written = process.write_mem_scatter(chunks)
+        for (addr, data), done in zip(chunks, written):
+            if done < len(data):
+                process.write(addr + done, bytes(data[done:]))
+        if self._soft_dirty:
+            pagemap.clear_soft_dirty(process.pid)
+        for tid in process.threads:
+            if tid in self.regs:
+                process._call_ptrace(ptrace.setregs, self.regs[tid], tid=tid)
+        return len(pages)
@@ -0,0 +1,147 @@
+
+'''Groups writes into the memory of a process and undoes them at once.
+
+The writes of a transaction are only recorded until its commit. The commit
+then:
+
+    1. merges the overlapping and adjacent writes (the last write of a byte
+       wins);
+    2. reads the original content of all the merged ranges (one scatter
+       read) into a journal;
+    3. writes all the merged ranges with one `process_vm_writev` call. The
+       ranges which can not be written this way (e.g. code) are written with
+       `Process.write` (`/proc/<pid>/mem` or `PTRACE_POKEDATA`).
+
+A rollback writes the journal back the same way, in the reverse order of the
+commits: the bytes written by several commits get their oldest content.
+'''
+
+
+###########
+# Helpers #
+###########
+
+def _coalesce(writes):
+    '''Merges some (address, data) writes into non-overlapping chunks.
+
+    The writes are applied in the given order: where they overlap, the last
+    one wins.
+    '''
+    order  = sorted(range(len(writes)), key=lambda i: writes[i][0])
+    groups = []
+    for i in order:
+        addr, data = writes[i]
+        end        = addr + len(data)
+        if len(groups) != 0 and addr <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], end)
+            groups[-1][2].append(i)
+        else:
+            groups.append([addr, end, [i]])
+    chunks = []
+    for start, end, indexes in groups:
+        buf = bytearray(end - start)
+        for i in sorted(indexes):
+            addr, data = writes[i]
+            buf[addr - start:addr - start + len(data)] = data
+        chunks.append((start, bytes(buf)))
+    return chunks
+
+
+###########
+# Classes #
+###########
+
+class Transaction:
+    '''A set of writes into the memory of a process committed and rolled
+    back at once.
+
+    Used as a context manager (see `Process.transaction`), everything is
+    rolled back at the exit (like `Process.write_mem_array_and_restore`), or
+    only on error if rollback is False.
+
+    Examples
+    --------
+    >>> with process.transaction() as tx:
+    >>>     tx.write(code_addr, PATCH)
+    >>>     tx.write(flag_addr, b'\\x01')
+    >>>     tx.commit()
+    >>>     process.continue_()
+    >>> # here the code and the flag are restored
+    '''
+
+    def __init__(self, process, rollback=True):
+        '''
+        Parameters
+        ----------
+        process : Process
+            The process to write into.
+        rollback : bool, optional
+            If True, the context manager rolls back everything at the exit.
+            Else it commits the pending writes (and rolls back only if an
+            exception is raised).
+        '''
+        self._process  = process
+        self._rollback = rollback
+        # (addr, data) written since the last commit
+        self._pending  = []
+        # (addr, original data) of each commit
+        self._journal  = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if self._rollback or exc_type is not None:
+            self._pending = []
+            self.rollback()
+        else:
+            self.commit()
+
+    @property
+    def pending(self):
+        '''The number of writes not committed yet.'''
+        return len(self._pending)
+
+    @property
+    def journal(self):
+        '''The (address, original data) of the committed chunks, in the
+        commit order.'''
+        return list(self._journal)
+
+    def write(self, addr, data):
+        '''Records a write (applied at the commit).'''
+        if len(data) != 0:
+            self._pending.append((addr, bytes(data)))
+
+    def _write_chunks(self, chunks):
+        process = self._process
+        written = process.write_mem_scatter(chunks)
+        for (addr, data), done in zip(chunks, written):
+            if done != len(data):
+                process.write(addr + done, data[done:])
+
+    def commit(self):
+        '''Applies the pending writes, their original content being saved
+        into the journal.'''
+        if len(self._pending) == 0:
+            return
+        chunks        = _coalesce(self._pending)
+        self._pending = []
+        originals     = self._process.read_mem_scatter((addr, len(data)) for addr, data in chunks)
+        journal       = []
+        for (addr, data), original in zip(chunks, originals):
+            if len(original) != len(data):
+                original = self._process.read(addr, len(data))
+            journal.append((addr, original))
+        self._journal.extend(journal)
+        self._write_chunks(chunks)
+
+    def rollback(self):
+        '''Puts back the original content of all the committed writes. The
+        pending writes are kept.'''
+        if len(self._journal) == 0:
+            return
+        # the oldest content of a byte is applied last
+        chunks        = _coalesce(self._journal[::-1])
+        self._journal = []
+        self._write_chunks(chunks)
@@ -0,0 +1,256 @@
+
+'''Hardware watchpoints based on the x86 debug registers.'''
+
+import os
+import signal
+import time
+
+from .libc import ptrace
+
+
+#############
+# Constants #
+#############
+
+# number of address debug registers (DR0-DR3)
+NB_SLOTS = 4
+
+# DR7 R/W bits of each condition
+CONDITIONS = {
+    'x':  0b00,
+    'w':  0b01,
+    'rw': 0b11
+}
+
+# DR7 LEN bits of each length
+LENGTHS = {
+    1: 0b00,
+    2: 0b01,
+    8: 0b10,
+    4: 0b11
+}
+
+# resume flag: allows to continue on an instruction breakpoint
+EFLAGS_RF = 1 << 16
+
+DR6 = 6
+DR7 = 7
+
+
+###########
+# Classes #
+###########
+
+class Watchpoint:
+    '''Stores the state of one watchpoint.
+
+    Attributes
+    ----------
+    slot : int
+        The index of the debug register (DR0-DR3) holding the address.
+    addr : int
+        The watched address.
+    length : int
+        The number of watched bytes (1, 2, 4 or 8).
+    condition : str
+        'x' (execution), 'w' (write) or 'rw' (read or write).
+    hits : int
+        The number of hits.
+    last_hit : int
+        The `time.perf_counter_ns` value of the last hit.
+    last_tid : int
+        The thread which triggered the last hit.
+    '''
+
+    def __init__(self, slot, addr, length, condition):
+        self.slot      = slot
+        self.addr      = addr
+        self.length    = length
+        self.condition = condition
+        self.hits      = 0
+        self.last_hit  = None
+        self.last_tid  = None
+
+    def __repr__(self):
+        return (
+            f'Watchpoint(addr={hex(self.addr)}, length={self.length}, '
+            f'condition={self.condition!r}, hits={self.hits})'
+        )
+
+    @property
+    def dr7_bits(self):
+        '''The bits of DR7 enabling this watchpoint.'''
+        control = CONDITIONS[self.condition] | (LENGTHS[self.length] << 2)
+        return (1 << (2 * self.slot)) | (control << (16 + 4 * self.slot))
+
+    @property
+    def dr7_mask(self):
+        '''The bits of DR7 owned by this watchpoint.'''
+        return (0b11 << (2 * self.slot)) | (0b1111 << (16 + 4 * self.slot))
+
+
+class WatchpointManager:
+    '''Manages the debug registers of all the traced threads.
+
+    The watchpoints are written into DR0-DR3 and DR7 of every thread given
+    by `Process.threads` (use `Process.attach_threads` to watch all the
+    threads). Between two hits, the threads run at full speed: the CPU
+    raises a debug exception only when a watched address is accessed, and
+    the fired watchpoint is read from DR6.
+
+    The threads are continued independently: when a thread hits a
+    watchpoint, the other ones keep running. Signals received by the
+    threads are transparently delivered.
+
+    Warnings
+    --------
+    Data watchpoints trigger after the access.
+
+    Examples
+    --------
+    >>> process.attach()
+    >>> process.attach_threads()
+    >>> wp = process.watchpoints.add(counter_addr, length=8, condition='w')
+    >>> while wp.hits < 10:
+    >>>     process.watchpoints.cont()
+    >>> process.detach()
+    '''
+
+    def __init__(self, process):
+        self._process = process
+        self._slots   = [None] * NB_SLOTS
+        self._dr7     = 0
+        # signal to deliver to a thread on its next continue
+        self._signals = {}
+        # threads stopped on an execution watchpoint
+        self._resume  = set()
+
+    def __iter__(self):
+        return iter(wp for wp in self._slots if wp is not None)
+
+    def _poke_all(self, index, value):
+        offset = ptrace.DEBUGREG_OFFSET + 8 * index
+        for tid in self._process.threads:
+            self._process._call_ptrace(ptrace.pokeuser, offset, value, tid=tid)
+
+    def add(self, addr, length=8, condition='w'):
+        '''Sets a watchpoint into all the traced threads.
+
+        Parameters
+        ----------
+        addr : int
+            The address to watch. It must be aligned on length.
+        length : int, optional
+            The number of watched bytes: 1, 2, 4 or 8.
+        condition : str, optional
+            'w' to trigger on writes, 'rw' on reads or writes and 'x' on
+            execution (the length must be 1).
+
+        Returns
+        -------
+        Watchpoint
+            The new watchpoint.
+
+        Raises
+        ------
+        ValueError
+            If the parameters are invalid or if the 4 slots are used.
+        '''
+        if length not in LENGTHS:
+            raise ValueError('length must be 1, 2, 4 or 8')
+        if condition not in CONDITIONS:
+            raise ValueError("condition must be 'x', 'w' or 'rw'")
+        if condition == 'x' and length != 1:
+            raise ValueError('an execution watchpoint must have a length of 1')
+        if addr % length != 0:
+            raise ValueError(f'addr is not aligned on {length}')
+        if None not in self._slots:
+            raise ValueError('all the debug registers are used')
+        self.interrupt()
+        slot = self._slots.index(None)
+        wp   = Watchpoint(slot, addr, length, condition)
+        self._poke_all(slot, addr)
+        self._dr7 = (self._dr7 & ~wp.dr7_mask) | wp.dr7_bits
+        self._poke_all(DR7, self._dr7)
+        self._slots[slot] = wp
+        return wp
+
+    def remove(self, wp):
+        '''Disables a watchpoint into all the traced threads.'''
+        self.interrupt()
+        self._dr7 &= ~wp.dr7_mask
+        self._poke_all(DR7, self._dr7)
+        self._slots[wp.slot] = None
+
+    def clear(self):
+        '''Removes all the watchpoints.'''
+        for wp in list(self):
+            self.remove(wp)
+
+    def apply(self):
+        '''Writes all the watchpoints into the traced threads.
+
+        It must be called after `Process.attach_threads` to watch the newly
+        attached threads.
+        '''
+        self.interrupt()
+        for wp in self:
+            self._poke_all(wp.slot, wp.addr)
+        self._poke_all(DR7, self._dr7)
+
+    def interrupt(self):
+        '''Stops all the threads continued by `cont`.'''
+        for tid, status in self._process.interrupt().items():
+            if os.WIFSTOPPED(status) and os.WSTOPSIG(status) != signal.SIGTRAP:
+                self._signals[tid] = os.WSTOPSIG(status)
+
+    def _cont(self, tid):
+        process = self._process
+        if tid in self._resume:
+            self._resume.discard(tid)
+            regs = ptrace.UserRegsStruct()
+            process._call_ptrace(ptrace.getregs, regs, tid=tid)
+            regs.eflags |= EFLAGS_RF
+            process._call_ptrace(ptrace.setregs, regs, tid=tid)
+        process._cont_thread(tid, self._signals.pop(tid, 0))
+
+    def cont(self):
+        '''Continues the stopped threads until a watchpoint is hit.
+
+        Returns
+        -------
+        Watchpoint or None
+            The fired watchpoint or None if the process exited or stopped on
+            a trap which is not due to a watchpoint.
+        '''
+        process = self._process
+        for tid in process.threads:
+            if tid not in process._running:
+                self._cont(tid)
+        while True:
+            tid, status = process._wait_thread()
+            if not os.WIFSTOPPED(status):
+                if tid == process.pid:
+                    return None
+                continue
+            sig = os.WSTOPSIG(status)
+            if process._is_interrupted(tid, status):
+                self._cont(tid)
+                continue
+            if sig != signal.SIGTRAP:
+                self._signals[tid] = sig
+                self._cont(tid)
+                continue
+            now    = time.perf_counter_ns()
+            offset = ptrace.DEBUGREG_OFFSET + 8 * DR6
+            dr6    = process._call_ptrace(ptrace.peekuser, offset, tid=tid)
+            process._call_ptrace(ptrace.pokeuser, offset, 0, tid=tid)
+            for wp in self:
+                if dr6 & (1 << wp.slot):
+                    wp.hits    += 1
+                    wp.last_hit = now
+                    wp.last_tid = tid
+                    if wp.condition == 'x':
+                        self._resume.add(tid)
+                    return wp
+            return None
@@ -0,0 +1,96 @@
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+
+from deedee.proc.process import Process
+
+
+class Child:
+    '''A Python child process running some code.
+
+    The code prints `ready` once it is set up; `send` writes a line to its
+    stdin and returns the line it answers.
+    '''
+
+    def __init__(self, code):
+        self.popen = subprocess.Popen(
+            [sys.executable, '-u', '-c', textwrap.dedent(code)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True
+        )
+        line = self.popen.stdout.readline()
+        if not line.startswith('ready'):
+            self.kill()
+            raise RuntimeError(f'the child failed to start: {line!r}')
+        self.ready = line.split()[1:]
+
+    @property
+    def pid(self):
+        return self.popen.pid
+
+    def send(self, line):
+        self.popen.stdin.write(line + '\n')
+        self.popen.stdin.flush()
+        return self.popen.stdout.readline().split()
+
+    def kill(self):
+        self.popen.kill()
+        self.popen.wait()
+
+
+@pytest.fixture
+def spawn():
+    '''Spawns Python children killed at the end of the test.'''
+    children = []
+
+    def spawn_(code):
+        child = Child(code)
+        children.append(child)
+        return child
+
+    yield spawn_
+    for child in children:
+        child.kill()
+
+
+@pytest.fixture
+def child(spawn):
+    '''A child process doing nothing.'''
+    return spawn('''
+        import sys
+        print('ready')
+        sys.stdin.readline()
+    ''')
+
+
+@pytest.fixture
+def attach(spawn):
+    '''Attaches Process objects detached (forcefully) at the end of the test,
+    before the children are killed.'''
+    processes = []
+
+    def attach_(pid, threads=False):
+        process = Process(pid)
+        process.attach()
+        if threads:
+            process.attach_threads()
+        processes.append(process)
+        return process
+
+    yield attach_
+    for process in processes:
+        if process.attached:
+            process.detach(force=True)
+
+
+@pytest.fixture
+def process(child, attach):
+    '''The attached process of `child`.'''
+    return attach(child.pid)
@@ -0,0 +1,56 @@
+
+import pytest
+
+import deedee.proc.plugins as plugins
+
+from deedee.proc.plugins.alloc import ArenaAllocator, PAGE_SIZE, MAX_CLASS
+
+
+@pytest.fixture
+def alloc():
+    return ArenaAllocator(plugins.syscall.SyscallByInstrReplacement(), arena_size=64 * 1024)
+
+
+def _mapped(process, addr):
+    return any(m.start_address <= addr < m.end_address for m in process.get_maps())
+
+
+def test_alloc(process, alloc):
+    addrs = [alloc(process, size) for size in (1, 16, 17, 100, 4000)]
+    for addr, size in zip(addrs, (16, 16, 32, 128, 4096)):
+        assert addr % size == 0
+        process.write_mem_array(addr, b'\xaa' * size)
+        assert process.read(addr, size) == b'\xaa' * size
+    # one arena for all the small blocks
+    assert max(addrs) - min(addrs) < 64 * 1024
+    assert len(set(addrs)) == len(addrs)
+
+
+def test_align(process, alloc):
+    assert alloc(process, 8, align=256) % 256 == 0
+    assert alloc(process, 8, align=PAGE_SIZE) % PAGE_SIZE == 0
+    for align in (0, -16, 24, 2 * PAGE_SIZE):
+        with pytest.raises(ValueError):
+            alloc(process, 8, align=align)
+
+
+def test_free_reuse(process, alloc):
+    addr = alloc(process, 40)
+    alloc.free(process, addr)
+    assert alloc(process, 64) == addr
+
+
+def test_big_block(process, alloc):
+    addr = alloc(process, MAX_CLASS + 1)
+    assert _mapped(process, addr)
+    alloc.free(process, addr)
+    assert not _mapped(process, addr)
+
+
+def test_release_on_detach(child, process, alloc):
+    small = alloc(process, 16)
+    big   = alloc(process, 2 * MAX_CLASS)
+    process.detach()
+    process.attach()
+    assert not _mapped(process, small)
+    assert not _mapped(process, big)
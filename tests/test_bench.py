@@ -0,0 +1,34 @@
+
+import json
+import os
+import subprocess
+import sys
+
+
+ROOT  = os.path.join(os.path.dirname(__file__), os.pardir)
+BENCH = os.path.join(ROOT, 'benchmarks', 'bench.py')
+
+
+def _bench(*args):
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, 'src'))
+    return subprocess.run(
+        [sys.executable, BENCH, *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+
+
+def test_run_and_compare(tmp_path):
+    output = str(tmp_path / 'bench.json')
+    _bench('-r', '5', '--only', 'regs|read', '-o', output)
+    with open(output) as f:
+        saved = json.load(f)
+    assert saved['meta']['repeat'] == 5
+    names = {result['name'] for result in saved['results']}
+    assert any(name.startswith('read') for name in names)
+    assert all(result['median_ns'] > 0 for result in saved['results'])
+    lines = _bench('--compare', output, output).splitlines()
+    assert len(lines) == len(saved['results'])
+    assert all(line.endswith('1.00x') for line in lines)
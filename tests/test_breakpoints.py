@@ -0,0 +1,77 @@
+
+import pytest
+
+
+def _word(process, addr):
+    return int.from_bytes(process.read_mem_words(addr), 'little')
+
+
+TARGET = '''
+    import ctypes, os, time
+    libc = ctypes.CDLL(None)
+    print('ready', ctypes.cast(libc.getppid, ctypes.c_void_p).value)
+    while True:
+        os.getppid()
+        time.sleep(0.001)
+'''
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return child, attach(child.pid), int(child.ready[0])
+
+
+def test_hits(target):
+    child, process, addr = target
+    seen = []
+    bp   = process.breakpoints.add(addr, callback=lambda bp, regs: seen.append(regs.rip))
+    assert process.breakpoints.run(until=lambda: bp.hits == 5) is bp
+    assert bp.hits == 5
+    assert seen == [addr] * 5
+    assert process.get_regs().rip == addr
+
+
+def test_condition(target):
+    child, process, addr = target
+    calls = []
+
+    def condition(regs):
+        calls.append(regs.rip)
+        return len(calls) % 2 == 0
+
+    bp = process.breakpoints.add(addr, condition=condition)
+    process.breakpoints.run(until=lambda: bp.hits == 3)
+    assert len(calls) == 6
+
+
+def test_add_twice(target):
+    child, process, addr = target
+    bp = process.breakpoints.add(addr)
+    assert process.breakpoints.add(addr) is bp
+    assert len(process.breakpoints) == 1
+
+
+def test_adjacent(target):
+    # two breakpoints sharing a word must restore each other's byte
+    child, process, addr = target
+    word = _word(process, addr)
+    process.breakpoints.add(addr)
+    process.breakpoints.add(addr + 1)
+    assert _word(process, addr) & 0xffff == 0xcccc
+    process.breakpoints.remove(addr)
+    assert _word(process, addr) & 0xffff == (word & 0xff) | 0xcc00
+    process.breakpoints.clear()
+    assert _word(process, addr) == word
+
+
+def test_clear_and_detach(target):
+    child, process, addr = target
+    word = _word(process, addr)
+    bp   = process.breakpoints.add(addr)
+    process.breakpoints.run(until=lambda: bp.hits == 2)
+    process.detach()
+    assert child.popen.poll() is None
+    # the int3 is gone: the process keeps running once detached
+    process.attach()
+    assert _word(process, addr) == word
@@ -0,0 +1,73 @@
+
+import pytest
+
+import deedee.proc.plugins as plugins
+
+from deedee.proc.plugins.call import CallChain, Ret
+
+
+TARGET = '''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    text = ctypes.create_string_buffer(b'hello world')
+    addr = lambda f: ctypes.cast(f, ctypes.c_void_p).value
+    print('ready', addr(libc.getpid), addr(libc.labs), addr(libc.strlen), ctypes.addressof(text))
+    sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return (child, attach(child.pid), *map(int, child.ready))
+
+
+@pytest.fixture
+def chain():
+    return CallChain(plugins.syscall.SyscallByInstrReplacement())
+
+
+def test_encodings():
+    assert CallChain._movabs('r8', -1) == b'\x49\xb8' + b'\xff' * 8
+    assert CallChain._movabs('rdi', 1) == b'\x48\xbf' + (1).to_bytes(8, 'little')
+    # mov rsi, [rbx + 8] and mov r9, [rbx + 16]
+    assert CallChain._load('rsi', 8) == b'\x48\x8b\xb3\x08\x00\x00\x00'
+    assert CallChain._load('r9', 16) == b'\x4c\x8b\x8b\x10\x00\x00\x00'
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        CallChain._assemble([(0x1000, list(range(7)))])
+    with pytest.raises(ValueError):
+        CallChain._assemble([(0x1000, [Ret(0)])])
+    with pytest.raises(ValueError):
+        CallChain._assemble([(0x1000, []), (0x1000, [Ret(2)])])
+
+
+def test_chain(target, chain):
+    child, process, getpid, labs, strlen, text = target
+    regs = process.get_regs()
+    assert chain(process, [
+        (getpid, []),
+        (labs,   [-7]),
+        (labs,   [Ret(1)]),
+        (strlen, [text])
+    ]) == [child.pid, 7, 7, 11]
+    after = process.get_regs()
+    assert (after.rip, after.rsp, after.rbx) == (regs.rip, regs.rsp, regs.rbx)
+    assert chain(process, []) == []
+
+
+def test_page(target, chain):
+    child, process, getpid, labs, strlen, text = target
+    chain(process, [(getpid, [])])
+    page = chain._pages[process.pid]
+    chain(process, [(labs, [-1])] * 10)
+    assert chain._pages[process.pid] == page
+    # a longer chain needs a bigger page
+    chain(process, [(labs, [-1])] * 200)
+    addr, size = chain._pages[process.pid]
+    assert size > page[1]
+    process.detach()
+    process.attach()
+    assert not any(m.start_address == addr for m in process.get_maps())
@@ -0,0 +1,167 @@
+
+import ctypes.util
+import os
+import re
+import sys
+import uuid
+
+import pytest
+
+from deedee.proc import discovery
+from deedee.proc.discovery import (
+    All, Any, Cmdline, Discovery, Exe, Library, Not, ProcessInfo, Selector, Uid, _match_path,
+    _read_stat, find
+)
+
+
+# a library the interpreter does not load by itself
+LIBRARY = next(
+    (path for path in map(ctypes.util.find_library, ('bz2', 'lzma', 'uuid')) if path is not None),
+    None
+)
+
+# renames itself (the name has spaces and parentheses), opens LIBRARY on
+# demand and has a marker into its command line
+TARGET = '''
+    import ctypes, os, sys
+    libc = ctypes.CDLL(None)
+    libc.prctl(15, b'a) b (c', 0, 0, 0)
+    print('ready')
+    for line in sys.stdin:
+        ctypes.CDLL(line.strip())
+        print('done')
+'''
+
+
+class _Pid(Selector):
+
+    def __init__(self, pid):
+        self._pid = pid
+
+    def __call__(self, info):
+        return info.pid == self._pid
+
+
+@pytest.fixture
+def target(spawn):
+    '''A child whose marker is into its command line.'''
+    marker = uuid.uuid4().hex
+    return spawn(TARGET + f'\n    # {marker}\n'), marker
+
+
+def _starttime(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        return int(f.read().rsplit(')', 1)[1].split()[19])
+
+
+def test_read_stat(target):
+    child, _ = target
+    comm, ppid, starttime = _read_stat(child.pid)
+    assert comm == 'a) b (c'
+    assert ppid == os.getpid()
+    assert starttime == _starttime(child.pid)
+    with pytest.raises(OSError):
+        _read_stat(2**22 + 1)
+
+
+def test_match_path():
+    assert _match_path('python3*', '/usr/bin/python3.11')
+    assert not _match_path('python3*', '/usr/bin/python2')
+    assert _match_path('/usr/bin/*', '/usr/bin/python3.11')
+    assert not _match_path('/usr/bin/*', '/usr/local/bin/python3')
+    # a pattern without a '/' is matched on the basename only
+    assert not _match_path('bin*', '/usr/bin/python3')
+    assert not _match_path('*', None)
+
+
+def test_selector_abstract():
+    with pytest.raises(TypeError):
+        Selector()
+
+    class NoCall(Selector):
+        pass
+
+    with pytest.raises(TypeError):
+        NoCall()
+
+
+def test_combinations():
+    info  = ProcessInfo(10, 'comm', 1, 0)
+    yes   = _Pid(10)
+    no    = _Pid(11)
+    calls = []
+
+    class Spy(Selector):
+        def __call__(self, info):
+            calls.append(info.pid)
+            return True
+
+    assert isinstance(yes & no, All) and isinstance(yes | no, Any) and isinstance(~yes, Not)
+    assert not (yes & no)(info)
+    assert (yes | no)(info)
+    assert (~no)(info) and not (~yes)(info)
+    assert (yes & ~no & (no | yes))(info)
+    # the combinations are lazy
+    assert not (no & Spy())(info) and (yes | Spy())(info)
+    assert calls == []
+
+
+def test_info(target):
+    child, marker = target
+    info = Discovery().info(child.pid)
+    assert (info.pid, info.comm, info.ppid) == (child.pid, 'a) b (c', os.getpid())
+    assert os.path.realpath(info.exe) == os.path.realpath(sys.executable)
+    assert info.cmdline[0] == sys.executable and marker in info.cmdline[-1]
+    assert info.uids[0] == os.getuid() and info.uid == os.getuid()
+    assert len(info.cgroups) >= 1
+    assert any(os.path.basename(path).startswith('libc') for path in info.files)
+    # the fields of another process are None
+    other = ProcessInfo(2**22 + 1, 'gone', 1, 0)
+    assert other.exe is None and other.cmdline is None and other.uid is None
+    assert other.files is None and other.cgroups is None
+
+
+def test_find(target):
+    child, marker = target
+    exe = os.path.basename(os.path.realpath(sys.executable))
+    assert find(Cmdline(marker)) == [child.pid]
+    assert find(Cmdline(re.compile(f'# {marker}$', re.MULTILINE))) == [child.pid]
+    assert find(Exe(exe) & Uid(os.getuid()) & Cmdline(marker)) == [child.pid]
+    assert find(Exe(os.path.realpath(sys.executable)) & Cmdline(marker)) == [child.pid]
+    assert find(Exe('/nonexistent/*') & Cmdline(marker)) == []
+    assert find(Cmdline(marker) & ~_Pid(child.pid)) == []
+    assert find(Uid(os.getuid(), effective=True) & Cmdline(marker)) == [child.pid]
+    assert os.getpid() in Discovery().find(_Pid(os.getpid()))
+
+
+def test_parallel(target, monkeypatch):
+    child, marker = target
+    monkeypatch.setattr(discovery, 'PARALLEL_MIN', 0)
+    monkeypatch.setattr(discovery, 'BATCH_SIZE', 2)
+    found = Discovery(workers=4).scan()
+    pids  = [info.pid for info in found]
+    assert pids == sorted(pids)
+    assert child.pid in pids and os.getpid() in pids
+    assert Discovery(workers=4).find(Cmdline(marker)) == [child.pid]
+
+
+@pytest.mark.skipif(LIBRARY is None, reason='no library to open')
+def test_cache(target):
+    child, marker = target
+    scanner  = Discovery()
+    selector = Cmdline(marker) & Library(f'{LIBRARY}*')
+    info     = scanner.info(child.pid)
+    assert scanner.find(selector) == []
+    child.send(LIBRARY)
+    # the mapped files are cached...
+    assert scanner.info(child.pid) is info
+    assert scanner.find(selector) == []
+    # ...until a refresh
+    assert scanner.find(selector, refresh=True) == [child.pid]
+    path = next(path for path in info.files if os.path.basename(path).startswith(LIBRARY))
+    assert scanner.find(Cmdline(marker) & Library(path)) == [child.pid]
+    assert scanner.find(Cmdline(marker) & Library(path + '.missing')) == []
+    # a process which is gone is dropped from the cache
+    child.kill()
+    assert scanner.find(selector) == []
+    assert child.pid not in scanner._cache
@@ -0,0 +1,139 @@
+
+import ctypes
+import ctypes.util
+import struct
+
+import pytest
+
+from deedee.proc.elf import ElfFile, ElfException, PT_LOAD, PT_NOTE
+from deedee.proc.plugins.getsym import ByElfParsing
+
+
+BUILD_ID = bytes(range(20))
+
+
+def _symbols(strtab, symbols):
+    '''Packs a null symbol then some (name, shndx, value) symbols.'''
+    data = bytes(24)
+    for name, shndx, value in symbols:
+        data += struct.pack('<IBBHQQ', strtab.index(name.encode() + b'\x00'), 0x12, 0, shndx, value, 8)
+    return data
+
+
+def _build(path):
+    '''Writes a small ELF64 file with a .dynsym, a .symtab and a build-id.'''
+    strtab   = b'\x00foo\x00bar\x00baz\x00'
+    dynsym   = _symbols(strtab, [('foo', 1, 0x1100), ('bar', 0, 0)])
+    symtab   = _symbols(strtab, [('foo', 1, 0x1200), ('baz', 1, 0x1300)])
+    shstrtab = b'\x00.dynsym\x00.dynstr\x00.symtab\x00.shstrtab\x00'
+    note     = struct.pack('<III', 4, len(BUILD_ID), 3) + b'GNU\x00' + BUILD_ID
+    blobs    = [note, dynsym, strtab, symtab, shstrtab]
+    offsets  = []
+    offset   = 64 + 3 * 56
+    for blob in blobs:
+        offsets.append(offset)
+        offset += (len(blob) + 7) & ~7
+    shoff = offset
+    ident = b'\x7fELF' + bytes([2, 1, 1]) + bytes(9)
+    data  = struct.pack('<16sHHIQQQIHHHHHH', ident, 3, 62, 1, 0, 64, shoff, 0, 64, 56, 3, 64, 5, 4)
+    data += struct.pack('<IIQQQQQQ', PT_LOAD, 5, 0, 0x5000, 0x5000, 0x100, 0x100, 0x1000)
+    data += struct.pack('<IIQQQQQQ', PT_LOAD, 5, 0, 0x1234, 0x1234, 0x100, 0x100, 0x1000)
+    data += struct.pack('<IIQQQQQQ', PT_NOTE, 4, offsets[0], 0, 0, len(note), len(note), 4)
+    for blob in blobs:
+        data += blob + bytes(-len(blob) % 8)
+    name = lambda n: shstrtab.index(n.encode() + b'\x00')
+    data += bytes(64)
+    data += struct.pack('<IIQQQQIIQQ', name('.dynsym'), 11, 0, 0, offsets[1], len(dynsym), 2, 1, 8, 24)
+    data += struct.pack('<IIQQQQIIQQ', name('.dynstr'), 3, 0, 0, offsets[2], len(strtab), 0, 0, 1, 0)
+    data += struct.pack('<IIQQQQIIQQ', name('.symtab'), 2, 0, 0, offsets[3], len(symtab), 2, 1, 8, 24)
+    data += struct.pack('<IIQQQQIIQQ', name('.shstrtab'), 3, 0, 0, offsets[4], len(shstrtab), 0, 0, 1, 0)
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def elf(tmp_path):
+    elf = ElfFile(str(_build(tmp_path / 'lib.so')))
+    yield elf
+    elf.close()
+
+
+def test_segments(elf):
+    assert [(s.type_, s.vaddr) for s in elf.segments] == [
+        (PT_LOAD, 0x5000), (PT_LOAD, 0x1234), (PT_NOTE, 0)
+    ]
+    assert elf.min_vaddr == 0x1000
+
+
+def test_sections(elf):
+    assert [s.name for s in elf.sections] == ['', '.dynsym', '.dynstr', '.symtab', '.shstrtab']
+
+
+def test_symbols(elf):
+    # .symtab wins over .dynsym, the undefined symbols are skipped
+    assert elf.get_symbol('foo') == 0x1200
+    assert elf.get_symbol('baz') == 0x1300
+    assert elf.get_symbol('bar') is None
+    assert elf.get_symbol('qux') is None
+
+
+def test_build_id(elf):
+    assert elf.build_id() == BUILD_ID.hex()
+
+
+def test_not_elf(tmp_path):
+    path = tmp_path / 'text'
+    path.write_bytes(b'not an elf file' * 10)
+    with pytest.raises(ElfException):
+        ElfFile(str(path))
+
+
+def test_elf32(tmp_path):
+    path = tmp_path / 'lib32.so'
+    path.write_bytes(b'\x7fELF' + bytes([1, 1, 1]) + bytes(57))
+    with pytest.raises(ElfException):
+        ElfFile(str(path))
+
+
+def test_libc_symbol():
+    path = ctypes.util.find_library('c')
+    libc = ctypes.CDLL(path)
+    addr = ctypes.cast(libc.getpid, ctypes.c_void_p).value
+    # the libc mapped into the current process
+    with open('/proc/self/maps') as f:
+        lines = [line.split() for line in f if line.rstrip().endswith(path)]
+    if len(lines) == 0:
+        pytest.skip(f'{path} is not mapped by its soname')
+    path = lines[0][-1]
+    base = int(lines[0][0].split('-')[0], 16)
+    elf  = ElfFile(path)
+    try:
+        assert base - elf.min_vaddr + elf.get_symbol('getpid') == addr
+    finally:
+        elf.close()
+
+
+CHILD = '''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    print('ready', ctypes.cast(libc.getpid, ctypes.c_void_p).value)
+    sys.stdin.readline()
+'''
+
+
+def test_by_elf_parsing(spawn, attach):
+    child   = spawn(CHILD)
+    process = attach(child.pid)
+    libc    = next(m for m in process.modules() if m.name.startswith('libc.so'))
+    getsym  = ByElfParsing(max_files=2)
+    assert getsym(process, libc.path, 'getpid') == int(child.ready[0])
+    elfs    = [m for m in process.modules() if m.build_id is not None]
+    for module in elfs:
+        try:
+            getsym(process, module.path, 'getpid')
+        except RuntimeError:
+            pass
+    # the parsed files are bounded
+    assert len(getsym._elfs) == min(2, len(elfs))
+    getsym.close()
+    assert len(getsym._elfs) == 0
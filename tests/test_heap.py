@@ -0,0 +1,97 @@
+
+import os
+
+import pytest
+
+from deedee.proc.heap import (
+    DEFAULT_VERSION, HeapStats, HeapWalker, _glibc_version, _layout, summarize, walk
+)
+
+
+# allocates 100 chunks of 1008 bytes and 10 chunks of 48 bytes, then frees the
+# small ones (7 go into the tcache, the others into a fast bin, which may be
+# consolidated by the next large malloc)
+ALLOCS = '''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    libc.malloc.restype = ctypes.c_void_p
+    libc.free.argtypes  = [ctypes.c_void_p]
+    big   = [libc.malloc(1000) for _ in range(100)]
+    small = [libc.malloc(40) for _ in range(10)]
+    for ptr in small:
+        libc.free(ptr)
+    print('ready', ','.join(map(str, big)), ','.join(map(str, small)), flush=True)
+    sys.stdin.readline()
+'''
+
+
+@pytest.mark.parametrize('version, fastbins, top, next_, size, count_size, safe_linking', [
+    ((2, 23), 8, 88, 2152, 2192, 1, False),
+    ((2, 26), 8, 88, 2152, 2192, 1, False),
+    ((2, 27), 16, 96, 2160, 2200, 1, False),
+    ((2, 30), 16, 96, 2160, 2200, 2, False),
+    ((2, 32), 16, 96, 2160, 2200, 2, True),
+    ((2, 35), 16, 96, 2160, 2200, 2, True),
+])
+def test_layout(version, fastbins, top, next_, size, count_size, safe_linking):
+    layout = _layout(version)
+    assert layout.fastbins == fastbins
+    assert layout.top == top
+    assert layout.bins == top + 16
+    assert layout.next == next_
+    assert layout.system_mem == next_ + 24
+    assert layout.size == size
+    assert layout.tcache == (version >= (2, 26))
+    assert layout.count_size == count_size
+    assert layout.safe_linking == safe_linking
+
+
+def test_glibc_version(process, tmp_path):
+    libc = next(m for m in process.modules() if m.name.startswith('libc'))
+    _, version = os.confstr('CS_GNU_LIBC_VERSION').split()
+    assert _glibc_version(libc.path) == tuple(map(int, version.split('.')[:2]))
+    assert _glibc_version(str(tmp_path / 'missing')) == DEFAULT_VERSION
+    (tmp_path / 'empty').write_bytes(b'')
+    assert _glibc_version(str(tmp_path / 'empty')) == DEFAULT_VERSION
+
+
+def test_stats():
+    stats = HeapStats()
+    stats.allocated.update({32: 3, 48: 1, 1008: 2})
+    stats.free.update({48: 2})
+    other = HeapStats(top=100)
+    other.allocated.update({32: 1})
+    stats += other
+    assert stats.allocated[32] == 4
+    assert stats.top == 100
+    assert stats.allocated_bytes == 32 * 4 + 48 + 1008 * 2
+    assert stats.free_bytes == 96
+    assert stats.histogram() == [(32, 4, 128), (48, 1, 48), (1008, 2, 2016)]
+    assert stats.histogram(log2=True) == [(32, 4, 128), (64, 1, 48), (1024, 2, 2016)]
+    assert stats.histogram(free=True) == [(48, 2, 96)]
+
+
+def test_walk(spawn, attach):
+    child   = spawn(ALLOCS)
+    process = attach(child.pid)
+    walker  = HeapWalker(process)
+    arenas  = walker.walk(chunks=True)
+    main    = arenas[0]
+    assert main.main and main.addr == walker.main_arena
+    assert any(start <= main.top < end for start, end in main.heaps)
+    chunks = {addr: (size, state) for addr, size, state in main.chunks}
+    big, small = ([int(ptr) for ptr in ptrs.split(',')] for ptrs in child.ready)
+    for ptr in big:
+        assert chunks[ptr - 16] == (1008, 'used')
+    states = [chunks[ptr - 16][1] for ptr in small if ptr - 16 in chunks]
+    assert states.count('cached') >= 7
+    assert 'used' not in states
+    stats = summarize(arenas)
+    assert stats.allocated[1008] >= 100
+    assert stats.cached[48] >= 7
+    assert main.bins['tcache'] >= 7
+    assert stats.top > 0
+    # the given main_arena is used as is
+    again = HeapWalker(process, main_arena=walker.main_arena).walk()
+    assert summarize(again).allocated[1008] == stats.allocated[1008]
+    assert summarize(walk(process)).cached == stats.cached
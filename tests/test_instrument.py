@@ -0,0 +1,66 @@
+
+import pytest
+
+from deedee.proc         import instrument
+from deedee.proc.process import Process
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    instrument.reset()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+
+def test_stat():
+    stat = instrument.Stat()
+    stat.add(0, 8, False)
+    stat.add(1000, 0, True)
+    stat.add(1023, 0, False)
+    assert stat.to_dict() == {
+        'calls':     3,
+        'errors':    1,
+        'bytes':     8,
+        'total_ns':  2023,
+        'histogram': {1: 1, 1024: 2}
+    }
+
+
+def test_disable_restores():
+    original = Process.__dict__['_call_ptrace']
+    with instrument.enabled():
+        assert instrument.is_enabled()
+        assert Process.__dict__['_call_ptrace'] is not original
+        with instrument.enabled():
+            pass
+        # a nested block leaves the instrumentation enabled
+        assert instrument.is_enabled()
+    assert not instrument.is_enabled()
+    assert Process.__dict__['_call_ptrace'] is original
+
+
+def test_calls(child):
+    calls = []
+    hook  = lambda name, elapsed, nbytes, error: calls.append(name)
+    instrument.add_hook(hook)
+    try:
+        with instrument.enabled():
+            process = Process(child.pid)
+            process.attach()
+            regs = process.get_regs()
+            process.read(regs.rsp, 64)
+            process.read_mem_array(regs.rsp, 64)
+            process.detach()
+    finally:
+        instrument.remove_hook(hook)
+    stats = instrument.snapshot()
+    assert stats['ptrace.attach']['calls'] == 1
+    assert stats['ptrace.getregs']['calls'] >= 1
+    assert stats['procmem.preadv']['bytes'] == 64
+    assert stats['uio.read']['bytes'] == 64
+    assert stats['wait']['calls'] >= 1
+    assert set(calls) == set(stats)
+    # nothing is measured once disabled
+    Process(child.pid).read_mem_array(regs.rsp, 8)
+    assert instrument.snapshot() == stats
@@ -0,0 +1,62 @@
+
+import ctypes
+import os
+import subprocess
+import sys
+
+import pytest
+
+from deedee.proc.libc.lib import LazyLibrary
+
+
+SRC = os.path.join(os.path.dirname(__file__), os.pardir, 'src')
+
+
+def _run(code):
+    env = dict(os.environ, PYTHONPATH=SRC)
+    return subprocess.run(
+        [sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+
+
+def test_import_is_lazy():
+    loaded = _run(
+        'import sys, deedee.proc, deedee.proc.libc.lib as lib\n'
+        'print(lib.libc._dll is None, "deedee.proc.plugins.syscall" in sys.modules, "ctypes.util" in sys.modules)'
+    )
+    assert loaded == ['True', 'False', 'False']
+
+
+def test_plugins_on_access():
+    loaded = _run(
+        'import sys, deedee.proc\n'
+        'deedee.proc.plugins.syscall.Syscalls\n'
+        'print("deedee.proc.plugins.syscall" in sys.modules, "deedee.proc.plugins.systrace" in sys.modules)'
+    )
+    assert loaded == ['True', 'False']
+
+
+def test_unknown_plugin():
+    import deedee.proc.plugins as plugins
+    with pytest.raises(AttributeError):
+        plugins.missing
+    assert 'alloc' in dir(plugins)
+
+
+def test_prototype():
+    lib = LazyLibrary('libc.so.6', 'c')
+    lib.prototype('labs', ctypes.c_long, [ctypes.c_long])
+    assert lib._dll is None
+    assert lib.labs(-2**40) == 2**40
+    assert lib.getpid() == os.getpid()
+    # the resolved functions are cached
+    assert lib.__dict__['labs'] is lib.labs
+    with pytest.raises(AttributeError):
+        lib._private
+
+
+def test_fallback():
+    lib = LazyLibrary('libmissing.so.42', 'c')
+    assert lib.getpid() == os.getpid()
+    with pytest.raises(OSError):
+        LazyLibrary('libmissing.so.42', 'missing-library').dll
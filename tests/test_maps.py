@@ -0,0 +1,42 @@
+
+import os
+
+from deedee.proc.maps import Mapping, get_maps, parse_maps
+
+
+MAPS = '''\
+55d0c0a00000-55d0c0a01000 r--p 00000000 08:01 1234                       /usr/bin/prog
+7f1c2c000000-7f1c2c021000 rw-p 00000000 00:00 0 
+7f1c2e600000-7f1c2e800000 rw-s 00000000 00:01 5678                       /memfd:deedee (deleted)
+7f1c2e800000-7f1c2e801000 r-xp 00001000 08:01 42                         /opt/my app/lib foo.so
+7ffd1e1f0000-7ffd1e211000 rw-p 00000000 00:00 0                          [stack]
+ffffffffff600000-ffffffffff601000 --xp 00000000 00:00 0                  [vsyscall]
+'''
+
+
+def test_parse():
+    maps_ = parse_maps(MAPS)
+    assert maps_[0] == Mapping(0x55d0c0a00000, 0x55d0c0a01000, 0x1000, 'r--p', 0, '08:01', '1234', '/usr/bin/prog')
+    assert [m.pathname for m in maps_] == [
+        '/usr/bin/prog',
+        '',
+        '/memfd:deedee (deleted)',
+        '/opt/my app/lib foo.so',
+        '[stack]',
+        '[vsyscall]'
+    ]
+    assert maps_[3].offset == 0x1000
+    assert maps_[5].size == 0x1000
+
+
+def test_filter():
+    maps_ = parse_maps(MAPS, lambda m: 'w' in m.perms)
+    assert [m.pathname for m in maps_] == ['', '/memfd:deedee (deleted)', '[stack]']
+
+
+def test_get_maps():
+    assert any(m.pathname == '[stack]' for m in get_maps(os.getpid()))
+    # every line is parsed
+    with open('/proc/self/maps') as f:
+        text = f.read()
+    assert len(parse_maps(text)) == len(text.splitlines())
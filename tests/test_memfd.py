@@ -0,0 +1,48 @@
+
+import os
+
+import pytest
+
+import deedee.proc.plugins as plugins
+
+from deedee.proc.plugins.memfd import MemfdChannel
+
+
+@pytest.fixture
+def memfd():
+    return MemfdChannel(plugins.syscall.SyscallByInstrReplacement(), name='test-channel')
+
+
+def _mapped(process, addr):
+    return [m for m in process.get_maps() if m.start_address == addr]
+
+
+def test_shared(process, memfd):
+    channel = memfd(process, 5000)
+    assert channel.size == 8192
+    mapping = _mapped(process, channel.remote_addr)
+    assert len(mapping) == 1 and 'test-channel' in mapping[0].pathname
+    addr = channel.write(b'from the tracer', 100)
+    assert process.read(addr, 15) == b'from the tracer'
+    process.write(channel.remote_addr + 8000, b'from the process')
+    assert channel.read(8000, 16) == b'from the process'
+    # the memfd is only kept by the mappings
+    assert not any(
+        'test-channel' in os.readlink(f'/proc/{process.pid}/fd/{fd}')
+        for fd in os.listdir(f'/proc/{process.pid}/fd')
+    )
+    channel.close()
+    assert channel.closed
+    assert _mapped(process, channel.remote_addr) == []
+    channel.close()
+
+
+def test_close_on_detach(child, process, memfd):
+    with memfd(process, 4096) as channel:
+        pass
+    assert channel.closed
+    other = memfd(process, 4096)
+    process.detach()
+    assert other.closed
+    process.attach()
+    assert _mapped(process, other.remote_addr) == []
@@ -0,0 +1,98 @@
+
+import ctypes.util
+import os
+
+import pytest
+
+from deedee.proc.maps    import parse_maps
+from deedee.proc.modules import ModuleTable
+
+
+# a library the interpreter does not load by itself
+LIBRARY = next(
+    (path for path in map(ctypes.util.find_library, ('bz2', 'lzma', 'uuid')) if path is not None),
+    None
+)
+
+# opens and closes LIBRARY on demand, moving it with a mapping between the two
+TARGET = f'''
+    import _ctypes, mmap, os, sys
+    handle = None
+    blocks = []
+    def base():
+        with open('/proc/self/maps') as f:
+            for line in f:
+                if os.path.basename(line.split()[-1]).startswith(path):
+                    return int(line.split('-')[0], 16), line.split()[-1]
+    path = {LIBRARY!r}
+    print('ready')
+    for line in sys.stdin:
+        if line.strip() == 'open':
+            handle = _ctypes.dlopen(path, os.RTLD_NOW)
+        else:
+            _ctypes.dlclose(handle)
+            blocks.append(mmap.mmap(-1, 16 * 1024 * 1024))
+        print(*(base() or ['none']))
+'''
+
+MAPS = '''\
+00400000-00401000 r--p 00000000 08:01 100 /usr/bin/prog
+00401000-00402000 r-xp 00001000 08:01 100 /usr/bin/prog
+00402000-00403000 rw-p 00002000 08:01 100 /usr/bin/prog
+00403000-00404000 rw-p 00000000 00:00 0 [heap]
+7f0000000000-7f0000001000 r--p 00000000 08:01 200 /usr/lib/libfoo.so
+7f0000001000-7f0000003000 r-xp 00001000 08:01 200 /usr/lib/libfoo.so
+7f0000010000-7f0000011000 r--p 00000000 08:01 300 /opt/my lib/libbar.so
+'''
+
+
+def test_groups():
+    table = ModuleTable(os.getpid(), parse_maps(MAPS))
+    assert [(m.path, m.base, m.end) for m in table] == [
+        ('/usr/bin/prog', 0x400000, 0x403000),
+        ('/usr/lib/libfoo.so', 0x7f0000000000, 0x7f0000003000),
+        ('/opt/my lib/libbar.so', 0x7f0000010000, 0x7f0000011000)
+    ]
+    prog = table._by_name['prog']
+    assert prog.text == [(0x401000, 0x402000)]
+    assert prog.data == [(0x402000, 0x403000)]
+
+
+def test_find():
+    table = ModuleTable(os.getpid(), parse_maps(MAPS))
+    assert table.find(0x400000).name == 'prog'
+    assert table.find(0x402fff).name == 'prog'
+    assert table.find(0x403000) is None
+    assert table.find(0x7f0000002000).name == 'libfoo.so'
+    assert table.find(0x7f0000003000) is None
+    assert table.find(0x7f0000010800).name == 'libbar.so'
+    assert table.find(0x1000) is None
+
+
+def test_lookups(child):
+    table = ModuleTable(child.pid)
+    libc  = next(m for m in table if m.name.startswith('libc.so'))
+    assert table.get(libc.path) is libc
+    assert table.get(libc.name) is libc
+    assert table.by_path(libc.path) is libc
+    assert table.by_name('missing.so') is None
+    if libc.build_id is not None:
+        assert table.by_build_id(libc.build_id) is libc
+    assert table.find(libc.text[0][0]) is libc
+
+
+@pytest.mark.skipif(LIBRARY is None, reason='no library to load')
+def test_stale(spawn):
+    child = spawn(TARGET)
+    table = ModuleTable(child.pid)
+    libc  = next(m for m in table if m.name.startswith('libc.so'))
+    base, path = child.send('open')
+    module     = table.get(path)
+    assert module is not None and module.base == int(base)
+    assert child.send('close') == ['none']
+    assert table.get(path) is None
+    # the library is loaded again at another address
+    base, path = child.send('open')
+    assert table.get(path).base == int(base) != module.base
+    # the unchanged modules are kept
+    assert table.get(libc.path) is libc
@@ -0,0 +1,92 @@
+
+import dataclasses
+import os
+
+import pytest
+
+from deedee.proc import pagemap
+
+
+numpy = pytest.importorskip('numpy')
+
+PAGES = 64
+
+# 64 pages (one in three touched) and a reserved GiB
+TARGET = f'''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    libc.mmap.restype  = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    addr = libc.mmap(None, {PAGES} * 4096, 3, 0x22, -1, 0)
+    for i in range(0, {PAGES}, 3):
+        ctypes.memset(addr + i * 4096, 1, 1)
+    reserved = libc.mmap(None, 1 << 30, 0, 0x22 | 0x4000, -1, 0)
+    print('ready', addr, reserved)
+    sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def target(spawn):
+    child = spawn(TARGET)
+    return child.pid, int(child.ready[0]), int(child.ready[1])
+
+
+def _analyze(pid, addr, **kwargs):
+    return pagemap.analyze(pid, filter_=lambda m: m.start_address == addr, **kwargs)
+
+
+def test_read_pagemap(target):
+    pid, addr, reserved = target
+    entries = pagemap.read_pagemap(pid, addr, addr + PAGES * pagemap.PAGE_SIZE)
+    assert len(entries) == PAGES
+    assert [bool(e & pagemap.PM_PRESENT) for e in entries] == [i % 3 == 0 for i in range(PAGES)]
+    fd = os.open(f'/proc/{pid}/pagemap', os.O_RDONLY)
+    try:
+        read = pagemap.read_entries(fd, addr, addr + PAGES * pagemap.PAGE_SIZE, chunk=5)
+    finally:
+        os.close(fd)
+    assert list(read) == list(entries)
+
+
+def test_analyze(target):
+    pid, addr, reserved = target
+    result, = _analyze(pid, addr)
+    assert result.stats.pages == PAGES
+    assert result.stats.present == len(range(0, PAGES, 3))
+    assert result.stats.rss == result.stats.present * pagemap.PAGE_SIZE
+    assert result.stats.file == 0
+    present = numpy.unpackbits(result.present, bitorder='little')[:PAGES]
+    assert list(present) == [int(i % 3 == 0) for i in range(PAGES)]
+    assert not result.swapped.any()
+
+
+def test_chunks(target):
+    # the results do not depend on the chunk size
+    pid, addr, reserved = target
+    whole, = _analyze(pid, addr)
+    for chunk in (8, 16, 24):
+        result, = _analyze(pid, addr, chunk=chunk)
+        assert dataclasses.astuple(result.stats) == dataclasses.astuple(whole.stats)
+        assert bytes(result.present) == bytes(whole.present)
+        assert bytes(result.exclusive) == bytes(whole.exclusive)
+    for chunk in (0, -8, 12):
+        with pytest.raises(ValueError):
+            _analyze(pid, addr, chunk=chunk)
+
+
+def test_reserved(target):
+    pid, addr, reserved = target
+    result, = _analyze(pid, reserved, bitmaps=False)
+    assert result.stats.pages == (1 << 30) // pagemap.PAGE_SIZE
+    assert result.stats.present == 0
+    assert result.present is None and result.swapped is None and result.exclusive is None
+
+
+def test_summarize(target):
+    pid, addr, reserved = target
+    results = pagemap.analyze(pid, bitmaps=False)
+    summary = pagemap.summarize(pid, results)
+    assert summary['[anon]'].pages >= PAGES + (1 << 30) // pagemap.PAGE_SIZE
+    assert any(name.endswith('.so') or '.so.' in name for name in summary)
+    assert sum(s.pages for s in summary.values()) == sum(r.stats.pages for r in results)
@@ -0,0 +1,79 @@
+
+import pytest
+
+from deedee.proc.process import ProcessVMException
+
+
+PAGE_SIZE = 4096
+
+# three adjacent pages: rw, r and no access
+TARGET = f'''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    libc.mmap.restype  = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    addr = libc.mmap(None, 3 * {PAGE_SIZE}, 3, 0x22, -1, 0)
+    ctypes.memmove(addr, bytes(range(256)) * 48, 3 * {PAGE_SIZE})
+    libc.mprotect(addr + {PAGE_SIZE}, {PAGE_SIZE}, 1)
+    libc.mprotect(addr + 2 * {PAGE_SIZE}, {PAGE_SIZE}, 0)
+    print('ready', addr)
+    sys.stdin.readline()
+'''
+
+PATTERN = bytes(range(256)) * 48
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return attach(child.pid), int(child.ready[0])
+
+
+def test_read_spanning(target):
+    process, addr = target
+    data = process.read(addr + 100, 3 * PAGE_SIZE - 200)
+    assert type(data) is bytes
+    assert data == PATTERN[100:-100]
+    assert process.read(addr, 0) == b''
+
+
+def test_write_spanning(target):
+    process, addr = target
+    data = bytes(reversed(PATTERN))
+    process.write(addr + 8, data[8:-8])
+    assert process.read(addr, 3 * PAGE_SIZE) == PATTERN[:8] + data[8:-8] + PATTERN[-8:]
+
+
+def test_unmapped(target):
+    process, addr = target
+    last = process.get_maps()[-1]
+    with pytest.raises(ProcessVMException):
+        process.read(last.end_address - 8, 16)
+    with pytest.raises(ProcessVMException):
+        process.read(0, 8)
+
+
+def test_fallback(target, monkeypatch):
+    # without /proc/<pid>/mem, each mapping falls back on another backend
+    process, addr = target
+
+    def fail(*args):
+        raise OSError('no mem file')
+
+    monkeypatch.setattr(process._procmem, 'readinto', fail)
+    monkeypatch.setattr(process._procmem, 'write', fail)
+    assert process.read(addr, 3 * PAGE_SIZE) == PATTERN
+    backends = {key[0] - addr: b for key, b in process._backends.items() if key[2] == 'read'}
+    assert backends == {0: 'vm', PAGE_SIZE: 'vm', 2 * PAGE_SIZE: 'words'}
+    process.write(addr + PAGE_SIZE, b'abcd')
+    assert process.read(addr + PAGE_SIZE, 4) == b'abcd'
+    with pytest.raises(ProcessVMException):
+        process.write(addr + PAGE_SIZE, bytes(PAGE_SIZE))
+
+
+def test_backend_cache(target):
+    process, addr = target
+    process.read(addr, 3 * PAGE_SIZE)
+    assert set(process._backends.values()) == {'mem'}
+    assert len(process._backends) == 3
@@ -0,0 +1,76 @@
+
+import pytest
+
+from deedee.proc.ptrindex import PointerIndex
+
+
+numpy = pytest.importorskip('numpy')
+
+# a page holding three pointers to an object and some integers, between two
+# PROT_NONE pages for it not to be merged with another mapping
+TARGET = '''
+    import ctypes, struct, sys
+    libc = ctypes.CDLL(None)
+    libc.mmap.restype  = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    obj  = ctypes.create_string_buffer(64)
+    page = libc.mmap(None, 3 * 4096, 3, 0x22, -1, 0) + 4096
+    libc.mprotect(page - 4096, 4096, 0)
+    libc.mprotect(page + 4096, 4096, 0)
+    addr = ctypes.addressof(obj)
+    for offset, value in ((0, addr), (64, addr + 8), (4000, addr), (8, 12345), (16, 2**64 - 1)):
+        ctypes.memmove(page + offset, struct.pack('<Q', value), 8)
+    print('ready', addr, page)
+    sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def target(spawn):
+    from deedee.proc.process import Process
+    child = spawn(TARGET)
+    return Process(child.pid), int(child.ready[0]), int(child.ready[1])
+
+
+def test_build(target, tmp_path):
+    process, obj, page = target
+    path  = str(tmp_path / 'pointers.npy')
+    index = PointerIndex.build(
+        process, path, sources=lambda m: m.start_address == page, chunk_size=1000
+    )
+    assert len(index) == 3
+    assert list(index.referrers(obj)) == [page, page + 4000]
+    assert list(index.referrers(obj + 8)) == [page + 64]
+    assert len(index.referrers(obj + 16)) == 0
+    targets, sources = index.referrers_range(obj, obj + 64)
+    assert list(targets) == [obj, obj, obj + 8]
+    assert sorted(sources) == [page, page + 64, page + 4000]
+    assert list(index.count_referrers([obj, obj + 8, 12345])) == [2, 1, 0]
+    # the index can be opened again
+    assert len(PointerIndex(path)) == 3
+
+
+def test_targets(target, tmp_path):
+    process, obj, page = target
+    index = PointerIndex.build(
+        process,
+        str(tmp_path / 'pointers.npy'),
+        sources=lambda m: m.start_address == page,
+        targets=lambda m: m.start_address == page
+    )
+    assert len(index) == 0
+    assert len(index.referrers(obj)) == 0
+
+
+def test_all_writable(target, tmp_path):
+    process, obj, page = target
+    index = PointerIndex.build(process, str(tmp_path / 'pointers.npy'))
+    assert {page, page + 4000} <= set(index.referrers(obj))
+
+
+def test_not_index(tmp_path):
+    path = str(tmp_path / 'other.npy')
+    numpy.save(path, numpy.zeros(3, dtype='<u8'))
+    with pytest.raises(ValueError):
+        PointerIndex(path)
@@ -0,0 +1,46 @@
+
+import subprocess
+
+import pytest
+
+from deedee.proc.process import Process
+from deedee.proc.pystack import PyStackSampler, OFFSETS
+
+
+TARGET = '''
+    import sys, threading, time
+    def spin_inner():
+        while True:
+            time.sleep(0.001)
+    def spin_outer():
+        spin_inner()
+    threading.Thread(target=spin_outer, daemon=True).start()
+    print('ready')
+    sys.stdin.readline()
+'''
+
+
+def test_sample(spawn):
+    sampler = PyStackSampler(Process(spawn(TARGET).pid))
+    if sampler.version not in OFFSETS and sampler.version != (3, 13):
+        pytest.skip(f'unsupported CPython {sampler.version}')
+    samples = sampler.sample()
+    assert len(samples) == 2
+    names = [[f.qualname for f in s.frames] for s in samples]
+    assert ['spin_inner', 'spin_outer'] in [n[:2] for n in names]
+    assert any(n[-1] == '<module>' for n in names)
+
+
+def test_samples_count(spawn):
+    sampler = PyStackSampler(Process(spawn(TARGET).pid))
+    assert len(list(sampler.samples(rate=1000, count=5))) == 5
+
+
+def test_not_python():
+    sleep = subprocess.Popen(['sleep', '10'])
+    try:
+        with pytest.raises(RuntimeError):
+            PyStackSampler(Process(sleep.pid)).sample()
+    finally:
+        sleep.kill()
+        sleep.wait()
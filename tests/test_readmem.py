@@ -0,0 +1,111 @@
+
+import os
+
+import pytest
+
+from deedee.proc.libc            import uio
+from deedee.proc.plugins.readmem import FdPool, ProcMem, ProcMemRead
+
+
+SIZE = 64 * 1024
+
+TARGET = f'''
+    import ctypes, sys
+    buf = ctypes.create_string_buffer(bytes(range(256)) * {SIZE // 256}, {SIZE})
+    print('ready', ctypes.addressof(buf))
+    sys.stdin.readline()
+'''
+
+
+def _closed(fd):
+    try:
+        os.fstat(fd)
+    except OSError:
+        return True
+    return False
+
+
+def test_groups():
+    ranges = [(0x1010, 0x10), (0x1000, 0x10), (0x2000, 8), (0x1020, 4), (0x3000, 0)]
+    assert ProcMem._groups(ranges) == [[1, 0, 3], [2], [4]]
+
+
+def test_groups_iov_max():
+    ranges = [(0x1000 + 8 * i, 8) for i in range(2 * uio.IOV_MAX + 1)]
+    groups = ProcMem._groups(ranges)
+    assert [len(g) for g in groups] == [uio.IOV_MAX, uio.IOV_MAX, 1]
+    assert sum(groups, []) == list(range(len(ranges)))
+
+
+def test_pool_shared(child):
+    pool = FdPool()
+    fd   = pool.acquire(child.pid)
+    assert pool.acquire(child.pid) == fd
+    pool.release(fd)
+    pool.release(fd)
+    assert not _closed(fd)
+    pool.clear()
+    assert _closed(fd)
+
+
+def test_pool_invalidate_used(child):
+    # a descriptor invalidated while used is closed by its last release
+    pool = FdPool()
+    fd   = pool.acquire(child.pid)
+    pool.invalidate(child.pid)
+    assert not _closed(fd)
+    other = pool.acquire(child.pid)
+    pool.release(fd)
+    assert _closed(fd)
+    assert not _closed(other)
+    pool.release(other)
+    pool.clear()
+
+
+def test_pool_evict(spawn):
+    pool     = FdPool(maxsize=1)
+    first    = spawn('print("ready"); input()')
+    second   = spawn('print("ready"); input()')
+    fd       = pool.acquire(first.pid)
+    pool.release(fd)
+    pool.release(pool.acquire(second.pid))
+    assert _closed(fd)
+    pool.clear()
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return attach(child.pid), int(child.ready[0])
+
+
+def test_read(target):
+    process, addr = target
+    mem = ProcMem()
+    assert mem.read(process, addr + 1, 4) == bytes([1, 2, 3, 4])
+    buf = bytearray(8)
+    assert mem.readinto(process, addr + 250, memoryview(buf)[2:]) == 6
+    assert buf == bytes([0, 0, 250, 251, 252, 253, 254, 255])
+    with pytest.raises(OSError):
+        mem.read(process, 0, 8)
+
+
+def test_readv_writev(target):
+    process, addr = target
+    mem    = ProcMem()
+    # more adjacent ranges than IOV_MAX
+    ranges = [(addr + 4 * i, 4) for i in range(3000)]
+    datas  = mem.readv(process, ranges + [(0, 8)])
+    assert datas[-1] == b''
+    assert b''.join(datas) == process.read(addr, 12000)
+    chunks = [(a, bytes([i % 256]) * 4) for i, (a, _) in enumerate(ranges)]
+    assert mem.writev(process, chunks) == 12000
+    assert process.read(addr, 12000) == b''.join(data for _, data in chunks)
+
+
+def test_proc_mem_read(target):
+    process, addr = target
+    read = ProcMemRead(auto_refresh=True)
+    data = read(process, addr, 16)
+    assert type(data) is bytes
+    assert data == bytes(range(16))
@@ -0,0 +1,108 @@
+
+import ctypes
+
+import pytest
+
+from deedee.proc.libc import ptrace
+
+
+# a child with 3 more threads blocked into a sleep
+THREADS = '''
+    import sys, threading, time
+    for _ in range(3):
+        threading.Thread(target=time.sleep, args=(60,), daemon=True).start()
+    print('ready')
+    sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def threaded(spawn, attach):
+    return attach(spawn(THREADS).pid, threads=True)
+
+
+def test_prstatus(process):
+    regset = process.get_regset()
+    assert regset.type_ == ptrace.NT_PRSTATUS
+    assert regset.size == ctypes.sizeof(ptrace.UserRegsStruct)
+    assert bytes(regset.data) == bytes(process.get_regs())
+    # a given set is filled again
+    assert process.get_regset(regset=regset) is regset
+
+
+def test_set_prstatus(process):
+    regset = process.get_regset()
+    old    = regset.buffer.r12
+    regset.buffer.r12 = 0x1122334455667788
+    process.set_regset(regset)
+    assert process.get_regs().r12 == 0x1122334455667788
+    regset.buffer.r12 = old
+    process.set_regset(regset)
+    assert process.get_regs().r12 == old
+
+
+def test_fpregs(process):
+    regset = process.get_regset(ptrace.NT_PRFPREG)
+    assert regset.size == ctypes.sizeof(ptrace.UserFpregsStruct)
+    # the default mask of the SSE exceptions
+    assert regset.buffer.mxcsr & 0x1f80 == 0x1f80
+    old = list(regset.buffer.xmm_space[:4])
+    regset.buffer.xmm_space[:4] = [1, 2, 3, 4]
+    process.set_regset(regset)
+    assert list(process.get_regset(ptrace.NT_PRFPREG).buffer.xmm_space[:4]) == [1, 2, 3, 4]
+    regset.buffer.xmm_space[:4] = old
+    process.set_regset(regset)
+
+
+def test_xstate(process):
+    try:
+        regset = process.get_regset(ptrace.NT_X86_XSTATE)
+    except OSError:
+        pytest.skip('no XSAVE')
+    # the legacy area and the XSAVE header at least
+    assert 512 + 64 <= regset.size <= ptrace.XSTATE_MAX_SIZE
+    # the legacy area holds the NT_PRFPREG set
+    fpregs = process.get_regset(ptrace.NT_PRFPREG)
+    assert bytes(regset.data[24:28]) == bytes(fpregs.data[24:28])
+
+
+def test_threads_regs(threaded):
+    assert len(threaded.threads) == 4
+    regs = threaded.get_threads_regs()
+    assert len(regs) == 4
+    for tid, thread_regs in zip(threaded.threads, regs):
+        assert bytes(thread_regs) == bytes(threaded.get_regset(tid=tid).data)
+    # the array is reused while the threads do not change
+    assert threaded.get_threads_regs(regs=regs) is regs
+    fpregs = threaded.get_threads_regs(ptrace.NT_PRFPREG)
+    for tid, thread_fpregs in zip(threaded.threads, fpregs):
+        assert bytes(thread_fpregs) == bytes(threaded.get_regset(ptrace.NT_PRFPREG, tid=tid).data)
+
+
+def test_threads_xstate(threaded):
+    try:
+        size = threaded.get_regset(ptrace.NT_X86_XSTATE).size
+    except OSError:
+        pytest.skip('no XSAVE')
+    regs = threaded.get_threads_regs(ptrace.NT_X86_XSTATE)
+    assert len(regs) == 4 and ctypes.sizeof(regs[0]) == size
+
+
+def test_set_thread(threaded):
+    tid    = threaded.threads[-1]
+    regset = threaded.get_regset(tid=tid)
+    main   = threaded.get_regs().r13
+    regset.buffer.r13 = main + 1
+    threaded.set_regset(regset, tid=tid)
+    regs = dict(zip(threaded.threads, threaded.get_threads_regs()))
+    assert regs[tid].r13 == main + 1
+    assert regs[threaded.pid].r13 == main
+
+
+def test_wrong_array(threaded):
+    with pytest.raises(ValueError):
+        threaded.get_threads_regs(regs=(ptrace.UserFpregsStruct * 4)())
+    with pytest.raises(ValueError):
+        threaded.get_threads_regs(ptrace.NT_PRFPREG, regs=threaded.get_threads_regs())
+    with pytest.raises(ValueError):
+        threaded.get_threads_regs(ptrace.NT_X86_XSTATE, regs=(ctypes.c_ubyte * 8 * 4)())
@@ -0,0 +1,132 @@
+
+import ctypes
+
+import pytest
+
+from deedee.proc.remote import RemoteArray, RemoteStruct, WriteBuffer, fetch_all
+
+
+class Node(ctypes.Structure):
+    pass
+
+
+Node._fields_ = [('value', ctypes.c_int64), ('next', ctypes.POINTER(Node))]
+
+
+class Point(ctypes.Structure):
+    _fields_ = [('x', ctypes.c_int32), ('y', ctypes.c_int32)]
+
+
+class Box(ctypes.Structure):
+    _fields_ = [
+        ('tag',    ctypes.c_char * 8),
+        ('origin', Point),
+        ('corner', Point),
+        ('data',   ctypes.c_void_p)
+    ]
+
+
+TARGET = '''
+    import ctypes, sys
+    class Node(ctypes.Structure):
+        pass
+    Node._fields_ = [('value', ctypes.c_int64), ('next', ctypes.POINTER(Node))]
+    class Point(ctypes.Structure):
+        _fields_ = [('x', ctypes.c_int32), ('y', ctypes.c_int32)]
+    class Box(ctypes.Structure):
+        _fields_ = [('tag', ctypes.c_char * 8), ('origin', Point), ('corner', Point), ('data', ctypes.c_void_p)]
+    nodes = [Node(i * 10) for i in range(5)]
+    for node, next_ in zip(nodes, nodes[1:]):
+        node.next = ctypes.pointer(next_)
+    box   = Box(b'box', Point(1, 2), Point(3, 4), 0xdeadbeef)
+    array = (ctypes.c_int32 * 1000)(*range(1000))
+    print('ready', ctypes.addressof(nodes[0]), ctypes.addressof(box), ctypes.addressof(array))
+    sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return (attach(child.pid), *map(int, child.ready))
+
+
+def test_chunks():
+    buf    = bytearray(range(32))
+    writer = WriteBuffer(None)
+    writer.add(buf, 0x1000, 8, 4)
+    writer.add(buf, 0x1000, 0, 4)
+    writer.add(buf, 0x1000, 4, 2)
+    writer.add(buf, 0x1000, 20, 8)
+    assert len(writer) == 4
+    assert writer.chunks() == [(0x1000, bytes(range(6))), (0x1008, bytes(range(8, 12))), (0x1014, bytes(range(20, 28)))]
+
+
+def test_linked_list(target):
+    process, head, box, array = target
+    node   = RemoteStruct(process, Node, head)
+    values = []
+    while node is not None:
+        values.append(node.value)
+        node = node.next
+    assert values == [0, 10, 20, 30, 40]
+
+
+def test_nested(target):
+    process, head, addr, array = target
+    box = RemoteStruct(process, Box, addr)
+    assert box.tag == b'box'
+    assert (box.origin.x, box.origin.y, box.corner.x, box.corner.y) == (1, 2, 3, 4)
+    assert box.data == 0xdeadbeef
+    assert box.corner.address == addr + Box.corner.offset
+    with pytest.raises(AttributeError):
+        box.missing
+
+
+def test_write(target):
+    process, head, addr, array = target
+    box = RemoteStruct(process, Box, addr)
+    box.origin.y = 20
+    box.corner.x = 30
+    box.data     = 0
+    # nothing is written before the flush
+    assert Point.from_buffer_copy(process.read(addr + Box.origin.offset, 8)).y == 2
+    assert len(box.writer.chunks()) == 2
+    box.flush()
+    local = Box.from_buffer_copy(process.read(addr, ctypes.sizeof(Box)))
+    assert (local.origin.y, local.corner.x, local.data) == (20, 30, None)
+    with pytest.raises(TypeError):
+        box.origin = Point(0, 0)
+
+
+def test_fetch_all(target):
+    process, head, addr, array = target
+    node, box = fetch_all([RemoteStruct(process, Node, head), RemoteStruct(process, Box, addr)])
+    assert node._buf is not None and box._buf is not None
+    # the nested structures share the copy of their parent
+    origin = box.origin
+    assert fetch_all([origin])[0] is origin
+    assert (node.value, box.origin.x) == (0, 1)
+
+
+def test_array(target):
+    process, head, box, addr = target
+    array = RemoteArray(process, ctypes.c_int32, addr, 1000, batch=100)
+    assert array[999] == 999
+    assert array[-1] == 999
+    assert array[10:20:3] == [10, 13, 16, 19]
+    assert sorted(array._batches) == [0, 9]
+    array[5] = -5
+    array[6] = -6
+    array.flush()
+    assert process.read(addr + 20, 8) == (-5).to_bytes(4, 'little', signed=True) + (-6).to_bytes(4, 'little', signed=True)
+    array.clear()
+    assert list(array)[:8] == [0, 1, 2, 3, 4, -5, -6, 7]
+    with pytest.raises(IndexError):
+        array[1000]
+
+
+def test_struct_array(target):
+    process, head, box, array = target
+    nodes = RemoteStruct(process, Node, head).array(1)
+    assert nodes[0].next.value == 10
@@ -0,0 +1,82 @@
+
+import pytest
+
+from deedee.proc.remote import RemoteBuffer, PAGE_SIZE
+
+
+SIZE = 16 * PAGE_SIZE
+
+# 16 pages of pattern followed by a page without access
+TARGET = f'''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    libc.mmap.restype      = ctypes.c_void_p
+    libc.mmap.argtypes     = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    addr = libc.mmap(None, {SIZE + PAGE_SIZE}, 3, 0x22, -1, 0)
+    data = bytes(i * 7 % 251 for i in range({SIZE}))
+    ctypes.memmove(addr, data, {SIZE})
+    ctypes.memmove(addr + {SIZE - 5}, b'needle', 6)
+    libc.mprotect(addr + {SIZE}, {PAGE_SIZE}, 0)
+    print('ready', addr)
+    sys.stdin.readline()
+'''
+
+DATA = bytes(i * 7 % 251 for i in range(SIZE - 5)) + b'needle'
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return attach(child.pid), int(child.ready[0])
+
+
+def test_read(target):
+    process, addr = target
+    buf = RemoteBuffer(process, addr, addr + SIZE + 1)
+    assert len(buf) == SIZE + 1
+    assert buf[0] == 0 and buf[1] == 7 and buf[-1] == ord('e')
+    assert buf[100:5000] == DATA[100:5000]
+    assert buf[5000:100:-7] == DATA[5000:100:-7]
+    assert buf.read(SIZE - 2, 100) == b'dle'
+    assert buf.read(-10, 4) == DATA[:4]
+    assert buf.unpack_from('<H', 1) == (7 | 14 << 8,)
+    with pytest.raises(IndexError):
+        buf[SIZE + 1]
+
+
+def test_find(target):
+    process, addr = target
+    buf = RemoteBuffer(process, addr, addr + SIZE + 1, max_pages=4)
+    # the needle spans two pages and two chunks
+    assert buf.find(b'needle', chunk=PAGE_SIZE) == SIZE - 5
+    assert buf.find(b'needle', end=SIZE) == -1
+    assert len(buf._pages) <= 4
+
+
+def test_not_readable(target):
+    # the page without access is not read by process_vm_readv
+    process, addr = target
+    process.write(addr + SIZE, b'hidden')
+    buf = RemoteBuffer(process, addr + SIZE - 2, addr + SIZE + 6)
+    assert buf.tobytes() == b'dlhidden'
+    assert bytes(buf.memoryview()) == b'dlhidden'
+
+
+def test_invalidate(target):
+    process, addr = target
+    buf = RemoteBuffer(process, addr, addr + SIZE)
+    assert buf[:4] == DATA[:4]
+    process.write(addr, b'ABCD')
+    assert buf[:4] == DATA[:4]
+    buf.invalidate()
+    assert buf[:4] == b'ABCD'
+
+
+def test_unmapped(target):
+    process, addr = target
+    last = process.get_maps()[-1]
+    with pytest.raises(ValueError):
+        RemoteBuffer(process, last.end_address - 8, last.end_address + 8)
+    with pytest.raises(ValueError):
+        RemoteBuffer(process, addr + 8, addr)
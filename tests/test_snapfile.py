@@ -0,0 +1,100 @@
+
+import ctypes
+import os
+
+import pytest
+
+from deedee.proc          import snapfile
+from deedee.proc.process  import Process, ProcessVMException
+from deedee.proc.remote   import RemoteStruct
+from deedee.proc.snapfile import BLOCK_SIZE, SnapshotProcess
+
+
+SIZE = 3 * BLOCK_SIZE + 100
+
+TARGET = f'''
+    import ctypes, sys
+    data = bytes(i * 13 % 256 for i in range({SIZE}))
+    buf  = ctypes.create_string_buffer(data, {SIZE})
+    text = ctypes.create_string_buffer(b'saved string')
+    print('ready', ctypes.addressof(buf), ctypes.addressof(text))
+    sys.stdin.readline()
+'''
+
+DATA = bytes(i * 13 % 256 for i in range(SIZE))
+
+
+class Pair(ctypes.Structure):
+    _fields_ = [('first', ctypes.c_uint8), ('second', ctypes.c_uint8)]
+
+
+@pytest.fixture
+def target(spawn):
+    child = spawn(TARGET)
+    return child, int(child.ready[0]), int(child.ready[1])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(target, attach, tmp_path, compress):
+    child, addr, text = target
+    process = attach(child.pid)
+    path    = str(tmp_path / 'process.snap')
+    size    = snapfile.save(process, path, compress=compress)
+    assert os.path.getsize(path) == size
+    with SnapshotProcess(path) as offline:
+        assert offline.pid == child.pid
+        assert offline.threads == [child.pid]
+        assert offline.get_regs().rip == process.get_regs().rip
+        saved = offline.get_maps()
+        assert [m.start_address for m in saved] == [m.start_address for m in process.get_maps() if m.perms[0] == 'r']
+        # a read across the blocks of the compressed data
+        assert offline.read(addr, SIZE) == DATA
+        assert bytes(offline.read_mem_array(addr + 10, 100)) == DATA[10:110]
+        assert offline.read_mem_words(addr, 2) == DATA[:16]
+        assert offline.read_cstring(text) == b'saved string'
+        pair = RemoteStruct(offline, Pair, addr + 1)
+        assert (pair.first, pair.second) == (13, 26)
+        unmapped = saved[-1].end_address
+        assert offline.read_mem_scatter([(addr, 4), (unmapped, 4)]) == [DATA[:4], b'']
+        with pytest.raises(ProcessVMException):
+            offline.read(unmapped - 2, 4)
+        del pair
+
+
+def test_regs(target, tmp_path):
+    child, addr, text = target
+    path    = str(tmp_path / 'process.snap')
+    process = Process(child.pid)
+    # without attach, the memory is saved without registers
+    snapfile.save(process, path)
+    with SnapshotProcess(path) as offline:
+        assert offline.threads == []
+        assert offline.read(addr, 16) == DATA[:16]
+        with pytest.raises(KeyError):
+            offline.get_regs()
+    os.unlink(path)
+    with pytest.raises(RuntimeError):
+        snapfile.save(process, path, regs=True)
+    assert not os.path.exists(path)
+
+
+def test_failure(target, attach, tmp_path, monkeypatch):
+    # the file is removed when the save fails
+    child, addr, text = target
+    process = attach(child.pid)
+    path    = str(tmp_path / 'process.snap')
+
+    def fail(ranges):
+        raise ProcessVMException('read failure')
+
+    monkeypatch.setattr(process, 'read_mem_scatter', fail)
+    with pytest.raises(ProcessVMException):
+        snapfile.save(process, path)
+    assert not os.path.exists(path)
+
+
+def test_not_snapshot(tmp_path):
+    path = tmp_path / 'other'
+    path.write_bytes(b'not a snapshot file' * 10)
+    with pytest.raises(ValueError):
+        SnapshotProcess(str(path))
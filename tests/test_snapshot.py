@@ -0,0 +1,127 @@
+
+
+import pytest
+
+import deedee.proc.plugins as plugins
+
+from deedee.proc.plugins.syscall import Syscalls
+from deedee.proc.snapshot        import PAGE_SIZE, _runs, _subtract
+
+
+SIZE = 64 * 1024
+
+TARGET = f'''
+    import ctypes, mmap, sys, threading, time
+    libc = ctypes.CDLL(None)
+    libc.sbrk.restype  = ctypes.c_void_p
+    libc.sbrk.argtypes = [ctypes.c_long]
+    buf    = ctypes.create_string_buffer(b'A' * {SIZE}, {SIZE})
+    blocks = []
+    print('ready', ctypes.addressof(buf))
+    for line in sys.stdin:
+        cmd  = line.strip()
+        addr = 0
+        if cmd == 'write':
+            ctypes.memset(buf, ord('B'), {SIZE})
+        elif cmd == 'grow':
+            libc.sbrk(1 << 22)
+            ctypes.memset(libc.sbrk(0) - 4096, 1, 4096)
+        elif cmd == 'map':
+            blocks.append(mmap.mmap(-1, 1 << 20))
+            addr = ctypes.addressof(ctypes.c_char.from_buffer(blocks[-1]))
+        elif cmd == 'thread':
+            threading.Thread(target=time.sleep, args=(30,), daemon=True).start()
+        print(libc.sbrk(0), addr)
+'''
+
+
+def test_subtract():
+    assert _subtract([(0, 100), (200, 300)], [(10, 20), (50, 250)]) == [(0, 10), (20, 50), (250, 300)]
+    assert _subtract([(0, 100)], []) == [(0, 100)]
+    assert _subtract([(0, 100)], [(0, 100)]) == []
+
+
+def test_runs():
+    pages = [0x1000, 0x2000, 0x4000, 0x5000, 0x6000, 0x9000]
+    assert _runs(pages) == [[0x1000, 0x3000], [0x4000, 0x7000], [0x9000, 0xa000]]
+    assert _runs([]) == []
+
+
+class Target:
+
+    def __init__(self, child, process):
+        self.child   = child
+        self.process = process
+        self.addr    = int(child.ready[0])
+
+    def send(self, cmd):
+        '''Lets the process run the command then attaches it again.'''
+        self.process.detach()
+        result = self.child.send(cmd)
+        self.process.attach()
+        return [int(value) for value in result]
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return Target(child, attach(child.pid))
+
+
+@pytest.fixture
+def syscall():
+    return plugins.syscall.SyscallByInstrReplacement()
+
+
+def test_memory(target):
+    process  = target.process
+    snapshot = process.snapshot()
+    regs     = process.get_regs()
+    assert snapshot.size > SIZE
+    target.send('write')
+    assert process.read(target.addr, 4) == b'BBBB'
+    assert snapshot.restore() >= SIZE // PAGE_SIZE
+    assert process.read(target.addr, SIZE) == b'A' * SIZE
+    assert process.get_regs().rip == regs.rip
+    # restored twice
+    target.send('write')
+    snapshot.restore()
+    assert process.read(target.addr, 4) == b'AAAA'
+
+
+def test_brk(target, syscall):
+    process  = target.process
+    snapshot = process.snapshot(syscall)
+    brk      = syscall(process, Syscalls.brk, 0)
+    assert snapshot.brk == brk
+    grown, _ = target.send('grow')
+    assert grown > brk
+    snapshot.restore()
+    assert syscall(process, Syscalls.brk, 0) == brk
+    # the process can grow its heap again
+    grown, _ = target.send('grow')
+    assert process.read(grown - 4096, 4) == b'\x01' * 4
+
+
+def test_mappings(target, syscall):
+    process  = target.process
+    snapshot = process.snapshot(syscall)
+    _, addr  = target.send('map')
+    assert any(m.start_address == addr for m in process.get_maps())
+    snapshot.restore()
+    assert not any(m.start_address == addr for m in process.get_maps())
+
+
+def test_mappings_without_syscall(target):
+    snapshot = target.process.snapshot()
+    target.send('map')
+    with pytest.raises(RuntimeError):
+        snapshot.restore()
+
+
+def test_threads(target):
+    process  = target.process
+    snapshot = process.snapshot()
+    target.send('thread')
+    with pytest.raises(RuntimeError, match='threads changed'):
+        snapshot.restore()
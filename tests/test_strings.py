@@ -0,0 +1,52 @@
+
+import pytest
+
+
+PAGE_SIZE = 4096
+
+# two readable pages followed by a hole
+TARGET = f'''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    libc.mmap.restype    = ctypes.c_void_p
+    libc.mmap.argtypes   = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    base = libc.mmap(None, 3 * {PAGE_SIZE}, 3, 0x22, -1, 0)
+    libc.munmap(base + 2 * {PAGE_SIZE}, {PAGE_SIZE})
+    ctypes.memmove(base, b'hello\\x00', 6)
+    ctypes.memmove(base + 16, b'y' * 6000 + b'\\x00', 6001)
+    ctypes.memmove(base + 7000, 'a\\u0100\\u2713'.encode('utf-32-le') + bytes(4), 16)
+    ctypes.memmove(base + 2 * {PAGE_SIZE} - 4, b'tail', 4)
+    print('ready', base)
+    sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def target(spawn):
+    from deedee.proc.process import Process
+    child = spawn(TARGET)
+    return Process(child.pid), int(child.ready[0])
+
+
+def test_cstrings(target):
+    process, base = target
+    end = base + 2 * PAGE_SIZE
+    assert process.read_cstrings([base, base + 16, end - 4, end, base + 3]) == [
+        b'hello', b'y' * PAGE_SIZE, b'tail', None, b'lo'
+    ]
+    assert process.read_cstring(base + 16, max_size=100) == b'y' * 100
+    assert process.read_cstring(base + 16, max_size=8192) == b'y' * 6000
+
+
+def test_wstrings(target):
+    process, base = target
+    # 'a' followed by U+0100 holds 4 NUL bytes which are not aligned
+    assert process.read_wstrings([base + 7000, base + 2 * PAGE_SIZE]) == ['aĀ✓', None]
+    assert process.read_wstring(base + 7000, max_chars=2) == 'aĀ'
+
+
+def test_empty(target):
+    process, base = target
+    assert process.read_cstrings([]) == []
+    assert process.read_cstring(base + 5) == b''
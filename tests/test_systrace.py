@@ -0,0 +1,83 @@
+
+import os
+import time
+
+import pytest
+
+import deedee.proc.plugins as plugins
+
+from deedee.proc.plugins.syscall  import Syscalls
+from deedee.proc.plugins.systrace import EventRing, SeccompTracer
+
+
+TARGET = '''
+    import os, threading
+    def loop():
+        while True:
+            os.getppid()
+    for _ in range(3):
+        threading.Thread(target=loop, daemon=True).start()
+    print('ready')
+    loop()
+'''
+
+
+def _states(pid):
+    states = {}
+    for tid in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{tid}/status') as f:
+            for line in f:
+                if line.startswith('State:'):
+                    states[int(tid)] = line.split()[1]
+    return states
+
+
+def test_ring():
+    ring = EventRing(4)
+    for i in range(6):
+        ring.push().nr = i
+    assert len(ring) == 4
+    assert ring.dropped == 2
+    assert ring.head == 6
+    assert [e.nr for e in ring.drain(3)] == [2, 3, 4]
+    ring.push().nr = 6
+    # the drained events wrap around the end of the buffer
+    assert [e.nr for e in ring.drain()] == [5, 6]
+    assert len(ring.drain()) == 0
+
+
+@pytest.fixture
+def traced(spawn, attach):
+    child   = spawn(TARGET)
+    process = attach(child.pid, threads=True)
+    tracer  = SeccompTracer(plugins.syscall.SyscallByInstrReplacement(), [Syscalls.getppid])
+    tracer.install(process)
+    return child, process, tracer
+
+
+def test_trace(traced):
+    child, process, tracer = traced
+    assert tracer(process, count=200) == 200
+    process.interrupt()
+    events = tracer.ring.drain()
+    assert len(events) >= 200
+    assert {e.syscall for e in events} == {Syscalls.getppid}
+    assert {e.tid for e in events} <= set(process.threads)
+    assert all(e.ret == os.getpid() for e in events if e.done)
+    assert sum(e.done for e in events) >= 150
+
+
+def test_detach(traced):
+    child, process, tracer = traced
+    for _ in range(10):
+        tracer(process, count=50)
+    # the filter would make the traced syscalls fail once detached
+    with pytest.raises(RuntimeError):
+        process.detach()
+    assert process.attached
+    process.detach(force=True)
+    time.sleep(0.2)
+    states = _states(child.pid)
+    assert len(states) == 4
+    assert not {s for s in states.values()} & {'T', 't'}
+    assert child.popen.poll() is None
@@ -0,0 +1,93 @@
+
+import pytest
+
+from deedee.proc.transaction import _coalesce
+
+
+PAGE_SIZE = 4096
+
+# a writable page followed by a read-only one
+TARGET = f'''
+    import ctypes, sys
+    libc = ctypes.CDLL(None)
+    libc.mmap.restype      = ctypes.c_void_p
+    libc.mmap.argtypes     = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    addr = libc.mmap(None, 2 * {PAGE_SIZE}, 3, 0x22, -1, 0)
+    ctypes.memset(addr, ord('.'), 2 * {PAGE_SIZE})
+    libc.mprotect(addr + {PAGE_SIZE}, {PAGE_SIZE}, 1)
+    print('ready', addr)
+    sys.stdin.readline()
+'''
+
+ORIGINAL = b'.' * 2 * PAGE_SIZE
+
+
+def test_coalesce():
+    writes = [
+        (0x1010, b'CCCC'),
+        (0x1000, b'AAAAAAAA'),
+        (0x1004, b'BB'),
+        (0x1008, b'DD'),
+        (0x2000, b'EE'),
+        (0x1002, b'F')
+    ]
+    # the last write of a byte wins, the adjacent writes are merged
+    assert _coalesce(writes) == [(0x1000, b'AAFABBAADD'), (0x1010, b'CCCC'), (0x2000, b'EE')]
+    assert _coalesce([]) == []
+    assert _coalesce([(0x1000, b'AB'), (0x1000, b'C')]) == [(0x1000, b'CB')]
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child = spawn(TARGET)
+    return attach(child.pid), int(child.ready[0])
+
+
+def _content(process, addr):
+    return process.read(addr, 2 * PAGE_SIZE)
+
+
+def test_commit_rollback(target):
+    process, addr = target
+    tx = process.transaction()
+    tx.write(addr, b'hello')
+    tx.write(addr + PAGE_SIZE - 2, b'spans')
+    tx.write(addr + 2, b'LL')
+    assert tx.pending == 3
+    assert _content(process, addr) == ORIGINAL
+    tx.commit()
+    assert tx.pending == 0
+    assert process.read(addr, 5) == b'heLLo'
+    assert process.read(addr + PAGE_SIZE - 2, 5) == b'spans'
+    assert tx.journal == [(addr, b'.....'), (addr + PAGE_SIZE - 2, b'.....')]
+    tx.write(addr + 1, b'0123456')
+    tx.commit()
+    assert process.read(addr, 8) == b'h0123456'
+    # the bytes written by both commits get their oldest content
+    tx.rollback()
+    assert _content(process, addr) == ORIGINAL
+    assert tx.journal == []
+
+
+def test_context(target):
+    process, addr = target
+    with process.transaction() as tx:
+        tx.write(addr, b'patch')
+        tx.commit()
+        assert process.read(addr, 5) == b'patch'
+    assert _content(process, addr) == ORIGINAL
+    with process.transaction(rollback=False) as tx:
+        tx.write(addr + PAGE_SIZE, b'kept')
+    assert process.read(addr + PAGE_SIZE, 4) == b'kept'
+
+
+def test_error(target):
+    process, addr = target
+    with pytest.raises(KeyError):
+        with process.transaction(rollback=False) as tx:
+            tx.write(addr, b'first')
+            tx.commit()
+            tx.write(addr + 8, b'pending')
+            raise KeyError()
+    assert _content(process, addr) == ORIGINAL
@@ -0,0 +1,81 @@
+
+import ctypes
+
+import pytest
+
+from deedee.proc.walk import walk
+
+
+PAGE_SIZE = 4096
+
+# a binary tree of 31 nodes (value, left, right) spread over the first and the
+# last page of a mapping followed by a hole; the last node points to the root
+TARGET = f'''
+    import ctypes, struct, sys
+    libc = ctypes.CDLL(None)
+    libc.mmap.restype    = ctypes.c_void_p
+    libc.mmap.argtypes   = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    base = libc.mmap(None, 4 * {PAGE_SIZE}, 3, 0x22, -1, 0)
+    libc.munmap(base + 3 * {PAGE_SIZE}, {PAGE_SIZE})
+    def addr(i):
+        if i % 2 == 0:
+            return base + (i // 2) * 24
+        return base + 3 * {PAGE_SIZE} - (i // 2 + 1) * 24
+    for i in range(31):
+        left  = addr(2 * i + 1) if 2 * i + 1 < 31 else 0
+        right = addr(2 * i + 2) if 2 * i + 2 < 31 else 0
+        if i == 30:
+            right = addr(0)
+        ctypes.memmove(addr(i), struct.pack('<QQQ', i, left, right), 24)
+    print('ready', addr(0))
+    sys.stdin.readline()
+'''
+
+
+class Node(ctypes.Structure):
+    _fields_ = [('value', ctypes.c_uint64), ('left', ctypes.c_void_p), ('right', ctypes.c_void_p)]
+
+
+@pytest.fixture
+def target(spawn):
+    from deedee.proc.process import Process
+    child = spawn(TARGET)
+    return Process(child.pid), int(child.ready[0])
+
+
+@pytest.mark.parametrize('readahead', [0, 32, 64, PAGE_SIZE, 1 << 20])
+def test_tree(target, readahead):
+    process, root = target
+    result = walk(process, [root], Node, ['left', 'right'], readahead=readahead, max_windows=2)
+    values = [Node.from_buffer_copy(data).value for data in result.nodes.values()]
+    # breadth-first order
+    assert values == list(range(31))
+    assert result.levels == 5
+    assert result.revisited == 1
+    assert result.unreadable == []
+    assert not result.truncated
+
+
+def test_limits(target):
+    process, root = target
+    result = walk(process, [root], Node, ['left', 'right'], max_nodes=10)
+    assert len(result.nodes) == 10
+    assert result.truncated
+    result = walk(process, [root], Node, ['left', 'right'], max_depth=1)
+    assert len(result.nodes) == 3
+    assert result.truncated
+
+
+def test_unreadable(target):
+    process, root = target
+    result = walk(process, [root, 8], 24, [8, 16])
+    assert result.unreadable == [8]
+    assert len(result.nodes) == 31
+
+
+@pytest.mark.parametrize('readahead', [-4096, 3, 4095])
+def test_readahead(target, readahead):
+    process, root = target
+    with pytest.raises(ValueError):
+        walk(process, [root], Node, ['left', 'right'], readahead=readahead)
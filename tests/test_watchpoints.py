@@ -0,0 +1,81 @@
+
+import subprocess
+import time
+
+import pytest
+
+
+def _word(process, addr):
+    # the other threads keep running: no ptrace read
+    return int.from_bytes(process.read_mem_scatter([(addr, 8)])[0], 'little')
+
+
+TARGET = '''
+    import ctypes, sys, threading, time
+    counter = ctypes.c_long(0)
+    def writer():
+        while True:
+            counter.value += 1
+            time.sleep(0.001)
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    print('ready', ctypes.addressof(counter), thread.native_id)
+    sys.stdin.readline()
+'''
+
+
+@pytest.fixture
+def target(spawn, attach):
+    child   = spawn(TARGET)
+    process = attach(child.pid, threads=True)
+    return process, int(child.ready[0]), int(child.ready[1])
+
+
+def test_write(target):
+    process, addr, writer = target
+    wp = process.watchpoints.add(addr, length=8, condition='w')
+    values = []
+    while wp.hits < 5:
+        assert process.watchpoints.cont() is wp
+        values.append(_word(process, addr))
+    assert wp.last_tid == writer
+    # data watchpoints trigger after the write
+    assert values == list(range(values[0], values[0] + 5))
+
+
+def test_invalid(target):
+    process, addr, writer = target
+    with pytest.raises(ValueError):
+        process.watchpoints.add(addr, length=3)
+    with pytest.raises(ValueError):
+        process.watchpoints.add(addr + 1, length=8)
+    with pytest.raises(ValueError):
+        process.watchpoints.add(addr, length=8, condition='x')
+    for i in range(4):
+        process.watchpoints.add(addr + 8 * i)
+    with pytest.raises(ValueError):
+        process.watchpoints.add(addr + 32)
+
+
+def test_remove(target):
+    process, addr, writer = target
+    wp = process.watchpoints.add(addr)
+    process.watchpoints.cont()
+    process.watchpoints.remove(wp)
+    assert list(process.watchpoints) == []
+    before = _word(process, addr)
+    process.detach()
+    time.sleep(0.05)
+    process.attach()
+    assert _word(process, addr) > before
+
+
+def test_foreign_child(target):
+    # the exit status of a child not traced must not be consumed
+    process, addr, writer = target
+    other = subprocess.Popen(['sh', '-c', 'sleep 0.1; exit 7'])
+    wp    = process.watchpoints.add(addr)
+    end   = time.monotonic() + 0.4
+    while time.monotonic() < end:
+        assert process.watchpoints.cont() is wp
+    assert other.wait() == 7